@@ -1,13 +1,21 @@
+import asyncio
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
 from mangum import Mangum
-import os
+
+from .lifespan import JOB_HANDLERS, lifespan
 
 # Import the routers
 from .routers import gmail, podcast, user
+from .services import metrics, rate_limit
+from .services.audio_cache import audio_cache
+from .services.google_executor import google_executor
+from .services.worker import run_jobs_inline
 
-app = FastAPI(title="AudioBrew API")
+app = FastAPI(title="AudioBrew API", lifespan=lifespan)
 
 # Add CORS middleware - Updated for Railway production
 app.add_middleware(
@@ -43,7 +51,26 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "audiobrew-api"}
+    return {
+        "status": "healthy",
+        "service": "audiobrew-api",
+        "google_api_executor": google_executor.stats(),
+        "tts_cache": audio_cache.stats(),
+        "rate_limits": rate_limit.stats()
+    }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus metrics for this process: stage and outbound call latencies,
+    jobs, caches and rate limits.
+    """
+    content = await asyncio.to_thread(metrics.render)
+    return Response(content=content, media_type=metrics.CONTENT_TYPE)
 
-# Create the handler for Vercel (keep for compatibility)
-handler = Mangum(app, lifespan="off") 
\ No newline at end of file
+# Create the handler for Vercel (keep for compatibility).
+# The lifespan does not run there and no worker survives between requests, so
+# queued jobs run inside the request that queued them. Job state lives in the
+# function instance's temp directory, so the response carries the finished job.
+run_jobs_inline(JOB_HANDLERS)
+handler = Mangum(app, lifespan="off")
@@ -0,0 +1,30 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from .routers import podcast, user
+from .services import supabase_client
+from .services.cache import drop_namespace
+from .services.email_content import shutdown_pool
+from .services.gmail_api import load_discovery_documents
+from .services.worker import start_workers, stop_workers
+
+# Job kinds handled by the worker pool
+JOB_HANDLERS = {
+    "podcast": podcast.run_podcast_job,
+    "account_deletion": user.run_account_deletion_job,
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start shared resources with the app and release them on shutdown."""
+    load_discovery_documents()
+    # Gmail credentials used to be cacheable in the local database; remove any left there
+    await asyncio.to_thread(drop_namespace, "gmail_credentials")
+    await supabase_client.open_client()
+    start_workers(JOB_HANDLERS)
+    yield
+    await asyncio.to_thread(stop_workers)
+    await supabase_client.close_client()
+    shutdown_pool()
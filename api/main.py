@@ -1,9 +1,11 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-import sys
+import asyncio
 import os
+import sys
 from pathlib import Path
-from fastapi.responses import RedirectResponse
+
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import RedirectResponse, Response
 
 # Add the parent directory to the Python path
 current_file = Path(__file__).resolve()
@@ -11,9 +13,13 @@ parent_directory = current_file.parent.parent
 sys.path.append(str(parent_directory))
 
 # Now import the routers
+from api.lifespan import lifespan
 from api.routers import gmail, podcast, user
+from api.services import metrics, rate_limit
+from api.services.audio_cache import audio_cache
+from api.services.google_executor import google_executor
 
-app = FastAPI(title="AudioBrew API")
+app = FastAPI(title="AudioBrew API", lifespan=lifespan)
 
 # Add CORS middleware - Updated for Render production
 app.add_middleware(
@@ -50,7 +56,22 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "audiobrew-api"}
+    return {
+        "status": "healthy",
+        "service": "audiobrew-api",
+        "google_api_executor": google_executor.stats(),
+        "tts_cache": audio_cache.stats(),
+        "rate_limits": rate_limit.stats()
+    }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus metrics for this process: stage and outbound call latencies,
+    jobs, caches and rate limits.
+    """
+    content = await asyncio.to_thread(metrics.render)
+    return Response(content=content, media_type=metrics.CONTENT_TYPE)
 
 # For local development and testing
 if __name__ == "__main__":
@@ -1,17 +1,23 @@
-from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
-from fastapi.responses import RedirectResponse
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
-import os
 import json
+import os
+import uuid  # Add UUID import
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import RedirectResponse
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-import httpx
-from dotenv import load_dotenv
-from datetime import datetime
-import uuid  # Add UUID import
+from pydantic import BaseModel
+
+from ..services import mail_sync, supabase_client
+from ..services.cache import AsyncCache
+from ..services.gmail_api import gmail_service, oauth2_service
+from ..services.google_executor import GoogleApiTimeout, run_google
+from ..services.mail_sync import sync_label
 
 load_dotenv()
 
@@ -24,6 +30,17 @@ REDIRECT_URI = os.getenv("REDIRECT_URI", "https://audiobrew.vercel.app/api/auth/
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
+# Credentials cache: in-process LRU only. Entries hold refresh tokens and the
+# client secret, so they are never written to the shared local database.
+CREDENTIALS_CACHE_TTL = float(os.getenv("CREDENTIALS_CACHE_TTL", "300"))
+CREDENTIALS_CACHE_SIZE = int(os.getenv("CREDENTIALS_CACHE_SIZE", "1024"))
+
+credentials_cache = AsyncCache(
+    "gmail_credentials",
+    ttl=CREDENTIALS_CACHE_TTL,
+    max_entries=CREDENTIALS_CACHE_SIZE,
+)
+
 # Scopes required for Gmail API
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
@@ -80,80 +97,37 @@ async def save_credentials_to_supabase(user_id: str, credentials: Dict[str, Any]
         print(f"User ID is not a valid UUID: {user_id}")
         raise HTTPException(status_code=400, detail="Invalid user ID format. Must be a valid UUID.")
     
-    async with httpx.AsyncClient() as client:
-        try:
-            # First check if the record already exists
-            check_response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/gmail_connections",
-                headers={
-                    "apikey": SUPABASE_SERVICE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                    "Content-Type": "application/json"
-                },
-                params={"user_id": f"eq.{user_uuid}", "select": "id"}
+    try:
+        # A single upsert on the unique user_id creates or updates the connection row
+        response = await supabase_client.upsert(
+            "gmail_connections",
+            {
+                "user_id": user_uuid,  # Use the validated UUID
+                "credentials": credentials_to_save,
+                "email": credentials_to_save.get("email", "")
+            },
+            on_conflict="user_id"
+        )
+        print(f"Upsert response status: {response.status_code}")
+        
+        if response.status_code >= 400:
+            print(f"Failed to save: {response.status_code} {response.text}")
+            raise HTTPException(
+                status_code=500, detail=f"Failed to save Gmail credentials: {response.text}"
             )
+        
+        await credentials_cache.invalidate(user_uuid)
             
-            print(f"Check response status: {check_response.status_code}")
-            print(f"Check response content: {check_response.text}")
-            
-            record_exists = check_response.status_code == 200 and check_response.json()
-            
-            if record_exists:
-                # Update existing record
-                print(f"Record exists for user {user_id}, updating...")
-                update_response = await client.patch(
-                    f"{SUPABASE_URL}/rest/v1/gmail_connections",
-                    headers={
-                        "apikey": SUPABASE_SERVICE_KEY,
-                        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=minimal"
-                    },
-                    params={"user_id": f"eq.{user_uuid}"},
-                    json={
-                        "credentials": credentials_to_save,
-                        "email": credentials_to_save.get("email", ""),
-                        "updated_at": "now()"
-                    }
-                )
-                print(f"PATCH response status: {update_response.status_code}")
-                print(f"PATCH response content: {update_response.text}")
-                
-                if update_response.status_code >= 400:
-                    print(f"Failed to update: {update_response.status_code} {update_response.text}")
-                    raise HTTPException(status_code=500, detail=f"Failed to update Gmail credentials: {update_response.text}")
-            else:
-                # Insert new record
-                print(f"No record exists for user {user_id}, creating new...")
-                
-                # User UUID is already validated above
-                insert_response = await client.post(
-                    f"{SUPABASE_URL}/rest/v1/gmail_connections",
-                    headers={
-                        "apikey": SUPABASE_SERVICE_KEY,
-                        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=minimal"
-                    },
-                    json={
-                        "user_id": user_uuid,  # Use the validated UUID
-                        "credentials": credentials_to_save,
-                        "email": credentials_to_save.get("email", "")
-                    }
-                )
-                print(f"POST response status: {insert_response.status_code}")
-                print(f"POST response content: {insert_response.text}")
-                
-                if insert_response.status_code >= 400:
-                    print(f"Failed to insert: {insert_response.status_code} {insert_response.text}")
-                    raise HTTPException(status_code=500, detail=f"Failed to insert Gmail credentials: {insert_response.text}")
-                
-        except httpx.RequestError as e:
-            print(f"Request error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Network error when saving credentials: {str(e)}")
-        except Exception as e:
-            print(f"Unexpected error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    except httpx.RequestError as e:
+        print(f"Request error: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Network error when saving credentials: {str(e)}"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 async def get_credentials_from_supabase(user_id: str) -> Optional[Dict[str, Any]]:
     """Retrieve Gmail credentials from Supabase for a specific user."""
@@ -168,24 +142,52 @@ async def get_credentials_from_supabase(user_id: str) -> Optional[Dict[str, Any]
         print(f"User ID is not a valid UUID: {user_id}")
         return None
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/gmail_connections",
-            headers={
-                "apikey": SUPABASE_SERVICE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            },
-            params={"user_id": f"eq.{user_uuid}", "select": "credentials,email"}
+    async def load():
+        response = await supabase_client.select(
+            "gmail_connections",
+            {"user_id": f"eq.{user_uuid}", "select": "credentials,email,audiobrew_label_id"}
         )
         
         print(f"GET response status: {response.status_code}")
-        print(f"GET response content: {response.text}")
         
         if response.status_code == 200 and response.json():
             print(f"Found credentials for user {user_id}")
             return response.json()[0]
         print(f"No credentials found for user {user_id}")
         return None
+    
+    # Only connected users are cached, so a new connection shows up right away
+    return await credentials_cache.get_or_load(user_uuid, load)
+
+def find_audiobrew_label(labels: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return next((label for label in labels if label["name"].lower() == "audiobrew"), None)
+
+async def save_audiobrew_label_id(user_uuid: str, label_id: Optional[str]):
+    """Store the resolved AudioBrew label id with the user's Gmail connection."""
+    response = await supabase_client.update(
+        "gmail_connections",
+        {"user_id": f"eq.{user_uuid}"},
+        {"audiobrew_label_id": label_id}
+    )
+    if response.status_code >= 400:
+        # Not fatal: the label will simply be looked up again next time
+        print(f"Failed to save AudioBrew label id: {response.status_code} {response.text}")
+    await credentials_cache.invalidate(user_uuid)
+
+async def scan_for_audiobrew_label(service, user_uuid: str, stored_label_id: Optional[str]):
+    """List all labels, find the AudioBrew one and remember its id if it changed."""
+    results = await run_google(service.users().labels().list(userId="me").execute)
+    labels = results.get("labels", [])
+    audiobrew_label = find_audiobrew_label(labels)
+    
+    label_id = audiobrew_label["id"] if audiobrew_label else None
+    if label_id != stored_label_id:
+        await save_audiobrew_label_id(user_uuid, label_id)
+    
+    return audiobrew_label, labels
+
+def is_not_found(error: HttpError) -> bool:
+    return error.resp is not None and error.resp.status == 404
 
 @router.get("/auth")
 async def gmail_auth(user_id: str):
@@ -224,7 +226,7 @@ async def gmail_callback(request: Request, code: str, state: str):
         flow = create_flow()
         try:
             print(f"Fetching token with code...")
-            flow.fetch_token(code=code)
+            await run_google(flow.fetch_token, code=code)
         except Exception as token_error:
             error_msg = f"Failed to fetch OAuth token: {str(token_error)}"
             print(error_msg)
@@ -236,10 +238,10 @@ async def gmail_callback(request: Request, code: str, state: str):
         # Get user email from Google API
         try:
             print("Building OAuth service...")
-            service = build("oauth2", "v2", credentials=credentials)
+            service = oauth2_service(credentials)
             
             print("Getting user info...")
-            user_info = service.userinfo().get().execute()
+            user_info = await run_google(service.userinfo().get().execute)
             
             email = user_info.get("email", "")
             print(f"Got user email: {email}")
@@ -312,28 +314,25 @@ async def disconnect_gmail(user_id: str):
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid user ID format. Must be a valid UUID.")
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.delete(
-                f"{SUPABASE_URL}/rest/v1/gmail_connections",
-                headers={
-                    "apikey": SUPABASE_SERVICE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                },
-                params={"user_id": f"eq.{user_uuid}"}
-            )
+    try:
+        response = await supabase_client.delete("gmail_connections", {"user_id": f"eq.{user_uuid}"})
+        await credentials_cache.invalidate(user_uuid)
+        await mail_sync.forget_user(user_uuid)
+        
+        if response.status_code >= 400:
+            print(f"Error disconnecting Gmail: {response.status_code} {response.text}")
+            raise HTTPException(status_code=500, detail="Failed to disconnect Gmail integration")
             
-            if response.status_code >= 400:
-                print(f"Error disconnecting Gmail: {response.status_code} {response.text}")
-                raise HTTPException(status_code=500, detail="Failed to disconnect Gmail integration")
-                
-            return {"success": True, "message": "Gmail disconnected successfully"}
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
+        return {"success": True, "message": "Gmail disconnected successfully"}
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
 
 @router.get("/labels")
-async def get_labels(user_id: str):
-    """Get all Gmail labels for a user, with special focus on finding the AudioBrew label."""
+async def get_labels(user_id: str, include_all: bool = False):
+    """
+    Find the user's AudioBrew label.
+    Once its id is known only that label is fetched; pass include_all to list every label.
+    """
     print(f"Getting Gmail labels for user {user_id}")
     
     if not user_id:
@@ -357,14 +356,28 @@ async def get_labels(user_id: str):
         )
         
         # Build Gmail service
-        service = build("gmail", "v1", credentials=credentials)
+        service = gmail_service(credentials)
+        
+        user_uuid = str(uuid.UUID(user_id))
+        stored_label_id = credentials_data.get("audiobrew_label_id")
+        audiobrew_label = None
         
-        # Get all labels
-        results = service.users().labels().list(userId="me").execute()
-        labels = results.get("labels", [])
+        # Fetch the remembered label directly; fall back to a full scan if it is gone
+        if stored_label_id and not include_all:
+            try:
+                audiobrew_label = await run_google(
+                    service.users().labels().get(userId="me", id=stored_label_id).execute
+                )
+                labels = [audiobrew_label]
+            except HttpError as error:
+                if not is_not_found(error):
+                    raise
+                print(f"Stored AudioBrew label {stored_label_id} no longer exists, rescanning")
         
-        # Check if AudioBrew label exists
-        audiobrew_label = next((label for label in labels if label["name"].lower() == "audiobrew"), None)
+        if audiobrew_label is None:
+            audiobrew_label, labels = await scan_for_audiobrew_label(
+                service, user_uuid, stored_label_id
+            )
         
         return {
             "labels": labels,
@@ -375,6 +388,9 @@ async def get_labels(user_id: str):
     except HttpError as error:
         print(f"Gmail API error: {error}")
         raise HTTPException(status_code=500, detail=f"Gmail API error: {str(error)}")
+    except GoogleApiTimeout as error:
+        print(f"Gmail API timeout: {error}")
+        raise HTTPException(status_code=504, detail=str(error))
     except Exception as e:
         print(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
@@ -405,13 +421,35 @@ async def get_emails(user_id: str, label_id: str = None):
         )
         
         # Build Gmail service
-        service = build("gmail", "v1", credentials=credentials)
+        service = gmail_service(credentials)
+        
+        user_uuid = str(uuid.UUID(user_id))
+        stored_label_id = credentials_data.get("audiobrew_label_id")
         
-        # If no label_id provided, try to find the AudioBrew label
+        page_size = 10
+        
+        async def sync(label: str):
+            result = await run_google(sync_label, service, user_uuid, label, page_size)
+            print(f"Synced label {label} for user {user_id}: {result}")
+            if result["backfill"]:
+                mail_sync.start_backfill(service, user_uuid, label)
+        
+        # If no label_id provided, use the remembered AudioBrew label
+        synced = False
+        if not label_id and stored_label_id:
+            label_id = stored_label_id
+            try:
+                await sync(label_id)
+                synced = True
+            except HttpError as error:
+                if not is_not_found(error):
+                    raise
+                print(f"Stored AudioBrew label {stored_label_id} no longer exists, rescanning")
+                label_id = None
+        
+        # Otherwise find the AudioBrew label by scanning all labels
         if not label_id:
-            results = service.users().labels().list(userId="me").execute()
-            labels = results.get("labels", [])
-            audiobrew_label = next((label for label in labels if label["name"].lower() == "audiobrew"), None)
+            audiobrew_label, _ = await scan_for_audiobrew_label(service, user_uuid, stored_label_id)
             
             if not audiobrew_label:
                 return {
@@ -421,36 +459,11 @@ async def get_emails(user_id: str, label_id: str = None):
             
             label_id = audiobrew_label["id"]
         
-        # Get emails from the specified label
-        results = service.users().messages().list(
-            userId="me", 
-            labelIds=[label_id],
-            maxResults=10  # Limit to 10 emails for now
-        ).execute()
+        # Apply new mail since the last sync, then read the listing from the local store
+        if not synced:
+            await sync(label_id)
         
-        messages = results.get("messages", [])
-        emails = []
-        
-        # Get details for each email
-        for message in messages:
-            msg = service.users().messages().get(userId="me", id=message["id"]).execute()
-            
-            # Extract headers
-            headers = msg["payload"]["headers"]
-            subject = next((header["value"] for header in headers if header["name"].lower() == "subject"), "No Subject")
-            from_email = next((header["value"] for header in headers if header["name"].lower() == "from"), "Unknown Sender")
-            date = next((header["value"] for header in headers if header["name"].lower() == "date"), "Unknown Date")
-            
-            # Extract snippet
-            snippet = msg.get("snippet", "")
-            
-            emails.append({
-                "id": msg["id"],
-                "subject": subject,
-                "from": from_email,
-                "date": date,
-                "snippet": snippet
-            })
+        emails = await mail_sync.list_messages(user_uuid, label_id, limit=page_size)
         
         return {
             "label_id": label_id,
@@ -461,6 +474,9 @@ async def get_emails(user_id: str, label_id: str = None):
     except HttpError as error:
         print(f"Gmail API error: {error}")
         raise HTTPException(status_code=500, detail=f"Gmail API error: {str(error)}")
+    except GoogleApiTimeout as error:
+        print(f"Gmail API timeout: {error}")
+        raise HTTPException(status_code=504, detail=str(error))
     except Exception as e:
         print(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
\ No newline at end of file
@@ -1,16 +1,33 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-import uuid
-import httpx
+import asyncio
+import base64
+import hashlib
+import json
+import math
 import os
+import time
+import traceback
+import uuid
 from datetime import datetime
-import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import openai
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-import traceback
+from googleapiclient.errors import HttpError
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+from ..services import checkpoints, db, jobs, metrics, profiles, supabase_client, tts, versions
+from ..services.cache import AsyncCache
+from ..services.email_content import extract_texts
+from ..services.events import job_events
+from ..services.gmail_api import batch_get_messages, gmail_service, message_summary
+from ..services.google_executor import run_google
+from ..services.rate_limit import gmail_quota, limiter, retry_delay, with_backoff
+from ..services.tokens import count_tokens, truncate_to_tokens
+from ..services.worker import dispatch
 
 # Import the Gmail router functions to reuse email fetching
 from .gmail import get_credentials_from_supabase
@@ -20,19 +37,84 @@ load_dotenv()
 router = APIRouter(prefix="/podcast", tags=["podcast"])
 
 # Environment variables
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 
-# Configure OpenAI client
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# How often an idle job event stream re-checks the job table and sends a keep-alive
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+# Scripts are synthesized in chunks, so their length is set by the episode we want,
+# not by the TTS request limit (~800 characters per spoken minute)
+SCRIPT_TARGET_CHARS = int(os.getenv("SCRIPT_TARGET_CHARS", "12000"))
+SCRIPT_MAX_TOKENS = int(os.getenv("SCRIPT_MAX_TOKENS", "4096"))
+
+# "streaming" feeds the script into TTS while GPT-4o is still writing it;
+# "sequential" waits for the whole script first
+PODCAST_PIPELINE_MODE = os.getenv("PODCAST_PIPELINE_MODE", "streaming")
+
+# Newsletter text up to this many tokens goes to GPT-4o in one call; larger batches are first
+# summarized one newsletter at a time (map) and the script is written from the summaries (reduce)
+SCRIPT_DIRECT_MAX_TOKENS = int(os.getenv("SCRIPT_DIRECT_MAX_TOKENS", "12000"))
+# Upper bound on the newsletter text sent to the final script call. It is lowered further
+# when the prompt plus SCRIPT_MAX_TOKENS would not fit in the gpt-4o tokens-per-minute limit,
+# since a bigger request would wait for a full bucket on every call
+SCRIPT_INPUT_TOKEN_BUDGET = int(os.getenv("SCRIPT_INPUT_TOKEN_BUDGET", "20000"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_INPUT_MAX_TOKENS = int(os.getenv("SUMMARY_INPUT_MAX_TOKENS", "8000"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "700"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "5"))
+
+# Bump these when a prompt changes so cached scripts and summaries are not reused
+SCRIPT_PROMPT_VERSION = "1"
+SUMMARY_PROMPT_VERSION = "1"
+# Generated scripts and per-newsletter summaries, reused when the same emails come back
+SCRIPT_CACHE_TTL = int(os.getenv("SCRIPT_CACHE_TTL", str(7 * 24 * 3600)))
+SCRIPT_CACHE_SIZE = int(os.getenv("SCRIPT_CACHE_SIZE", "1000"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "10000"))
+
+# Podcast listing page sizes; the script is only sent when asked for
+LIST_DEFAULT_LIMIT = int(os.getenv("PODCAST_LIST_DEFAULT_LIMIT", "20"))
+LIST_MAX_LIMIT = int(os.getenv("PODCAST_LIST_MAX_LIMIT", "100"))
+LIST_COLUMNS = "id,title,audio_url,duration,source_emails,created_at"
+# How many of the latest podcasts the profile summary covers by default, and at most
+PROFILE_SUMMARY_DEFAULT_LIMIT = int(os.getenv("PROFILE_SUMMARY_DEFAULT_LIMIT", "50"))
+PROFILE_SUMMARY_MAX_LIMIT = int(os.getenv("PROFILE_SUMMARY_MAX_LIMIT", "500"))
+# Serialized list/detail responses, valid for as long as the user's podcasts version is unchanged
+PODCAST_RESPONSE_CACHE_TTL = int(os.getenv("PODCAST_RESPONSE_CACHE_TTL", "300"))
+PODCAST_RESPONSE_CACHE_SIZE = int(os.getenv("PODCAST_RESPONSE_CACHE_SIZE", "1000"))
+
+# Full newsletters are large, so they are fetched and parsed a few at a time
+EMAIL_FETCH_BATCH_SIZE = int(os.getenv("EMAIL_FETCH_BATCH_SIZE", "10"))
+
+# Extra attempts per generation stage within one run of a job. Provider calls are
+# already retried with backoff, so these cover the rest: uploads, Supabase writes, bad audio.
+STAGE_RETRIES = {
+    "fetch": int(os.getenv("FETCH_STAGE_RETRIES", "2")),
+    "script": int(os.getenv("SCRIPT_STAGE_RETRIES", "1")),
+    "audio": int(os.getenv("AUDIO_STAGE_RETRIES", "2")),
+    "save": int(os.getenv("SAVE_STAGE_RETRIES", "3")),
+}
+
+T = TypeVar("T")
+
+# Configure OpenAI client; retries go through rate_limit.with_backoff instead
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+
+# Shared through the local database so the web and worker processes see the same entries
+script_cache = AsyncCache("podcast_scripts", SCRIPT_CACHE_TTL, SCRIPT_CACHE_SIZE, backend="sqlite")
+summary_cache = AsyncCache(
+    "newsletter_summaries", SCRIPT_CACHE_TTL, SUMMARY_CACHE_SIZE, backend="sqlite"
+)
+response_cache = AsyncCache(
+    "podcast_responses", PODCAST_RESPONSE_CACHE_TTL, PODCAST_RESPONSE_CACHE_SIZE
+)
 
 class PodcastRequest(BaseModel):
     user_id: str
     email_ids: List[str]
     title: Optional[str] = None
+    force_regenerate: bool = False
 
 class PodcastResponse(BaseModel):
     id: str
@@ -47,25 +129,127 @@ async def process_emails_to_text(emails: List[Dict[str, Any]]) -> str:
         subject = email.get("subject", "No Subject")
         sender = email.get("from", "Unknown Sender").split('<')[0].strip()
         date = email.get("date", "Unknown Date")
-        snippet = email.get("snippet", "")
+        # Fall back to Gmail's snippet when no text body could be extracted
+        content = email.get("body") or email.get("snippet", "")
         
         # Format the email content
         email_text = f"Email from {sender} on {date}\n"
         email_text += f"Subject: {subject}\n\n"
-        email_text += f"{snippet}\n\n"
+        email_text += f"{content}\n\n"
         email_text += "--------------------\n\n"
         
         combined_text += email_text
     
     return combined_text
 
-async def generate_script_with_gpt4(emails_text: str) -> Dict[str, Any]:
+def email_digest(email: Dict[str, Any]) -> str:
+    """Stable hash of the parts of an email that end up in the prompt."""
+    digest = hashlib.sha256()
+    for field in (
+        email.get("subject", ""),
+        email.get("from", ""),
+        email.get("date", ""),
+        email.get("body") or email.get("snippet", ""),
+    ):
+        digest.update(field.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def script_cache_key(emails: List[Dict[str, Any]]) -> str:
+    """Cache key for the script written from a set of emails, independent of their order."""
+    parts = [SCRIPT_PROMPT_VERSION, "gpt-4o", str(SCRIPT_TARGET_CHARS)]
+    parts += sorted(f"{email['id']}:{email_digest(email)}" for email in emails)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+async def summarize_newsletter(email: Dict[str, Any], user_id: Optional[str] = None) -> str:
+    """Condense one newsletter into the facts a podcast script needs (map step)."""
+    content = email.get("body") or email.get("snippet", "")
+    content = truncate_to_tokens(content, SUMMARY_INPUT_MAX_TOKENS, SUMMARY_MODEL)
+    
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You condense newsletters into notes for a podcast script writer. Keep every key "
+                "insight, statistic and notable quote with its context. Output plain text only."
+            ),
+        },
+        {"role": "user", "content": f"Subject: {email.get('subject', 'No Subject')}\n\n{content}"}
+    ]
+    
+    loaded = False
+    
+    async def load() -> str:
+        nonlocal loaded
+        loaded = True
+        response = await with_backoff(
+            lambda: openai_client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=SUMMARY_MAX_TOKENS
+            ),
+            limiter("openai", SUMMARY_MODEL),
+            request_tokens(messages, SUMMARY_MAX_TOKENS, SUMMARY_MODEL),
+            endpoint="chat.completions",
+        )
+        metrics.record_usage(SUMMARY_MODEL, response.usage)
+        return response.choices[0].message.content
+    
+    key = f"{SUMMARY_PROMPT_VERSION}:{SUMMARY_MODEL}:{email_digest(email)}"
+    try:
+        summary = await summary_cache.get_or_load(key, load, owner=user_id)
+        profiles.count_in("cache", "summary_misses" if loaded else "summary_hits")
+        return summary
+    except Exception as e:
+        # Keep the job going with the start of the newsletter itself
+        print(f"Error summarizing email {email.get('id')}: {str(e)}")
+        return truncate_to_tokens(content, SUMMARY_MAX_TOKENS, SUMMARY_MODEL)
+
+def script_input_budget() -> int:
+    """Tokens of newsletter text one script request may carry."""
+    bucket = limiter("openai", "gpt-4o").tokens
+    if bucket is None:
+        return SCRIPT_INPUT_TOKEN_BUDGET
+    overhead = request_tokens(build_script_messages(""), SCRIPT_MAX_TOKENS)
+    return max(1, min(SCRIPT_INPUT_TOKEN_BUDGET, int(bucket.capacity) - overhead))
+
+async def prepare_script_source(emails: List[Dict[str, Any]], user_id: Optional[str] = None) -> str:
     """
-    Generate a podcast script using OpenAI's GPT-4o model.
+    Newsletter text for the script prompt, kept within script_input_budget().
+
+    Small batches are used as they are. Larger ones are summarized per
+    newsletter concurrently, so latency follows the slowest newsletter
+    rather than the total length, and the summaries are what the script
+    is written from.
     """
-    try:
-        # Create the prompt for GPT-4o
-        prompt = f"""
+    emails_text = await process_emails_to_text(emails)
+    total_tokens = count_tokens(emails_text)
+    if total_tokens <= SCRIPT_DIRECT_MAX_TOKENS:
+        return emails_text
+    
+    print(f"Newsletter text is {total_tokens} tokens, summarizing {len(emails)} emails first")
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    
+    async def summarize(email: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return {**email, "body": await summarize_newsletter(email, user_id)}
+    
+    summarized = await asyncio.gather(*(summarize(email) for email in emails))
+    
+    # Share the budget evenly when even the summaries are too long together
+    budget = script_input_budget()
+    if count_tokens(await process_emails_to_text(summarized)) > budget:
+        per_email = budget // max(len(summarized), 1)
+        summarized = [
+            {**email, "body": truncate_to_tokens(email["body"], per_email)} for email in summarized
+        ]
+    return await process_emails_to_text(summarized)
+
+def build_script_messages(emails_text: str) -> List[Dict[str, str]]:
+    """Chat messages asking GPT-4o for a podcast script over the given newsletter text."""
+    # Create the prompt for GPT-4o
+    prompt = f"""
 You are a podcast host. Create a comprehensive, in-depth script based on the following newsletter content:
 
 {emails_text}
@@ -73,7 +257,7 @@ You are a podcast host. Create a comprehensive, in-depth script based on the fol
 Guidelines:
 1. Start with a very brief intro mentioning this is the AudioBrew podcast
 2. Cover ALL key insights, statistics, and quotes from EACH newsletter in detail
-3. Keep the script under 4000 characters total, but use as much of that limit as possible
+3. Aim for about {SCRIPT_TARGET_CHARS} characters total, or fewer if there is less to cover
 4. Write in a conversational tone suitable for speaking
 5. Do not include any formatting instructions, notes, or meta-commentary
 6. For each newsletter, extract and explain the most valuable insights without skipping any important context
@@ -81,252 +265,473 @@ Guidelines:
 
 Return ONLY the script text that should be read aloud, with no additional formatting or instructions.
 """
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are an expert podcast script writer. Your output should be ONLY the script "
+                "text with no additional comments or instructions. Make sure to cover all key "
+                "insights from each newsletter in detail. Aim for about "
+                f"{SCRIPT_TARGET_CHARS} characters of content, or less when there is no more "
+                "content to cover."
+            ),
+        },
+        {"role": "user", "content": prompt}
+    ]
+
+def request_tokens(messages: List[Dict[str, str]], max_tokens: int, model: str = "gpt-4o") -> int:
+    """Tokens a chat request counts against the tokens-per-minute limit: prompt plus max_tokens."""
+    return sum(count_tokens(message["content"], model) for message in messages) + max_tokens
+
+def describe_script(script_markdown: str) -> Dict[str, Any]:
+    """Script text plus its word count and approximate spoken duration."""
+    # Calculate approximate duration (130-160 words per minute)
+    word_count = len(script_markdown.split())
+    approx_duration_sec = int((word_count / 145) * 60)  # Using average of 145 wpm
+    
+    return {
+        "script_markdown": script_markdown,
+        "approx_duration_sec": approx_duration_sec,
+        "word_count": word_count
+    }
 
+async def generate_script_with_gpt4(emails_text: str) -> Dict[str, Any]:
+    """
+    Generate a podcast script using OpenAI's GPT-4o model.
+    """
+    try:
         # Call the OpenAI API
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert podcast script writer. Your output should be ONLY the script text with no additional comments or instructions. Make sure to cover all key insights from each newsletter in detail. Aim for 3800-4000 characters of content, or less when there is no more content to cover."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
+        messages = build_script_messages(emails_text)
+        response = await with_backoff(
+            lambda: openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=SCRIPT_MAX_TOKENS
+            ),
+            limiter("openai", "gpt-4o"),
+            request_tokens(messages, SCRIPT_MAX_TOKENS),
+            endpoint="chat.completions",
         )
+        metrics.record_usage("gpt-4o", response.usage)
         
         # Extract the script from the response
-        script_markdown = response.choices[0].message.content
-        
-        # Calculate approximate duration (130-160 words per minute)
-        word_count = len(script_markdown.split())
-        approx_duration_sec = int((word_count / 145) * 60)  # Using average of 145 wpm
-        
-        return {
-            "script_markdown": script_markdown,
-            "approx_duration_sec": approx_duration_sec,
-            "word_count": word_count
-        }
+        return describe_script(response.choices[0].message.content)
         
     except Exception as e:
         print(f"Error generating script with GPT-4o: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate script: {str(e)}")
 
-async def generate_audio_from_text(text: str, user_id: str) -> str:
+async def stream_script_with_gpt4(emails_text: str, script_parts: List[str]) -> AsyncIterator[str]:
+    """
+    Generate a podcast script as a token stream, yielding text as it arrives.
+    Everything yielded is also appended to script_parts to rebuild the full script.
+    Only opening the stream is retried, since nothing has been yielded yet.
+    """
+    messages = build_script_messages(emails_text)
+    stream = await with_backoff(
+        lambda: openai_client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=SCRIPT_MAX_TOKENS,
+            stream=True,
+            # The last event then reports token usage, for the metrics
+            stream_options={"include_usage": True}
+        ),
+        limiter("openai", "gpt-4o"),
+        request_tokens(messages, SCRIPT_MAX_TOKENS),
+        endpoint="chat.completions.stream",
+    )
+    async for event in stream:
+        if event.usage:
+            metrics.record_usage("gpt-4o", event.usage)
+        if event.choices and event.choices[0].delta.content:
+            script_parts.append(event.choices[0].delta.content)
+            yield event.choices[0].delta.content
+
+async def upload_podcast_audio(
+    audio: AsyncIterator[bytes], user_id: str, podcast_id: Optional[str] = None
+) -> str:
+    """
+    Stream MP3 audio into the user's folder in the podcasts bucket and return its public URL.
+    The object is named after podcast_id, so uploading again for the same podcast replaces it.
+    """
+    filename = f"{podcast_id or uuid.uuid4()}.mp3"
+    storage_path = f"podcasts/{user_id}/{filename}"
+    
+    # Stream the synthesized audio straight into the existing 'podcasts' bucket;
+    # the upload starts as soon as the first chunk is ready
+    print(f"Generating audio with OpenAI TTS API and uploading to Supabase storage: {storage_path}")
+    upload_response = await supabase_client.storage_upload(
+        "podcasts",
+        storage_path,
+        audio,
+        content_type="audio/mpeg",  # Correct MIME type for MP3
+        upsert=True
+    )
+    
+    if upload_response.status_code >= 400:
+        print(f"Error uploading to Supabase: {upload_response.text}")
+        raise Exception(f"Failed to upload audio: {upload_response.text}")
+    
+    # Get the public URL
+    public_url = supabase_client.storage_public_url("podcasts", storage_path)
+    print(f"Audio uploaded successfully: {public_url}")
+    
+    return public_url
+
+async def generate_audio_from_text(
+    text: str,
+    user_id: str,
+    podcast_id: Optional[str] = None,
+    chunks: Optional[List[str]] = None,
+) -> str:
     """
     Generate audio from text using OpenAI's text-to-speech API.
-    For longer texts, truncates to fit within the TTS character limit.
-    Uploads the audio to Supabase storage and returns the URL.
+    Long texts are synthesized in parallel chunks (the given ones, if any) and
+    joined into one MP3, which is streamed to Supabase storage. Returns the public URL.
     """
-    try:
-        import io
-        import uuid
-        
-        # OpenAI TTS has a limit of 4096 characters
-        MAX_CHARS = 4050  # Reduced from 4090 to 4050 for a safer margin
-        
-        # Truncate text if needed
-        if len(text) > MAX_CHARS:
-            print(f"Text too long ({len(text)} chars), truncating to {MAX_CHARS} chars")
-            # Try to truncate at a sentence boundary
-            truncated_text = text[:MAX_CHARS]
-            last_period = truncated_text.rfind('.')
-            if last_period > MAX_CHARS * 0.8:  # Only truncate at sentence if we don't lose too much
-                truncated_text = truncated_text[:last_period+1]
-            text = truncated_text + "... [Text truncated due to length limits]"
-        
-        # Additional safety check to ensure we're definitely under the limit
-        if len(text) > 4096:
-            print(f"Warning: Text still too long ({len(text)} chars) after initial truncation, forcing truncation")
-            text = text[:4000] + "... [Text truncated due to length limits]"
-        
-        # Generate a unique filename
-        filename = f"{uuid.uuid4()}.mp3"
-        storage_path = f"podcasts/{user_id}/{filename}"
-        
-        # Call OpenAI's TTS API with MP3 format
-        print(f"Generating audio with OpenAI TTS API")
-        response = await openai_client.audio.speech.create(
-            model="tts-1-hd",  # Using higher quality model
-            voice="nova",  # Options: alloy, echo, fable, onyx, nova, shimmer
-            input=text,
-            response_format="mp3"  # Explicitly request MP3 format
-        )
-        
-        # Get audio content as bytes - FIX: response.read() returns bytes directly, not a coroutine
-        audio_bytes = response.read()
-        
-        # Verify we have valid audio data
-        if not audio_bytes or len(audio_bytes) < 1000:  # Arbitrary minimum size for valid audio
-            raise Exception("Received invalid or empty audio data from TTS API")
-        
-        # Upload to Supabase storage
-        print(f"Uploading audio to Supabase storage: {storage_path}")
-        
-        # Upload to Supabase storage using httpx
-        async with httpx.AsyncClient() as client:
-            # Upload the file to the existing 'podcasts' bucket
-            upload_response = await client.post(
-                f"{SUPABASE_URL}/storage/v1/object/podcasts/{storage_path}",
-                headers={
-                    "apikey": SUPABASE_SERVICE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                    "Content-Type": "audio/mpeg"  # Correct MIME type for MP3
-                },
-                content=audio_bytes,
-                timeout=60.0
-            )
-            
-            if upload_response.status_code >= 400:
-                print(f"Error uploading to Supabase: {upload_response.text}")
-                raise Exception(f"Failed to upload audio: {upload_response.text}")
-            
-            # Get the public URL
-            public_url = f"{SUPABASE_URL}/storage/v1/object/public/podcasts/{storage_path}"
-            print(f"Audio uploaded successfully: {public_url}")
-            
-            return public_url
-        
-    except Exception as e:
-        print(f"Error generating audio: {str(e)}")
-        traceback.print_exc()
-        # In case of error, return a placeholder URL
-        return f"https://example.com/audio/{uuid.uuid4()}.mp3"
-
-async def save_podcast_to_supabase(user_id: str, title: str, script_markdown: str, audio_url: str, source_emails: int, duration: int = 300) -> str:
-    """Save podcast metadata to Supabase."""
-    podcast_id = str(uuid.uuid4())
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{SUPABASE_URL}/rest/v1/podcasts",
-            headers={
-                "apikey": SUPABASE_SERVICE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                "Content-Type": "application/json",
-                "Prefer": "return=minimal"
-            },
-            json={
-                "id": podcast_id,
-                "user_id": user_id,
-                "title": title,
-                "audio_url": audio_url,
-                "script_markdown": script_markdown,  # Store the script in the podcast record
-                "duration": duration,  # in seconds
-                "source_emails": source_emails,
-                "created_at": datetime.now().isoformat()
-            }
-        )
-        
-        if response.status_code >= 400:
-            raise HTTPException(status_code=500, detail=f"Failed to save podcast: {response.text}")
+    audio = tts.synthesize_stream(openai_client, text, user_id, chunks)
+    return await upload_podcast_audio(audio, user_id, podcast_id)
+
+async def save_podcast_to_supabase(
+    user_id: str,
+    title: str,
+    script_markdown: str,
+    audio_url: str,
+    source_emails: int,
+    duration: int = 300,
+    podcast_id: Optional[str] = None,
+    profile: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Save podcast metadata, and the generation profile if given, to Supabase
+    and return the saved record.
+    The row is upserted on its id, so saving the same podcast_id twice leaves one podcast.
+    """
+    podcast = {
+        "id": podcast_id or str(uuid.uuid4()),
+        "user_id": user_id,
+        "title": title,
+        "audio_url": audio_url,
+        "script_markdown": script_markdown,  # Store the script in the podcast record
+        "duration": duration,  # in seconds
+        "source_emails": source_emails,
+        "created_at": datetime.now().isoformat()
+    }
+    if profile is not None:
+        podcast["profile"] = profile
+    
+    response = await supabase_client.upsert("podcasts", podcast, on_conflict="id")
+    
+    if response.status_code >= 400:
+        raise HTTPException(status_code=500, detail=f"Failed to save podcast: {response.text}")
     
-    return podcast_id
+    # Invalidate cached listings and ETags for this user
+    await versions.bump("podcasts", user_id)
+    
+    return podcast
 
-async def fetch_email_content(user_data: Dict[str, Any], email_ids: List[str]) -> List[Dict[str, Any]]:
+async def fetch_email_content(
+    user_data: Dict[str, Any], email_ids: List[str], user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
     """
     Fetch full email content using Gmail API.
+    With a user_id, the fetches are charged to that user's Gmail quota.
+    Emails that fail individually are skipped; if none can be fetched, this raises.
     """
-    try:
-        # Get credentials from user_data
-        credentials_dict = user_data.get("credentials", {})
-        credentials = Credentials(
-            token=credentials_dict.get("token"),
-            refresh_token=credentials_dict.get("refresh_token"),
-            token_uri=credentials_dict.get("token_uri", "https://oauth2.googleapis.com/token"),
-            client_id=GOOGLE_CLIENT_ID,
-            client_secret=GOOGLE_CLIENT_SECRET,
-            scopes=credentials_dict.get("scopes")
+    # Get credentials from user_data
+    credentials_dict = user_data.get("credentials", {})
+    credentials = Credentials(
+        token=credentials_dict.get("token"),
+        refresh_token=credentials_dict.get("refresh_token"),
+        token_uri=credentials_dict.get("token_uri", "https://oauth2.googleapis.com/token"),
+        client_id=GOOGLE_CLIENT_ID,
+        client_secret=GOOGLE_CLIENT_SECRET,
+        scopes=credentials_dict.get("scopes")
+    )
+    
+    # Build Gmail API service
+    service = gmail_service(credentials)
+    
+    # Fetch full messages in batches and turn each body into plain text in the
+    # process pool, so only one batch of raw payloads is held at a time
+    quota = gmail_quota(user_id) if user_id else None
+    emails = []
+    errors = []
+    for start in range(0, len(email_ids), EMAIL_FETCH_BATCH_SIZE):
+        chunk = email_ids[start:start + EMAIL_FETCH_BATCH_SIZE]
+        messages = await run_google(
+            batch_get_messages,
+            service,
+            chunk,
+            format="full",
+            batch_size=EMAIL_FETCH_BATCH_SIZE,
+            quota=quota,
         )
         
-        # Build Gmail API service
-        service = build("gmail", "v1", credentials=credentials)
-        
-        # Fetch emails
-        emails = []
-        for email_id in email_ids:
-            # Get the email
-            message = service.users().messages().get(userId="me", id=email_id).execute()
-            
-            # Extract headers
-            headers = message.get("payload", {}).get("headers", [])
-            subject = next((h["value"] for h in headers if h["name"].lower() == "subject"), "No Subject")
-            from_header = next((h["value"] for h in headers if h["name"].lower() == "from"), "Unknown Sender")
-            date = next((h["value"] for h in headers if h["name"].lower() == "date"), "Unknown Date")
-            
-            # Extract snippet
-            snippet = message.get("snippet", "")
-            
-            # Add to emails list
-            emails.append({
-                "id": email_id,
-                "subject": subject,
-                "from": from_header,
-                "date": date,
-                "snippet": snippet
-            })
-        
-        return emails
+        fetched = []
+        for message in messages:
+            if "error" in message:
+                print(f"Failed to fetch email {message['id']}: {message['error']}")
+                errors.append(message["error"])
+                continue
+            fetched.append(message)
         
-    except Exception as e:
-        print(f"Error fetching emails: {str(e)}")
-        # In case of error, return empty list
-        return []
+        bodies = await extract_texts([message.get("payload", {}) for message in fetched])
+        for message, body in zip(fetched, bodies):
+            email = message_summary(message)
+            email["body"] = body
+            emails.append(email)
+    
+    if not emails:
+        reason = errors[0] if errors else "no messages"
+        raise Exception(f"None of the {len(email_ids)} emails could be fetched: {reason}")
+    return emails
+
+def stage_retryable(error: Exception) -> bool:
+    """Whether a failed stage is worth running again straight away."""
+    # Provider calls have already been retried with backoff by the time they raise
+    if isinstance(error, (openai.APIError, HttpError)):
+        return False
+    if isinstance(error, HTTPException):
+        return error.status_code >= 500
+    return True
+
+async def run_stage(name: str, fn: Callable[[], Awaitable[T]]) -> T:
+    """Run one generation stage, retrying it up to STAGE_RETRIES[name] times with backoff."""
+    retries = STAGE_RETRIES[name]
+    attempt = 0
+    with metrics.span(f"podcast.{name}"):
+        while True:
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt >= retries or not stage_retryable(e):
+                    raise Exception(f"{name} stage failed: {str(e)}") from e
+                delay = retry_delay(e, attempt)
+                print(f"{name} stage failed ({str(e)}), retrying in {delay:.1f}s")
+                profiles.count_in("retries", f"stage:{name}")
+                await asyncio.sleep(delay)
+                attempt += 1
 
-async def process_podcast_generation(user_id: str, email_ids: List[str], title: str = None):
+async def process_podcast_generation(
+    user_id: str,
+    email_ids: List[str],
+    title: str = None,
+    job_id: str = None,
+    force_regenerate: bool = False,
+) -> Dict[str, Any]:
     """
-    Background task to process podcast generation.
-    This would be a long-running task in a real application.
+    Run the full podcast generation pipeline for a queued job.
+
+    When a job_id is given, the job row is moved through each stage as it runs
+    and every finished stage is checkpointed under the job: fetched emails,
+    script, uploaded audio and the saved podcast. Running the job again (a
+    retry or a requeue after a crash) resumes after the last finished stage.
+    The job id is also the podcast id, so the audio object and the podcasts
+    row are written once however often the job runs.
     """
+    done = await checkpoints.load(job_id) if job_id else {}
+    podcast_id = job_id or str(uuid.uuid4())
+    # Time, tokens, retries and cache hits of this run, added to those of earlier runs of the job
+    profile = profiles.start(done.pop("profile", None))
+    started = time.perf_counter()
+    earlier_seconds = profile["wall_seconds"]
+    if done:
+        print(f"Resuming job {job_id} after stages: {', '.join(sorted(done))}")
+        profile["resumed_from"] = sorted(done)
+    
+    def profile_snapshot() -> Dict[str, Any]:
+        profile["wall_seconds"] = round(earlier_seconds + time.perf_counter() - started, 3)
+        return profile
+
+    async def set_stage(stage: str):
+        if job_id:
+            await jobs.update_job(job_id, stage)
+
+    async def checkpoint(stage: str, data: Any):
+        done[stage] = data
+        if job_id:
+            await checkpoints.save(job_id, stage, data)
+            await checkpoints.save(job_id, "profile", profile_snapshot())
+
     try:
-        # Fetch user's Gmail credentials
-        user_data = await get_credentials_from_supabase(user_id)
-        if not user_data or "credentials" not in user_data:
-            print(f"No Gmail credentials found for user {user_id}")
-            return
-        
-        # Fetch email content
-        emails = await fetch_email_content(user_data, email_ids)
+        # Saved on an earlier run that stopped before the job was marked done
+        if "podcast" in done:
+            return {"podcast_id": done["podcast"]["id"], "podcast": done["podcast"]}
         
-        # Process emails to text
-        emails_text = await process_emails_to_text(emails)
+        # STEP 0: Fetch the emails with the user's Gmail credentials
+        if "emails" not in done:
+            await set_stage(jobs.FETCHING)
+            
+            async def fetch() -> List[Dict[str, Any]]:
+                user_data = await get_credentials_from_supabase(user_id)
+                if not user_data or "credentials" not in user_data:
+                    raise HTTPException(
+                        status_code=400, detail=f"No Gmail credentials found for user {user_id}"
+                    )
+                return await fetch_email_content(user_data, email_ids, user_id)
+            
+            await checkpoint("emails", await run_stage("fetch", fetch))
+        emails = done["emails"]
         
         # Generate a title if not provided
         if not title:
             title = f"AudioBrew Podcast - {datetime.now().strftime('%B %d, %Y')}"
         
-        # STEP 1: Generate script using GPT-4o
-        print(f"Generating script for podcast: {title}")
-        script_data = await generate_script_with_gpt4(emails_text)
+        if "audio" not in done:
+            # Reuse the script written from these exact emails unless asked for a new one
+            await set_stage(jobs.SCRIPTING)
+            script_key = script_cache_key(emails)
+            if "script" not in done and force_regenerate:
+                profiles.set_in("cache", "script", "bypassed")
+            elif "script" not in done:
+                cached_script = await script_cache.get(script_key, owner=user_id)
+                profiles.set_in("cache", "script", "hit" if cached_script is not None else "miss")
+                if cached_script is not None:
+                    print(f"Reusing cached script for podcast: {title}")
+                    await checkpoint("script", cached_script)
+            
+            audio_url = None
+            if "script" not in done:
+                # Process emails to text, summarizing them first when there is too much.
+                # Summaries are cached per newsletter, so a rerun does not redo them.
+                with metrics.span("podcast.prepare_source"):
+                    emails_text = await prepare_script_source(emails, user_id)
+                
+                if PODCAST_PIPELINE_MODE == "streaming":
+                    # STEP 1+2: Stream the script from GPT-4o and synthesize each segment as soon
+                    # as it is complete
+                    print(f"Generating script and audio for podcast: {title}")
+                    script_parts: List[str] = []
+                    
+                    async def finish_script(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+                        async for delta in deltas:
+                            yield delta
+                        # The whole script is in: keep it even if synthesis or the upload fails
+                        # later
+                        script_data = describe_script("".join(script_parts))
+                        await script_cache.set(script_key, script_data, owner=user_id)
+                        await checkpoint("script", script_data)
+                    
+                    async def announce_synthesis(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+                        emitted: List[str] = []
+                        async for chunk in chunks:
+                            if not emitted:
+                                await set_stage(jobs.SYNTHESIZING)
+                            emitted.append(chunk)
+                            yield chunk
+                        # Keep the exact chunks with the script, so redoing the audio
+                        # synthesizes the same texts and finds their segments in the TTS cache
+                        script_data = {**done["script"], "tts_chunks": emitted}
+                        await script_cache.set(script_key, script_data, owner=user_id)
+                        await checkpoint("script", script_data)
+                    
+                    script = finish_script(stream_script_with_gpt4(emails_text, script_parts))
+                    chunks = announce_synthesis(tts.split_stream(script))
+                    try:
+                        with metrics.span("podcast.stream"):
+                            audio = tts.synthesize_chunks(openai_client, chunks, user_id)
+                            audio_url = await upload_podcast_audio(audio, user_id, podcast_id)
+                    except Exception as e:
+                        if "script" not in done:
+                            raise
+                        # Redoing the audio synthesizes the recorded chunks (or, if splitting
+                        # stopped early, split_text's identical cut), so segments that were
+                        # already synthesized come from the TTS cache
+                        print(
+                            "Audio failed after the script was complete, "
+                            f"redoing the audio only: {str(e)}"
+                        )
+                else:
+                    # STEP 1: Generate script using GPT-4o
+                    print(f"Generating script for podcast: {title}")
+                    script_data = await run_stage(
+                        "script", lambda: generate_script_with_gpt4(emails_text)
+                    )
+                    await script_cache.set(script_key, script_data, owner=user_id)
+                    await checkpoint("script", script_data)
+            
+            if audio_url is None:
+                # STEP 2: Generate audio from script
+                await set_stage(jobs.SYNTHESIZING)
+                print("Generating audio from script")
+                script_markdown = done["script"]["script_markdown"]
+                tts_chunks = done["script"].get("tts_chunks")
+                audio_url = await run_stage(
+                    "audio",
+                    lambda: generate_audio_from_text(
+                        script_markdown, user_id, podcast_id, tts_chunks
+                    ),
+                )
+            await checkpoint("audio", {"audio_url": audio_url})
+        
+        script_data = done["script"]
         script_markdown = script_data["script_markdown"]
         duration = script_data["approx_duration_sec"]
-        
         print(f"Script generated: {len(script_markdown)} characters, {script_data['word_count']} words")
         
-        # STEP 2: Generate audio from script
-        print("Generating audio from script")
-        
-        audio_url = await generate_audio_from_text(script_markdown, user_id)
-        
         # Save podcast to database
-        podcast_id = await save_podcast_to_supabase(
+        await set_stage(jobs.UPLOADING)
+        podcast = await run_stage("save", lambda: save_podcast_to_supabase(
             user_id=user_id,
             title=title,
             script_markdown=script_markdown,
-            audio_url=audio_url,
+            audio_url=done["audio"]["audio_url"],
             source_emails=len(emails),
-            duration=duration
-        )
+            duration=duration,
+            podcast_id=podcast_id,
+            # Everything up to the save itself
+            profile=profile_snapshot()
+        ))
+        if job_id:
+            # Only the small final record is needed from here on
+            await checkpoints.save(job_id, "podcast", podcast)
+            await checkpoints.clear(job_id, keep="podcast")
         
-        print(f"Podcast generation completed. ID: {podcast_id}")
+        print(f"Podcast generation completed. ID: {podcast['id']}")
+        # The job result carries the full record so progress streams can hand it to the client
+        return {"podcast_id": podcast["id"], "podcast": podcast}
         
     except Exception as e:
         print(f"Error in podcast generation: {str(e)}")
         traceback.print_exc()  # Print full traceback for debugging
+        if job_id:
+            # Keep what this run cost, so the profile of a retried job covers every run
+            try:
+                await checkpoints.save(job_id, "profile", profile_snapshot())
+            except Exception as checkpoint_error:
+                print(
+                    f"Failed to save the generation profile of job {job_id}: "
+                    f"{str(checkpoint_error)}"
+                )
+        raise
+
+async def run_podcast_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler used by the worker pool for queued podcast jobs."""
+    payload = job["payload"]
+    return await process_podcast_generation(
+        user_id=job["user_id"],
+        email_ids=payload["email_ids"],
+        title=payload.get("title"),
+        job_id=job["id"],
+        force_regenerate=payload.get("force_regenerate", False)
+    )
+
+async def ensure_account_not_deleting(user_uuid: str):
+    """Refuse new podcast work while the account is being deleted, so none outlives the deletion."""
+    if await jobs.find_unfinished_job(user_uuid, "account_deletion"):
+        raise HTTPException(status_code=409, detail="The account is being deleted")
 
 @router.post("/generate", response_model=PodcastResponse)
-async def generate_podcast(request: PodcastRequest, background_tasks: BackgroundTasks):
+async def generate_podcast(request: PodcastRequest):
     """
-    Start the podcast generation process.
-    This endpoint returns immediately and processes the podcast in the background.
+    Queue a podcast generation job.
+    This endpoint returns immediately; the job is processed by the worker pool
+    and its progress can be followed at /podcast/jobs/{id}. On the serverless
+    entry point (api/index.py) the job runs before the response is sent.
     """
     if not request.user_id:
         raise HTTPException(status_code=400, detail="User ID is required")
@@ -340,23 +745,185 @@ async def generate_podcast(request: PodcastRequest, background_tasks: Background
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid user ID format")
     
-    # Add the task to the background tasks
-    background_tasks.add_task(
-        process_podcast_generation,
-        user_id=user_uuid,
-        email_ids=request.email_ids,
-        title=request.title
+    await ensure_account_not_deleting(user_uuid)
+    
+    # Persist the job and wake up an idle worker
+    job = await jobs.create_job(
+        "podcast",
+        user_uuid,
+        {
+            "email_ids": request.email_ids,
+            "title": request.title,
+            "force_regenerate": request.force_regenerate,
+        },
     )
+    job = await dispatch(job)
     
+    # Jobs run inline (on Vercel) are already finished here, with their result
     return {
-        "id": str(uuid.uuid4()),  # This would be a job ID in a real implementation
-        "status": "processing",
-        "message": "Podcast generation started. This may take a few minutes."
+        "id": job["id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "message": "Podcast generation queued. This may take a few minutes."
     }
 
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, user_id: str):
+    """Report the current state of a podcast generation job."""
+    try:
+        job_uuid = str(uuid.UUID(job_id))
+        user_uuid = str(uuid.UUID(user_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ID format")
+    
+    job = await jobs.get_job(job_uuid)
+    if not job or job["user_id"] != user_uuid:
+        raise HTTPException(status_code=404, detail="Job not found or doesn't belong to the user")
+    
+    return jobs.public_job(job)
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_podcast_job(job_id: str, user_id: str):
+    """
+    Run a failed podcast generation job again. It resumes after the last
+    stage that finished, so e.g. a failed upload does not redo the script.
+    """
+    try:
+        job_uuid = str(uuid.UUID(job_id))
+        user_uuid = str(uuid.UUID(user_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ID format")
+    
+    job = await jobs.get_job(job_uuid)
+    if not job or job["kind"] != "podcast" or job["user_id"] != user_uuid:
+        raise HTTPException(status_code=404, detail="Job not found or doesn't belong to the user")
+    await ensure_account_not_deleting(user_uuid)
+    
+    if not await jobs.retry_job(job_uuid):
+        raise HTTPException(
+            status_code=409, detail=f"Only failed jobs can be retried (status: {job['status']})"
+        )
+    
+    return jobs.public_job(await dispatch(await jobs.get_job(job_uuid)))
+
+def format_sse(data: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, user_id: str, request: Request):
+    """
+    Stream a job's stage transitions as Server-Sent Events.
+    The stream ends after the terminal event, which carries the podcast record on success.
+    """
+    try:
+        job_uuid = str(uuid.UUID(job_id))
+        user_uuid = str(uuid.UUID(user_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ID format")
+    
+    job = await jobs.get_job(job_uuid)
+    if not job or job["user_id"] != user_uuid:
+        raise HTTPException(status_code=404, detail="Job not found or doesn't belong to the user")
+    
+    async def event_stream():
+        with job_events.subscribe(job_uuid) as queue:
+            # Read the current state only after subscribing so no transition is missed
+            current = jobs.public_job(await jobs.get_job(job_uuid))
+            yield format_sse(current)
+            status = current["status"]
+            
+            while status not in jobs.TERMINAL_STATES:
+                if await request.is_disconnected():
+                    return
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Workers may run in another process, so fall back to the job table
+                    current = jobs.public_job(await jobs.get_job(job_uuid))
+                    if current["status"] == status:
+                        yield ": keep-alive\n\n"
+                        continue
+                    event = current
+                status = event["status"]
+                yield format_sse(event)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names this ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    # If-None-Match uses weak comparison, so a W/ prefix added by a proxy still matches
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+async def versioned_json_response(
+    request: Request, user_uuid: str, key: str, loader: Callable[[], Awaitable[Any]]
+) -> Response:
+    """
+    Serve a read of a user's podcasts with a strong ETag derived from the
+    user's podcasts version. A matching If-None-Match gets 304 without
+    touching Supabase; otherwise the serialized body comes from the
+    response cache, and only a miss calls loader.
+
+    When the local database is private to this instance (Vercel), another
+    instance may have changed the podcasts without bumping the version seen
+    here, so the body is always loaded and the ETag is a hash of it.
+    """
+    if not db.LOCAL_DB_SHARED:
+        body = json.dumps(await loader())
+        etag = f'"{hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    version = await versions.current("podcasts", user_uuid)
+    etag = f'"{version}-{hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    async def load() -> str:
+        return json.dumps(await loader())
+    
+    body = await response_cache.get_or_load(f"{user_uuid}:{version}:{key}", load)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def encode_list_cursor(podcast: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past the given podcast in the listing order."""
+    raw = f"{podcast['created_at']}|{podcast['id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_list_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, podcast_id = raw.split("|", 1)
+        datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        return created_at, str(uuid.UUID(podcast_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/list")
-async def list_podcasts(user_id: str):
-    """List all podcasts for a user."""
+async def list_podcasts(
+    request: Request,
+    user_id: str,
+    limit: int = LIST_DEFAULT_LIMIT,
+    before: Optional[str] = None,
+    include_script: bool = False,
+):
+    """
+    List a user's podcasts, newest first, one page at a time.
+    Pass the returned next_before as before to get the following page.
+    The script is left out unless include_script is set.
+    """
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID is required")
     
@@ -366,27 +933,197 @@ async def list_podcasts(user_id: str):
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid user ID format")
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/podcasts",
-            headers={
-                "apikey": SUPABASE_SERVICE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            },
-            params={
+    if limit < 1 or limit > LIST_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {LIST_MAX_LIMIT}")
+    
+    params = {
+        "user_id": f"eq.{user_uuid}",
+        "select": LIST_COLUMNS + (",script_markdown" if include_script else ""),
+        # id breaks ties between podcasts created at the same instant
+        "order": "created_at.desc,id.desc",
+        # One extra row tells us whether there is another page
+        "limit": str(limit + 1)
+    }
+    if before:
+        # Keyset condition on (created_at, id), served by idx_podcasts_user_created
+        created_at, podcast_id = decode_list_cursor(before)
+        params["or"] = (
+            f'(created_at.lt."{created_at}",'
+            f'and(created_at.eq."{created_at}",id.lt.{podcast_id}))'
+        )
+    
+    async def load() -> Dict[str, Any]:
+        response = await supabase_client.select("podcasts", params)
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=500, detail=f"Failed to fetch podcasts: {response.text}"
+            )
+        
+        podcasts = response.json()
+        next_before = encode_list_cursor(podcasts[limit - 1]) if len(podcasts) > limit else None
+        return {"podcasts": podcasts[:limit], "next_before": next_before}
+    
+    key = f"list:{limit}:{before}:{include_script}"
+    return await versioned_json_response(request, user_uuid, key, load)
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50 and p95, and the maximum, of values."""
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    
+    def rank(q: float) -> float:
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+    
+    return {"p50": rank(0.5), "p95": rank(0.95), "max": ordered[-1]}
+
+def summarize_profiles(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate the generation profiles of several podcasts."""
+    profiled = [row for row in rows if row.get("profile")]
+    stages: Dict[str, List[float]] = {}
+    tokens: Dict[str, Dict[str, int]] = {}
+    retries: Dict[str, int] = {}
+    cache: Dict[str, int] = {}
+    script_cache_results: Dict[str, int] = {}
+    
+    for row in profiled:
+        profile = row["profile"]
+        for stage, seconds in profile.get("stages", {}).items():
+            stages.setdefault(stage, []).append(seconds)
+        for model, usage in profile.get("tokens", {}).items():
+            totals = tokens.setdefault(model, {"prompt": 0, "completion": 0})
+            totals["prompt"] += usage.get("prompt", 0)
+            totals["completion"] += usage.get("completion", 0)
+        for key, count in profile.get("retries", {}).items():
+            retries[key] = retries.get(key, 0) + count
+        for key, value in profile.get("cache", {}).items():
+            if key == "script":
+                script_cache_results[value] = script_cache_results.get(value, 0) + 1
+            else:
+                cache[key] = cache.get(key, 0) + value
+    
+    def hit_rate(hits: int, misses: int) -> Optional[float]:
+        return round(hits / (hits + misses), 3) if hits + misses else None
+    
+    def total_tokens(row: Dict[str, Any]) -> int:
+        usages = row["profile"].get("tokens", {}).values()
+        return sum(usage.get("prompt", 0) + usage.get("completion", 0) for usage in usages)
+    
+    def wall_seconds(row: Dict[str, Any]) -> float:
+        return row["profile"].get("wall_seconds", 0)
+    
+    def episode(row: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "title": row.get("title"),
+            "created_at": row.get("created_at"),
+            "wall_seconds": row["profile"].get("wall_seconds"),
+            "tokens": total_tokens(row),
+            "tts_characters": row["profile"].get("tts_characters", 0),
+        }
+    
+    return {
+        "podcasts": len(profiled),
+        "wall_seconds": percentiles([row["profile"].get("wall_seconds", 0) for row in profiled]),
+        "stages": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        "tokens": tokens,
+        "tts_characters": sum(row["profile"].get("tts_characters", 0) for row in profiled),
+        "uploaded_bytes": sum(row["profile"].get("uploaded_bytes", 0) for row in profiled),
+        "retries": retries,
+        "resumed": sum(1 for row in profiled if row["profile"].get("resumed_from")),
+        "cache_hit_rates": {
+            "script": hit_rate(
+                script_cache_results.get("hit", 0), script_cache_results.get("miss", 0)
+            ),
+            "summaries": hit_rate(cache.get("summary_hits", 0), cache.get("summary_misses", 0)),
+            "tts_segments": hit_rate(
+                cache.get("tts_segment_hits", 0), cache.get("tts_segment_misses", 0)
+            ),
+        },
+        "slowest": [
+            episode(row) for row in sorted(profiled, key=wall_seconds, reverse=True)[:5]
+        ],
+        "most_tokens": [
+            episode(row) for row in sorted(profiled, key=total_tokens, reverse=True)[:5]
+        ],
+    }
+
+@router.get("/profiles")
+async def get_profiles_summary(
+    request: Request, user_id: str, limit: int = PROFILE_SUMMARY_DEFAULT_LIMIT
+):
+    """
+    Aggregate generation profiles over a user's latest podcasts: stage time
+    percentiles, token and TTS totals, retries, cache hit rates, and the
+    slowest and most expensive episodes.
+    """
+    try:
+        user_uuid = str(uuid.UUID(user_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user ID format")
+    
+    if limit < 1 or limit > PROFILE_SUMMARY_MAX_LIMIT:
+        raise HTTPException(
+            status_code=400, detail=f"limit must be between 1 and {PROFILE_SUMMARY_MAX_LIMIT}"
+        )
+    
+    async def load() -> Dict[str, Any]:
+        response = await supabase_client.select(
+            "podcasts",
+            {
                 "user_id": f"eq.{user_uuid}",
-                "select": "*",
-                "order": "created_at.desc"
+                "profile": "not.is.null",
+                "select": "id,title,created_at,profile",
+                "order": "created_at.desc,id.desc",
+                "limit": str(limit)
             }
         )
         
         if response.status_code != 200:
-            raise HTTPException(status_code=500, detail=f"Failed to fetch podcasts: {response.text}")
+            raise HTTPException(
+                status_code=500, detail=f"Failed to fetch podcast profiles: {response.text}"
+            )
         
-        return response.json()
+        return summarize_profiles(response.json())
+    
+    return await versioned_json_response(request, user_uuid, f"profiles:{limit}", load)
+
+@router.get("/{podcast_id}/profile")
+async def get_podcast_profile(request: Request, podcast_id: str, user_id: str):
+    """Get the generation profile of a specific podcast."""
+    try:
+        podcast_uuid = str(uuid.UUID(podcast_id))
+        user_uuid = str(uuid.UUID(user_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ID format")
+    
+    async def load() -> Dict[str, Any]:
+        response = await supabase_client.select(
+            "podcasts",
+            {
+                "id": f"eq.{podcast_uuid}",
+                "user_id": f"eq.{user_uuid}",
+                "select": "id,title,created_at,profile"
+            }
+        )
+        
+        if response.status_code != 200 or not response.json():
+            raise HTTPException(
+                status_code=404, detail="Podcast not found or doesn't belong to the user"
+            )
+        
+        podcast = response.json()[0]
+        if podcast.get("profile") is None:
+            raise HTTPException(
+                status_code=404, detail="No generation profile was recorded for this podcast"
+            )
+        return podcast
+    
+    return await versioned_json_response(request, user_uuid, f"profile:{podcast_uuid}", load)
 
 @router.get("/{podcast_id}")
-async def get_podcast(podcast_id: str, user_id: str):
+async def get_podcast(request: Request, podcast_id: str, user_id: str):
     """Get a specific podcast."""
     if not podcast_id or not user_id:
         raise HTTPException(status_code=400, detail="Podcast ID and User ID are required")
@@ -398,14 +1135,10 @@ async def get_podcast(podcast_id: str, user_id: str):
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid ID format")
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/podcasts",
-            headers={
-                "apikey": SUPABASE_SERVICE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            },
-            params={
+    async def load() -> Dict[str, Any]:
+        response = await supabase_client.select(
+            "podcasts",
+            {
                 "id": f"eq.{podcast_uuid}",
                 "user_id": f"eq.{user_uuid}",
                 "select": "*"
@@ -413,9 +1146,13 @@ async def get_podcast(podcast_id: str, user_id: str):
         )
         
         if response.status_code != 200 or not response.json():
-            raise HTTPException(status_code=404, detail="Podcast not found or doesn't belong to the user")
+            raise HTTPException(
+                status_code=404, detail="Podcast not found or doesn't belong to the user"
+            )
         
         return response.json()[0]
+    
+    return await versioned_json_response(request, user_uuid, f"podcast:{podcast_uuid}", load)
 
 @router.delete("/{podcast_id}")
 async def delete_podcast(podcast_id: str, user_id: str):
@@ -430,61 +1167,47 @@ async def delete_podcast(podcast_id: str, user_id: str):
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid ID format")
     
-    async with httpx.AsyncClient() as client:
-        # First check if the podcast belongs to the user and get the audio_url
-        check_response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/podcasts",
-            headers={
-                "apikey": SUPABASE_SERVICE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            },
-            params={
-                "id": f"eq.{podcast_uuid}",
-                "user_id": f"eq.{user_uuid}",
-                "select": "id,audio_url"
-            }
+    # First check if the podcast belongs to the user and get the audio_url
+    check_response = await supabase_client.select(
+        "podcasts",
+        {
+            "id": f"eq.{podcast_uuid}",
+            "user_id": f"eq.{user_uuid}",
+            "select": "id,audio_url"
+        }
+    )
+    
+    if check_response.status_code != 200 or not check_response.json():
+        raise HTTPException(
+            status_code=404, detail="Podcast not found or doesn't belong to the user"
         )
-        
-        if check_response.status_code != 200 or not check_response.json():
-            raise HTTPException(status_code=404, detail="Podcast not found or doesn't belong to the user")
-        
-        podcast_data = check_response.json()[0]
-        audio_url = podcast_data.get("audio_url", "")
-        
-        # Extract the storage path from the audio URL
-        if audio_url and "/storage/v1/object/public/podcasts/" in audio_url:
-            storage_path = audio_url.split("/storage/v1/object/public/podcasts/")[1]
+    
+    podcast_data = check_response.json()[0]
+    audio_url = podcast_data.get("audio_url", "")
+    
+    # Extract the storage path from the audio URL
+    storage_path = supabase_client.storage_path_from_public_url("podcasts", audio_url)
+    if storage_path:
+        # Delete the audio file from storage
+        try:
+            delete_file_response = await supabase_client.storage_delete("podcasts", storage_path)
             
-            # Delete the audio file from storage
-            try:
-                delete_file_response = await client.delete(
-                    f"{SUPABASE_URL}/storage/v1/object/podcasts/{storage_path}",
-                    headers={
-                        "apikey": SUPABASE_SERVICE_KEY,
-                        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                    }
-                )
-                
-                if delete_file_response.status_code >= 400 and delete_file_response.status_code != 404:
-                    # Log the error but continue with deleting the database record
-                    print(f"Failed to delete audio file: {delete_file_response.text}")
-            except Exception as e:
+            if delete_file_response.status_code >= 400 and delete_file_response.status_code != 404:
                 # Log the error but continue with deleting the database record
-                print(f"Error deleting audio file: {str(e)}")
-        
-        # Delete the podcast record from the database
-        delete_response = await client.delete(
-            f"{SUPABASE_URL}/rest/v1/podcasts",
-            headers={
-                "apikey": SUPABASE_SERVICE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            },
-            params={
-                "id": f"eq.{podcast_uuid}"
-            }
+                print(f"Failed to delete audio file: {delete_file_response.text}")
+        except Exception as e:
+            # Log the error but continue with deleting the database record
+            print(f"Error deleting audio file: {str(e)}")
+    
+    # Delete the podcast record from the database
+    delete_response = await supabase_client.delete("podcasts", {"id": f"eq.{podcast_uuid}"})
+    
+    if delete_response.status_code >= 400:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to delete podcast: {delete_response.text}"
         )
-        
-        if delete_response.status_code >= 400:
-            raise HTTPException(status_code=500, detail=f"Failed to delete podcast: {delete_response.text}")
-        
-        return {"message": "Podcast and audio file deleted successfully"} 
\ No newline at end of file
+    
+    # Invalidate cached listings and ETags for this user
+    await versions.bump("podcasts", user_uuid)
+    
+    return {"message": "Podcast and audio file deleted successfully"}
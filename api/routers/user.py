@@ -1,9 +1,17 @@
-from fastapi import APIRouter, HTTPException
-import httpx
+import asyncio
 import os
-import uuid
+import time
 import traceback
-from typing import Dict, Any
+import uuid
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, HTTPException
+
+from ..services import checkpoints, jobs, mail_sync, supabase_client, versions
+from ..services.audio_cache import audio_cache
+from ..services.worker import dispatch
+from .gmail import credentials_cache
+from .podcast import script_cache, summary_cache
 
 router = APIRouter()
 
@@ -14,139 +22,227 @@ SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
     raise ValueError("Missing required environment variables: SUPABASE_URL, SUPABASE_SERVICE_KEY")
 
-@router.delete("/user/{user_id}")
-async def delete_user_account(user_id: str):
+# Audio files removed per bulk storage request, and how many of those requests run at once
+STORAGE_DELETE_BATCH_SIZE = int(os.getenv("STORAGE_DELETE_BATCH_SIZE", "100"))
+STORAGE_DELETE_CONCURRENCY = int(os.getenv("STORAGE_DELETE_CONCURRENCY", "4"))
+# How often account deletion checks whether the user's cancelled podcast jobs have stopped
+JOB_CANCEL_POLL_INTERVAL = 1.0
+
+def parse_user_id(user_id: str) -> str:
+    if not user_id:
+        raise HTTPException(status_code=400, detail="User ID is required")
+    
+    # Validate user_id is a valid UUID
+    try:
+        return str(uuid.UUID(user_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user ID format")
+
+async def delete_audio_files(storage_paths: List[str], report) -> List[str]:
+    """
+    Remove audio files with bulk storage requests, a few batches at a time.
+    Returns the paths whose batch failed.
+    """
+    batches = [
+        storage_paths[i:i + STORAGE_DELETE_BATCH_SIZE]
+        for i in range(0, len(storage_paths), STORAGE_DELETE_BATCH_SIZE)
+    ]
+    semaphore = asyncio.Semaphore(STORAGE_DELETE_CONCURRENCY)
+    failed: List[str] = []
+    deleted = 0
+    
+    async def delete_batch(batch: List[str]):
+        nonlocal deleted
+        async with semaphore:
+            try:
+                response = await supabase_client.storage_delete_many("podcasts", batch)
+                if response.status_code >= 400:
+                    print(f"Failed to delete {len(batch)} audio files: {response.text}")
+                    failed.extend(batch)
+                    return
+            except Exception as e:
+                print(f"Error deleting {len(batch)} audio files: {str(e)}")
+                failed.extend(batch)
+                return
+        # Paths that were already gone are not an error, so the whole batch counts as done
+        deleted += len(batch)
+        await report(files_deleted=deleted, files_failed=len(failed))
+    
+    await asyncio.gather(*(delete_batch(batch) for batch in batches))
+    return failed
+
+async def run_account_deletion_job(job: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Delete a user account and all associated data including:
+    Job handler that deletes a user account and all associated data:
+    - Running and queued podcast jobs, which are stopped first
     - User podcasts and audio files from storage
     - Gmail credentials
+    - Local job records, checkpoints, cached scripts, summaries and audio segments
     - User profile data
+
+    Each step is safe to repeat, so a failed job can simply be run again.
+    Podcast rows are only removed once all their audio files are gone,
+    which lets a retry find the files that still need deleting.
     """
-    if not user_id:
-        raise HTTPException(status_code=400, detail="User ID is required")
+    job_id = job["id"]
+    user_uuid = job["user_id"]
+    progress: Dict[str, Any] = {
+        "step": "podcast_jobs", "files_total": 0, "files_deleted": 0, "files_failed": 0
+    }
     
-    # Validate user_id is a valid UUID
+    async def report(**changes):
+        progress.update(changes)
+        await jobs.update_job(job_id, jobs.DELETING, result=dict(progress))
+    
+    # Step 0: Stop the user's podcast jobs, so none uploads audio or saves a podcast after the purge
+    await report()
+    running = await jobs.cancel_jobs(user_uuid, "podcast")
+    deadline = time.monotonic() + jobs.JOB_LEASE_SECONDS
+    while running:
+        if time.monotonic() > deadline:
+            raise Exception(f"{running} podcast jobs did not stop")
+        print(f"Waiting for {running} podcast jobs of user {user_uuid} to stop")
+        await asyncio.sleep(JOB_CANCEL_POLL_INTERVAL)
+        running = await jobs.count_user_jobs(user_uuid, "podcast", jobs.CANCELLING)
+    
+    # Step 1: Get all user's podcasts to delete audio files
+    await report(step="podcasts")
+    print(f"Fetching podcasts for user {user_uuid}")
+    podcasts_response = await supabase_client.select(
+        "podcasts",
+        {
+            "user_id": f"eq.{user_uuid}",
+            "select": "id,audio_url"
+        }
+    )
+    if podcasts_response.status_code != 200:
+        raise Exception(f"Failed to fetch podcasts: {podcasts_response.text}")
+    
+    podcasts = podcasts_response.json()
+    storage_paths = [
+        path
+        for path in (
+            supabase_client.storage_path_from_public_url("podcasts", podcast.get("audio_url", ""))
+            for podcast in podcasts
+        )
+        if path
+    ]
+    print(f"Found {len(podcasts)} podcasts and {len(storage_paths)} audio files to delete")
+    
+    # Step 2: Delete audio files from storage
+    await report(step="audio_files", files_total=len(storage_paths))
+    failed = await delete_audio_files(storage_paths, report)
+    if failed:
+        raise Exception(f"Failed to delete {len(failed)} of {len(storage_paths)} audio files")
+    
+    # Step 3: Delete all user's podcasts from database
+    await report(step="podcast_records")
+    print(f"Deleting podcasts from database for user {user_uuid}")
+    delete_podcasts_response = await supabase_client.delete(
+        "podcasts", {"user_id": f"eq.{user_uuid}"}
+    )
+    if delete_podcasts_response.status_code >= 400:
+        raise Exception(f"Failed to delete podcasts: {delete_podcasts_response.text}")
+    await versions.bump("podcasts", user_uuid)
+    
+    # Step 4: Delete Gmail credentials
+    await report(step="gmail_connection")
+    print(f"Deleting Gmail credentials for user {user_uuid}")
+    delete_gmail_response = await supabase_client.delete(
+        "gmail_connections", {"user_id": f"eq.{user_uuid}"}
+    )
+    if delete_gmail_response.status_code >= 400:
+        raise Exception(f"Failed to delete Gmail credentials: {delete_gmail_response.text}")
+    await credentials_cache.invalidate(user_uuid)
+    await mail_sync.forget_user(user_uuid)
+    
+    # Step 5: Delete what this host keeps about the user: job rows and payloads
+    # (except this job's, which reports the deletion), checkpoints and cached
+    # scripts, summaries and audio segments made from the user's newsletters
+    await report(step="local_data")
+    print(f"Deleting local job records and caches for user {user_uuid}")
+    await checkpoints.forget_user(user_uuid)
+    await jobs.delete_user_jobs(user_uuid, keep=job_id)
+    await script_cache.forget_owner(user_uuid)
+    await summary_cache.forget_owner(user_uuid)
+    await asyncio.to_thread(audio_cache.delete_owner, user_uuid)
+    
+    # Step 6: Delete user from auth.users (this will cascade to other tables)
+    await report(step="auth_user")
+    print(f"Deleting user account {user_uuid}")
+    delete_user_response = await supabase_client.get_client().delete(
+        f"/rest/v1/auth/users/{user_uuid}"
+    )
+    
+    # Note: Supabase auth deletion might return different status codes
+    # If the above doesn't work, we can try the admin API
+    if delete_user_response.status_code >= 400:
+        print(f"Standard user deletion failed, trying admin API: {delete_user_response.text}")
+        
+        # Try admin API for user deletion; a user deleted by an earlier attempt is gone already
+        admin_delete_response = await supabase_client.delete_auth_user(user_uuid)
+        if admin_delete_response.status_code >= 400 and admin_delete_response.status_code != 404:
+            raise Exception(f"Failed to delete user account: {admin_delete_response.text}")
+        print("Successfully deleted user account via admin API")
+    else:
+        print("Successfully deleted user account")
+    
+    progress["step"] = "done"
+    return progress
+
+@router.delete("/user/{user_id}")
+async def delete_user_account(user_id: str):
+    """
+    Queue deletion of a user account and all associated data.
+    Returns the deletion job; its progress is at /user/{user_id}/deletion/{job_id}.
+    A deletion that is already queued or running is returned instead of starting another.
+    """
+    user_uuid = parse_user_id(user_id)
+    
+    try:
+        job = await jobs.find_unfinished_job(user_uuid, "account_deletion")
+        if job is None:
+            job = await dispatch(await jobs.create_job("account_deletion", user_uuid, {}))
+        
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "message": "Account deletion queued."
+        }
+        
+    except Exception as e:
+        print(f"Error queueing account deletion: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to delete account: {str(e)}")
+
+async def get_deletion_job(user_uuid: str, job_id: str) -> Dict[str, Any]:
     try:
-        user_uuid = str(uuid.UUID(user_id))
+        job_uuid = str(uuid.UUID(job_id))
     except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid user ID format")
+        raise HTTPException(status_code=400, detail="Invalid job ID format")
+    
+    job = await jobs.get_job(job_uuid)
+    if not job or job["user_id"] != user_uuid or job["kind"] != "account_deletion":
+        raise HTTPException(
+            status_code=404, detail="Deletion job not found or doesn't belong to the user"
+        )
+    return job
+
+@router.get("/user/{user_id}/deletion/{job_id}")
+async def get_account_deletion(user_id: str, job_id: str):
+    """Report the progress of an account deletion job."""
+    job = await get_deletion_job(parse_user_id(user_id), job_id)
+    return jobs.public_job(job)
+
+@router.post("/user/{user_id}/deletion/{job_id}/retry")
+async def retry_account_deletion(user_id: str, job_id: str):
+    """Run a failed account deletion again, picking up whatever is left to delete."""
+    job = await get_deletion_job(parse_user_id(user_id), job_id)
+    
+    if not await jobs.retry_job(job["id"]):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Only failed deletions can be retried (status: {job['status']})",
+        )
     
-    async with httpx.AsyncClient() as client:
-        try:
-            # Step 1: Get all user's podcasts to delete audio files
-            print(f"Fetching podcasts for user {user_id}")
-            podcasts_response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/podcasts",
-                headers={
-                    "apikey": SUPABASE_SERVICE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                },
-                params={
-                    "user_id": f"eq.{user_uuid}",
-                    "select": "id,audio_url"
-                }
-            )
-            
-            if podcasts_response.status_code == 200:
-                podcasts = podcasts_response.json()
-                print(f"Found {len(podcasts)} podcasts to delete")
-                
-                # Step 2: Delete audio files from storage
-                for podcast in podcasts:
-                    audio_url = podcast.get("audio_url", "")
-                    if audio_url and "/storage/v1/object/public/podcasts/" in audio_url:
-                        storage_path = audio_url.split("/storage/v1/object/public/podcasts/")[1]
-                        
-                        try:
-                            delete_file_response = await client.delete(
-                                f"{SUPABASE_URL}/storage/v1/object/podcasts/{storage_path}",
-                                headers={
-                                    "apikey": SUPABASE_SERVICE_KEY,
-                                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                                }
-                            )
-                            
-                            if delete_file_response.status_code < 400:
-                                print(f"Deleted audio file: {storage_path}")
-                            else:
-                                print(f"Failed to delete audio file {storage_path}: {delete_file_response.text}")
-                        except Exception as e:
-                            print(f"Error deleting audio file {storage_path}: {str(e)}")
-            
-            # Step 3: Delete all user's podcasts from database
-            print(f"Deleting podcasts from database for user {user_id}")
-            delete_podcasts_response = await client.delete(
-                f"{SUPABASE_URL}/rest/v1/podcasts",
-                headers={
-                    "apikey": SUPABASE_SERVICE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                },
-                params={
-                    "user_id": f"eq.{user_uuid}"
-                }
-            )
-            
-            if delete_podcasts_response.status_code >= 400:
-                print(f"Failed to delete podcasts: {delete_podcasts_response.text}")
-            else:
-                print("Successfully deleted user podcasts")
-            
-            # Step 4: Delete Gmail credentials
-            print(f"Deleting Gmail credentials for user {user_id}")
-            delete_gmail_response = await client.delete(
-                f"{SUPABASE_URL}/rest/v1/gmail_credentials",
-                headers={
-                    "apikey": SUPABASE_SERVICE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                },
-                params={
-                    "user_id": f"eq.{user_uuid}"
-                }
-            )
-            
-            if delete_gmail_response.status_code >= 400:
-                print(f"Failed to delete Gmail credentials: {delete_gmail_response.text}")
-            else:
-                print("Successfully deleted Gmail credentials")
-            
-            # Step 5: Delete user from auth.users (this will cascade to other tables)
-            print(f"Deleting user account {user_id}")
-            delete_user_response = await client.delete(
-                f"{SUPABASE_URL}/rest/v1/auth/users/{user_uuid}",
-                headers={
-                    "apikey": SUPABASE_SERVICE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                }
-            )
-            
-            # Note: Supabase auth deletion might return different status codes
-            # If the above doesn't work, we can try the admin API
-            if delete_user_response.status_code >= 400:
-                print(f"Standard user deletion failed, trying admin API: {delete_user_response.text}")
-                
-                # Try admin API for user deletion
-                admin_delete_response = await client.delete(
-                    f"{SUPABASE_URL}/auth/v1/admin/users/{user_uuid}",
-                    headers={
-                        "apikey": SUPABASE_SERVICE_KEY,
-                        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                    }
-                )
-                
-                if admin_delete_response.status_code >= 400:
-                    print(f"Admin user deletion also failed: {admin_delete_response.text}")
-                    raise HTTPException(status_code=500, detail="Failed to delete user account")
-                else:
-                    print("Successfully deleted user account via admin API")
-            else:
-                print("Successfully deleted user account")
-            
-            return {"message": "Account and all associated data deleted successfully"}
-            
-        except HTTPException:
-            # Re-raise HTTP exceptions
-            raise
-        except Exception as e:
-            print(f"Error deleting user account: {str(e)}")
-            traceback.print_exc()
-            raise HTTPException(status_code=500, detail=f"Failed to delete account: {str(e)}") 
\ No newline at end of file
+    return jobs.public_job(await dispatch(await jobs.get_job(job["id"])))
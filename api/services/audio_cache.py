@@ -0,0 +1,187 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, BinaryIO, Dict, Optional
+
+from . import db, metrics
+
+# Synthesized segments are stored here, one file per content hash
+TTS_CACHE_DIR = os.getenv(
+    "TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "audiobrew-tts-cache")
+)
+# Total size of the cache before the least recently used segments are evicted; 0 disables it
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Which users each segment was synthesized or served for, so account deletion can remove them
+OWNERS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tts_segment_owners (
+    owner  TEXT NOT NULL,
+    key    TEXT NOT NULL,
+    PRIMARY KEY (owner, key)
+);
+CREATE INDEX IF NOT EXISTS idx_tts_segment_owners_key ON tts_segment_owners (key);
+"""
+
+def _owners_conn():
+    db.ensure_schema("tts_segment_owners", OWNERS_SCHEMA)
+    return db.connect()
+
+def segment_key(text: str, model: str, voice: str, response_format: str) -> str:
+    """Content address of a synthesized segment."""
+    digest = hashlib.sha256()
+    for part in (model, voice, response_format, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class AudioSegmentCache:
+    """
+    Size-bounded LRU of synthesized audio on local disk.
+
+    A file's mtime is its last use, so several processes sharing the
+    directory (web and worker) agree on what to evict.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _add_owner(self, key: str, owner: Optional[str]):
+        if owner is not None:
+            _owners_conn().execute(
+                "INSERT OR IGNORE INTO tts_segment_owners (owner, key) VALUES (?, ?)", (owner, key)
+            )
+
+    def open(self, key: str, owner: Optional[str] = None) -> Optional[BinaryIO]:
+        """Open a cached segment for reading, or return None on a miss."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        try:
+            self._add_owner(key, owner)
+        except BaseException:
+            file.close()
+            raise
+        with self._lock:
+            self.hits += 1
+        return file
+
+    def store(self, key: str, file: BinaryIO, owner: Optional[str] = None):
+        """Copy a finished segment into the cache, then evict down to the size limit."""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        file.seek(0)
+        # Write to a temp name and rename, so readers never see a partial segment
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(file, out)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._add_owner(key, owner)
+        with self._lock:
+            self.stores += 1
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".mp3"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        entries.sort()
+        evicted = []
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            evicted.append((os.path.basename(path)[:-len(".mp3")],))
+            with self._lock:
+                self.evictions += 1
+        if evicted:
+            _owners_conn().executemany("DELETE FROM tts_segment_owners WHERE key = ?", evicted)
+
+    def delete_owner(self, owner: str) -> int:
+        """
+        Remove every segment recorded for an owner, including ones other
+        owners share. Returns how many.
+        """
+        conn = _owners_conn()
+        keys = [row["key"] for row in conn.execute(
+            "SELECT key FROM tts_segment_owners WHERE owner = ?", (owner,)
+        ).fetchall()]
+        deleted = 0
+        for key in keys:
+            try:
+                os.unlink(self._path(key))
+                deleted += 1
+            except FileNotFoundError:
+                pass
+        conn.executemany("DELETE FROM tts_segment_owners WHERE key = ?", [(key,) for key in keys])
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+audio_cache = AudioSegmentCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
+
+segment_cache_events = metrics.Counter(
+    "audiobrew_tts_segment_cache_total",
+    "Synthesized audio segment cache lookups and writes",
+    ("event",),
+)
+
+def _export_metrics():
+    cache_stats = audio_cache.stats()
+    for event in ("hits", "misses", "stores", "evictions"):
+        segment_cache_events.set(cache_stats[event], event=event)
+
+metrics.on_scrape(_export_metrics)
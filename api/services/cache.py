@@ -0,0 +1,305 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from . import db, metrics
+
+_MISSING = object()
+
+# Every AsyncCache, for the metrics
+_caches: List["AsyncCache"] = []
+
+class MemoryBackend:
+    """Thread-safe in-process LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # key -> (expires_at, value, owners)
+        self._entries: "OrderedDict[str, Tuple[float, Any, Set[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            owners = entry[2] if entry is not None else set()
+            self._entries[key] = (time.monotonic() + ttl, value, owners)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def add_owner(self, key: str, owner: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[2].add(owner)
+
+    def delete_owner(self, owner: str) -> int:
+        with self._lock:
+            keys = [key for key, (_, _, owners) in self._entries.items() if owner in owners]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+SQLITE_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace   TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    value       TEXT NOT NULL,
+    expires_at  REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+
+CREATE TABLE IF NOT EXISTS cache_owners (
+    namespace   TEXT NOT NULL,
+    owner       TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    PRIMARY KEY (namespace, owner, key)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_owners_key ON cache_owners (namespace, key);
+"""
+
+class SQLiteBackend:
+    """
+    Cache entries in the local database file, shared by every uvicorn worker
+    on the host. Invalidations are visible to all workers immediately.
+    """
+
+    def __init__(self, namespace: str, max_entries: int):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.evictions = 0
+
+    def _conn(self):
+        db.ensure_schema("cache_entries", SQLITE_CACHE_SCHEMA)
+        return db.connect()
+
+    def get(self, key: str) -> Any:
+        row = self._conn().execute(
+            "SELECT value FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (self.namespace, key, time.time()),
+        ).fetchone()
+        return _MISSING if row is None else json.loads(row["value"])
+
+    def set(self, key: str, value: Any, ttl: float):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) "
+            "VALUES (?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value), time.time() + ttl),
+        )
+        # Drop expired entries, then the soonest-to-expire ones past the size limit
+        cursor = conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND (expires_at <= ? OR key IN ("
+            "SELECT key FROM cache_entries WHERE namespace = ? "
+            "ORDER BY expires_at DESC LIMIT -1 OFFSET ?))",
+            (self.namespace, time.time(), self.namespace, self.max_entries),
+        )
+        self.evictions += cursor.rowcount
+        if cursor.rowcount:
+            conn.execute(
+                "DELETE FROM cache_owners WHERE namespace = ? AND key NOT IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ?)",
+                (self.namespace, self.namespace),
+            )
+
+    def delete(self, key: str):
+        conn = self._conn()
+        conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+        conn.execute(
+            "DELETE FROM cache_owners WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+
+    def add_owner(self, key: str, owner: str):
+        self._conn().execute(
+            "INSERT OR IGNORE INTO cache_owners (namespace, owner, key) VALUES (?, ?, ?)",
+            (self.namespace, owner, key),
+        )
+
+    def delete_owner(self, owner: str) -> int:
+        conn = self._conn()
+        owned = "SELECT key FROM cache_owners WHERE namespace = ? AND owner = ?"
+        cursor = conn.execute(
+            f"DELETE FROM cache_entries WHERE namespace = ? AND key IN ({owned})",
+            (self.namespace, self.namespace, owner),
+        )
+        # Other owners of the same entries lose them too
+        conn.execute(
+            f"DELETE FROM cache_owners WHERE namespace = ? AND key IN ({owned})",
+            (self.namespace, self.namespace, owner),
+        )
+        return cursor.rowcount
+
+class AsyncCache:
+    """
+    Read-through cache with TTL and single-flight loading.
+
+    Concurrent misses for the same key on the same event loop share one call
+    to the loader instead of each hitting the backing service.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int, backend: str = "memory"):
+        self.name = name
+        self.ttl = ttl
+        if backend == "sqlite":
+            self.backend = SQLiteBackend(name, max_entries)
+        else:
+            self.backend = MemoryBackend(max_entries)
+        self._shared = backend == "sqlite"
+        self._in_flight: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+        # Loads that were in flight when their key was invalidated; their results are not stored
+        self._stale: Set[asyncio.Future] = set()
+        # Loads and invalidations run on the web loop and on the worker pool's loop
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        _caches.append(self)
+
+    async def _call(self, fn, *args):
+        # The SQLite backend does file I/O, so keep it off the event loop
+        if self._shared:
+            return await db.run(fn, *args)
+        return fn(*args)
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        cache_none: bool = False,
+        owner: Optional[str] = None,
+    ) -> Any:
+        """
+        Cached value for key, or the loader's result (stored unless it is None).
+        An owner (a user id) is recorded against the entry, so forget_owner can
+        drop everything derived from that user's data.
+        """
+        value = await self._call(self.backend.get, key)
+        if value is not _MISSING:
+            self.hits += 1
+            if owner is not None:
+                await self._call(self.backend.add_owner, key, owner)
+            return value
+
+        flight_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            in_flight = self._in_flight.get(flight_key)
+            if in_flight is None:
+                future = asyncio.get_running_loop().create_future()
+                self._in_flight[flight_key] = future
+        if in_flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        try:
+            value = await loader()
+            if value is not None or cache_none:
+                await self._call(self._store, future, key, value, owner)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting on the shared future; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                # An invalidate may already have replaced this load with a newer one
+                if self._in_flight.get(flight_key) is future:
+                    del self._in_flight[flight_key]
+                self._stale.discard(future)
+
+    def _store(self, future: Optional[asyncio.Future], key: str, value: Any, owner: Optional[str]):
+        with self._lock:
+            if future in self._stale:
+                return
+            self.backend.set(key, value, self.ttl)
+            if owner is not None:
+                self.backend.add_owner(key, owner)
+
+    def _forget(self, key: str):
+        with self._lock:
+            stale = [flight_key for flight_key in self._in_flight if flight_key[1] == key]
+            for flight_key in stale:
+                self._stale.add(self._in_flight.pop(flight_key))
+            self.backend.delete(key)
+
+    async def get(self, key: str, owner: Optional[str] = None) -> Any:
+        """Cached value for key, or None."""
+        value = await self._call(self.backend.get, key)
+        if value is _MISSING:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if owner is not None:
+            await self._call(self.backend.add_owner, key, owner)
+        return value
+
+    async def set(self, key: str, value: Any, owner: Optional[str] = None):
+        """Store a value produced outside get_or_load."""
+        await self._call(self._store, None, key, value, owner)
+
+    async def invalidate(self, key: str):
+        """
+        Drop the cached value. A load already in flight for the key still
+        answers its callers but is not stored, and later calls load afresh.
+        """
+        await self._call(self._forget, key)
+
+    async def forget_owner(self, owner: str) -> int:
+        """Drop every entry recorded for an owner (e.g. on account deletion). Returns how many."""
+        return await self._call(self.backend.delete_owner, owner)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite" if self._shared else "memory",
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.backend.evictions,
+        }
+
+def drop_namespace(namespace: str) -> int:
+    """Delete every entry a cache ever stored in the local database. Returns how many."""
+    db.ensure_schema("cache_entries", SQLITE_CACHE_SCHEMA)
+    conn = db.connect()
+    conn.execute("DELETE FROM cache_owners WHERE namespace = ?", (namespace,))
+    return conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,)).rowcount
+
+cache_events = metrics.Counter(
+    "audiobrew_cache_total", "Lookups and evictions per application cache", ("cache", "event")
+)
+
+def _export_metrics():
+    for cache in list(_caches):
+        cache_stats = cache.stats()
+        for event in ("hits", "misses", "coalesced", "evictions"):
+            cache_events.set(cache_stats[event], cache=cache.name, event=event)
+
+metrics.on_scrape(_export_metrics)
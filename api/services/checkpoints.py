@@ -0,0 +1,72 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from . import db
+
+# Checkpoints of jobs that never finished are dropped after this long
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+    job_id      TEXT NOT NULL,
+    stage       TEXT NOT NULL,
+    data        TEXT NOT NULL,
+    created_at  TEXT NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+CREATE INDEX IF NOT EXISTS idx_job_checkpoints_created ON job_checkpoints (created_at);
+"""
+
+def _conn():
+    db.ensure_schema("job_checkpoints", SCHEMA)
+    return db.connect()
+
+def _load(job_id: str) -> Dict[str, Any]:
+    rows = _conn().execute(
+        "SELECT stage, data FROM job_checkpoints WHERE job_id = ?", (job_id,)
+    ).fetchall()
+    return {row["stage"]: json.loads(row["data"]) for row in rows}
+
+def _save(job_id: str, stage: str, data: Any):
+    _conn().execute(
+        "INSERT OR REPLACE INTO job_checkpoints (job_id, stage, data, created_at) "
+        "VALUES (?, ?, ?, ?)",
+        (job_id, stage, json.dumps(data), datetime.now(timezone.utc).isoformat()),
+    )
+
+def _clear(job_id: str, keep: Optional[str] = None):
+    _conn().execute(
+        "DELETE FROM job_checkpoints WHERE job_id = ? AND stage IS NOT ?", (job_id, keep)
+    )
+
+def _forget_user(user_id: str) -> int:
+    return _conn().execute(
+        "DELETE FROM job_checkpoints WHERE job_id IN (SELECT id FROM jobs WHERE user_id = ?)",
+        (user_id,),
+    ).rowcount
+
+def _prune() -> int:
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=CHECKPOINT_TTL_SECONDS)).isoformat()
+    return _conn().execute("DELETE FROM job_checkpoints WHERE created_at < ?", (cutoff,)).rowcount
+
+async def load(job_id: str) -> Dict[str, Any]:
+    """Every checkpoint stored for a job, by stage name."""
+    return await db.run(_load, job_id)
+
+async def save(job_id: str, stage: str, data: Any):
+    """Store the output of a finished stage so a retry of the job can skip it."""
+    await db.run(_save, job_id, stage, data)
+
+async def clear(job_id: str, keep: Optional[str] = None):
+    """Drop a job's checkpoints, except the stage named by keep."""
+    await db.run(_clear, job_id, keep)
+
+async def forget_user(user_id: str) -> int:
+    """Drop the checkpoints of every job of a user. Run it before the job rows are deleted."""
+    return await db.run(_forget_user, user_id)
+
+async def prune() -> int:
+    """Drop checkpoints older than CHECKPOINT_TTL_SECONDS."""
+    return await db.run(_prune)
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Callable, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Local SQLite database used for worker-side state (job queue, caches, ...).
+# Every uvicorn worker on the same host opens the same file, so state written
+# by one process is visible to the others.
+# On Vercel only the temp directory is writable, and it is private to each function instance.
+_DEFAULT_DB_DIR = (
+    tempfile.gettempdir() if os.getenv("VERCEL") else os.path.join(os.path.dirname(__file__), "..")
+)
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", os.path.join(_DEFAULT_DB_DIR, "audiobrew.db"))
+# Whether every instance serving the app sees this file. State that must agree across
+# instances (e.g. the podcast version counters behind ETags) is only kept here when it is.
+LOCAL_DB_SHARED = os.getenv("LOCAL_DB_SHARED", "0" if os.getenv("VERCEL") else "1") == "1"
+
+T = TypeVar("T")
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_applied_schemas = set()
+
+def connect() -> sqlite3.Connection:
+    """Return this thread's connection to the local database, opening it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(LOCAL_DB_PATH, timeout=30.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn = conn
+    return conn
+
+def ensure_schema(name: str, statements: str):
+    """Create the tables for a feature once per process."""
+    if name in _applied_schemas:
+        return
+    with _schema_lock:
+        if name in _applied_schemas:
+            return
+        connect().executescript(statements)
+        _applied_schemas.add(name)
+
+async def run(fn: Callable[..., T], *args: Any) -> T:
+    """Run a blocking database function in a thread so the event loop stays free."""
+    return await asyncio.to_thread(fn, *args)
@@ -0,0 +1,183 @@
+import asyncio
+import base64
+import codecs
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterator, List, Optional
+
+# Upper bound on the text kept from a single email
+EMAIL_BODY_MAX_CHARS = int(os.getenv("EMAIL_BODY_MAX_CHARS", "8000"))
+# Processes used for decoding and HTML-to-text conversion
+EMAIL_PARSE_PROCESSES = int(os.getenv("EMAIL_PARSE_PROCESSES", "2"))
+
+# Base64 characters decoded per step; a multiple of 4 so every step is self-contained
+DECODE_CHUNK_CHARS = 64 * 1024
+
+SKIPPED_TAGS = {"script", "style", "head", "title", "noscript", "svg", "template"}
+BLOCK_TAGS = {
+    "p", "div", "br", "tr", "li", "ul", "ol", "table", "section", "article", "header", "footer",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "hr",
+}
+
+class _TextLimitReached(Exception):
+    pass
+
+class HTMLToText(HTMLParser):
+    """Incremental HTML-to-text converter that drops markup, scripts, styles and images."""
+
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.length = 0
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self._append(data)
+
+    def _append(self, text: str):
+        self.parts.append(text)
+        self.length += len(text)
+        # Stop parsing early; markup overhead means raw length is only an upper bound
+        if self.length > self.max_chars * 2:
+            raise _TextLimitReached()
+
+    def text(self) -> str:
+        return normalize_text("".join(self.parts))[:self.max_chars]
+
+def normalize_text(text: str) -> str:
+    """Collapse runs of whitespace while keeping paragraph breaks."""
+    text = text.replace(" ", " ").replace("‌", "")
+    lines = [re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in text.split("\n")]
+    text = "\n".join(lines)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def iter_base64url(data: str, chunk_chars: int = DECODE_CHUNK_CHARS) -> Iterator[bytes]:
+    """Decode base64url text piece by piece instead of materialising the whole body."""
+    for start in range(0, len(data), chunk_chars):
+        chunk = data[start:start + chunk_chars]
+        if len(chunk) % 4:
+            chunk += "=" * (-len(chunk) % 4)
+        yield base64.urlsafe_b64decode(chunk)
+
+def _header(part: Dict[str, Any], name: str) -> str:
+    return next((h["value"] for h in part.get("headers", []) if h["name"].lower() == name), "")
+
+def _charset(part: Dict[str, Any]) -> str:
+    match = re.search(r'charset="?([\w\-]+)"?', _header(part, "content-type"), re.IGNORECASE)
+    charset = match.group(1) if match else "utf-8"
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = "utf-8"
+    return charset
+
+def _is_attachment(part: Dict[str, Any]) -> bool:
+    if part.get("filename"):
+        return True
+    if "attachment" in _header(part, "content-disposition").lower():
+        return True
+    # Large bodies are only referenced by attachmentId and are never downloaded
+    return "attachmentId" in part.get("body", {})
+
+def _find_text_parts(part: Dict[str, Any], found: Dict[str, Dict[str, Any]]):
+    mime_type = part.get("mimeType", "")
+    if mime_type.startswith("multipart/"):
+        for child in part.get("parts", []):
+            _find_text_parts(child, found)
+    elif mime_type in ("text/html", "text/plain") and not _is_attachment(part):
+        found.setdefault(mime_type, part)
+    # Images, attachments and any other parts are skipped without decoding
+
+def _decode_part(part: Dict[str, Any], max_chars: int) -> str:
+    data = part.get("body", {}).get("data", "")
+    decoder = codecs.getincrementaldecoder(_charset(part))(errors="replace")
+
+    if part["mimeType"] == "text/html":
+        parser = HTMLToText(max_chars)
+        try:
+            for chunk in iter_base64url(data):
+                parser.feed(decoder.decode(chunk))
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+        except _TextLimitReached:
+            pass
+        return parser.text()
+
+    pieces = []
+    length = 0
+    for chunk in iter_base64url(data):
+        text = decoder.decode(chunk)
+        pieces.append(text)
+        length += len(text)
+        if length > max_chars * 2:
+            break
+    return normalize_text("".join(pieces))[:max_chars]
+
+def extract_text(payload: Dict[str, Any], max_chars: int = EMAIL_BODY_MAX_CHARS) -> str:
+    """
+    Extract readable text from a Gmail format=full message payload.
+
+    Gmail has already removed the transfer encoding (quoted-printable or
+    base64) of each part; body.data is the part content in base64url. The
+    HTML alternative is preferred because newsletters' plain-text versions
+    are often just a "view in browser" link.
+    """
+    found: Dict[str, Dict[str, Any]] = {}
+    _find_text_parts(payload, found)
+
+    for mime_type in ("text/html", "text/plain"):
+        part = found.get(mime_type)
+        if part is not None:
+            text = _decode_part(part, max_chars)
+            if text:
+                return text
+    return ""
+
+_pool: Optional[ProcessPoolExecutor] = None
+# The web loop and the worker pool's loop both extract text; only one of them may create the pool
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that already runs worker threads is not safe
+            _pool = ProcessPoolExecutor(
+                max_workers=EMAIL_PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+async def extract_texts(
+    payloads: List[Dict[str, Any]], max_chars: int = EMAIL_BODY_MAX_CHARS
+) -> List[str]:
+    """Extract text from many payloads in the process pool, keeping input order."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    return await asyncio.gather(
+        *(loop.run_in_executor(pool, extract_text, payload, max_chars) for payload in payloads)
+    )
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
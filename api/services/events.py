@@ -0,0 +1,50 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Set, Tuple
+
+
+class JobEventBus:
+    """
+    In-process pub/sub for job progress events.
+
+    Subscribers are plain asyncio queues registered together with the loop
+    they live on, so workers running on another thread can publish to them
+    safely. An idle subscriber is just a parked coroutine and costs nothing
+    until an event arrives.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    @contextmanager
+    def subscribe(self, job_id: str) -> Iterator[asyncio.Queue]:
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(job_id)
+                if subscribers is not None:
+                    subscribers.discard(entry)
+                    if not subscribers:
+                        del self._subscribers[job_id]
+
+    def publish(self, job_id: str, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop has already been closed
+                pass
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+job_events = JobEventBus()
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from . import metrics
+from .rate_limit import GMAIL_BACKOFF_MAX_SECONDS, GMAIL_MAX_RETRIES, is_retryable, retry_delay
+
+# Headers needed to list a message; everything else is skipped with format=metadata
+METADATA_HEADERS = ["Subject", "From", "Date"]
+
+# Gmail accepts up to 100 calls per batch but recommends staying at or below 50
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+# Quota units charged for each users.messages.get, batched or not
+MESSAGES_GET_UNITS = 5
+
+_discovery_documents: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_discovery_lock = threading.Lock()
+
+def discovery_document(name: str, version: str) -> Dict[str, Any]:
+    """Return the parsed discovery document bundled with googleapiclient, parsing it only once."""
+    key = (name, version)
+    document = _discovery_documents.get(key)
+    if document is None:
+        with _discovery_lock:
+            document = _discovery_documents.get(key)
+            if document is None:
+                raw = get_static_doc(name, version)
+                if raw is None:
+                    raise RuntimeError(f"No bundled discovery document for {name} {version}")
+                document = json.loads(raw)
+                _prime_document(document)
+                _discovery_documents[key] = document
+    return document
+
+def _prime_document(document: Dict[str, Any]):
+    """
+    Build every resource once while the document is still private.
+
+    googleapiclient fills the standard query parameters into the method
+    descriptions the first time a resource is built. Doing that up front
+    means the shared document never changes shape once services built
+    from it are in use on several threads.
+    """
+    def visit(resource, description):
+        for name, nested in description.get("resources", {}).items():
+            visit(getattr(resource, name)(), nested)
+
+    visit(build_from_document(document, developerKey="prime"), document)
+
+def load_discovery_documents():
+    """Parse the discovery documents up front so no request pays for it."""
+    discovery_document("gmail", "v1")
+    discovery_document("oauth2", "v2")
+
+def gmail_service(credentials):
+    """Gmail API client bound to the given credentials, built from the cached discovery document."""
+    return build_from_document(discovery_document("gmail", "v1"), credentials=credentials)
+
+def oauth2_service(credentials):
+    """OAuth2 API client for the given credentials, built from the cached discovery document."""
+    return build_from_document(discovery_document("oauth2", "v2"), credentials=credentials)
+
+def batch_get_messages(
+    service,
+    message_ids: List[str],
+    format: str = "metadata",
+    metadata_headers: Optional[List[str]] = METADATA_HEADERS,
+    batch_size: int = GMAIL_BATCH_SIZE,
+    quota: Optional[Callable[[int], None]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Fetch many messages through Gmail's batch endpoint.
+
+    Results come back in the order of message_ids. A message that could not be
+    fetched is returned as {"id": ..., "error": ...} instead of failing the batch.
+    Messages rejected by rate limits are retried with backoff; quota, when
+    given, is charged for every message before each batch is sent.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(message_ids)
+    errors: Dict[int, Exception] = {}
+
+    def callback(request_id, response, exception):
+        index = int(request_id)
+        if exception is not None:
+            errors[index] = exception
+            results[index] = {"id": message_ids[index], "error": str(exception)}
+        else:
+            errors.pop(index, None)
+            results[index] = response
+
+    def send(indexes: List[int]):
+        for start in range(0, len(indexes), batch_size):
+            chunk = indexes[start:start + batch_size]
+            if quota is not None:
+                quota(MESSAGES_GET_UNITS * len(chunk))
+            batch = service.new_batch_http_request(callback=callback)
+            for index in chunk:
+                params = {"userId": "me", "id": message_ids[index], "format": format}
+                if format == "metadata" and metadata_headers:
+                    params["metadataHeaders"] = metadata_headers
+                batch.add(service.users().messages().get(**params), request_id=str(index))
+            started = time.perf_counter()
+            try:
+                batch.execute()
+            except Exception as e:
+                metrics.record_call(
+                    "google", "gmail.batch", metrics.error_status(e), time.perf_counter() - started
+                )
+                raise
+            failed = sum(1 for index in chunk if index in errors)
+            metrics.record_call("google", "gmail.batch", 200, time.perf_counter() - started)
+            if failed:
+                message_errors.inc(failed)
+
+    send(list(range(len(message_ids))))
+    for attempt in range(GMAIL_MAX_RETRIES):
+        retry = sorted(index for index, error in errors.items() if is_retryable(error))
+        if not retry:
+            break
+        delay = max(
+            retry_delay(errors[index], attempt, GMAIL_BACKOFF_MAX_SECONDS) for index in retry
+        )
+        print(f"Gmail rejected {len(retry)} messages in a batch, retrying in {delay:.1f}s")
+        time.sleep(delay)
+        send(retry)
+
+    return [
+        result
+        if result is not None
+        else {"id": message_ids[index], "error": "No response in batch"}
+        for index, result in enumerate(results)
+    ]
+
+message_errors = metrics.Counter(
+    "audiobrew_gmail_message_errors_total", "Messages Gmail failed to return inside a batch"
+)
+
+def message_summary(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a Gmail message resource to the fields the app shows."""
+    headers = message.get("payload", {}).get("headers", [])
+    subject = next((h["value"] for h in headers if h["name"].lower() == "subject"), "No Subject")
+    from_header = next(
+        (h["value"] for h in headers if h["name"].lower() == "from"), "Unknown Sender"
+    )
+    date = next((h["value"] for h in headers if h["name"].lower() == "date"), "Unknown Date")
+
+    return {
+        "id": message["id"],
+        "subject": subject,
+        "from": from_header,
+        "date": date,
+        "snippet": message.get("snippet", "")
+    }
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from . import metrics
+
+# googleapiclient and google-auth are synchronous, so every Google call runs
+# on this bounded pool instead of the event loop.
+GOOGLE_API_MAX_WORKERS = int(os.getenv("GOOGLE_API_MAX_WORKERS", "16"))
+GOOGLE_API_TIMEOUT = float(os.getenv("GOOGLE_API_TIMEOUT", "30"))
+
+T = TypeVar("T")
+
+class GoogleApiTimeout(Exception):
+    """A Google API call did not finish within its timeout."""
+
+class GoogleExecutor:
+    """Bounded thread pool for blocking Google API calls, with queue-depth counters."""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="google-api"
+        )
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    async def run(
+        self, fn: Callable[..., T], *args: Any, timeout: Optional[float] = None, **kwargs: Any
+    ) -> T:
+        """Run fn(*args, **kwargs) on the pool and wait for it without blocking the loop."""
+
+        # A request's bound execute is one API call; other functions record their own calls
+        endpoint = getattr(getattr(fn, "__self__", None), "methodId", None)
+        submitted = time.perf_counter()
+
+        def call():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+            started = time.perf_counter()
+            queue_wait.observe(started - submitted)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                if endpoint:
+                    metrics.record_call(
+                        "google", endpoint, metrics.error_status(e), time.perf_counter() - started
+                    )
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+            with self._lock:
+                self.completed += 1
+            if endpoint:
+                metrics.record_call("google", endpoint, 200, time.perf_counter() - started)
+            return result
+
+        def on_done(future: Future):
+            # A call cancelled while still queued never ran, so it never left the queue
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+
+        with self._lock:
+            self.queued += 1
+        future = self._executor.submit(call)
+        future.add_done_callback(on_done)
+
+        timeout = timeout or GOOGLE_API_TIMEOUT
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise GoogleApiTimeout(f"Google API call timed out after {timeout}s")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+            }
+
+queue_wait = metrics.Histogram(
+    "audiobrew_google_executor_queue_seconds",
+    "Time Google API calls waited for a free executor thread",
+)
+executor_calls = metrics.Gauge(
+    "audiobrew_google_executor_calls", "Google API calls on the executor", ("state",)
+)
+
+google_executor = GoogleExecutor(GOOGLE_API_MAX_WORKERS)
+
+def _export_metrics():
+    executor_stats = google_executor.stats()
+    executor_calls.set(executor_stats["queued"], state="queued")
+    executor_calls.set(executor_stats["running"], state="running")
+
+metrics.on_scrape(_export_metrics)
+
+async def run_google(
+    fn: Callable[..., T], *args: Any, timeout: Optional[float] = None, **kwargs: Any
+) -> T:
+    """Run a blocking Google API call on the shared executor."""
+    return await google_executor.run(fn, *args, timeout=timeout, **kwargs)
@@ -0,0 +1,351 @@
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import db, metrics
+from .events import job_events
+
+# Job lifecycle. A job is created as "queued", claimed by a worker and then
+# moved through the generation stages until it ends in "done" or "failed".
+QUEUED = "queued"
+FETCHING = "fetching"
+SCRIPTING = "scripting"
+SYNTHESIZING = "synthesizing"
+UPLOADING = "uploading"
+# Account deletion jobs report this single working state instead of the generation stages
+DELETING = "deleting"
+# A running job asked to stop; it fails as soon as its worker notices
+CANCELLING = "cancelling"
+DONE = "done"
+FAILED = "failed"
+
+ACTIVE_STATES = (FETCHING, SCRIPTING, SYNTHESIZING, UPLOADING, DELETING, CANCELLING)
+TERMINAL_STATES = (DONE, FAILED)
+
+# A running job whose worker has not touched it for this long is considered
+# abandoned (crash, reload, ...) and is put back on the queue.
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "900"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+class JobCancelled(Exception):
+    """The job was cancelled while it ran; raised instead of moving it to its next stage."""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    user_id     TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    payload     TEXT NOT NULL DEFAULT '{}',
+    result      TEXT,
+    error       TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker_id   TEXT,
+    created_at  TEXT NOT NULL,
+    updated_at  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs (user_id, created_at DESC);
+"""
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _row_to_job(row) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"]) if job["payload"] else {}
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+def _conn():
+    db.ensure_schema("jobs", SCHEMA)
+    return db.connect()
+
+def _create_job(kind: str, user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    job_id = str(uuid.uuid4())
+    now = _now()
+    conn = _conn()
+    conn.execute(
+        "INSERT INTO jobs (id, kind, user_id, status, payload, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (job_id, kind, user_id, QUEUED, json.dumps(payload), now, now),
+    )
+    return _get_job(job_id)
+
+def _get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    row = _conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row)
+
+def _claim_next_job(worker_id: str, kinds: List[str]) -> Optional[Dict[str, Any]]:
+    conn = _conn()
+    placeholders = ",".join("?" for _ in kinds)
+    # BEGIN IMMEDIATE takes the write lock up front so two workers (or two
+    # processes) can never claim the same row.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            f"SELECT id FROM jobs WHERE status = ? AND kind IN ({placeholders}) "
+            "ORDER BY created_at LIMIT 1",
+            (QUEUED, *kinds),
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker_id = ?, attempts = attempts + 1, updated_at = ? "
+            "WHERE id = ?",
+            (FETCHING, worker_id, _now(), row["id"]),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return _get_job(row["id"])
+
+def _claim_job(job_id: str, worker_id: str) -> Optional[Dict[str, Any]]:
+    cursor = _conn().execute(
+        "UPDATE jobs SET status = ?, worker_id = ?, attempts = attempts + 1, updated_at = ? "
+        "WHERE id = ? AND status = ?",
+        (FETCHING, worker_id, _now(), job_id, QUEUED),
+    )
+    return _get_job(job_id) if cursor.rowcount == 1 else None
+
+def _update_job(
+    job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None
+) -> bool:
+    # Only the worker's final update may move a job out of CANCELLING
+    guard = "" if status in TERMINAL_STATES else " AND status != ?"
+    cursor = _conn().execute(
+        "UPDATE jobs SET status = ?, result = COALESCE(?, result), error = ?, updated_at = ? "
+        f"WHERE id = ?{guard}",
+        (status, json.dumps(result) if result is not None else None, error, _now(), job_id,
+         *(() if status in TERMINAL_STATES else (CANCELLING,))),
+    )
+    return cursor.rowcount == 1
+
+def _release_job(job_id: str) -> Optional[str]:
+    row = _conn().execute(
+        "UPDATE jobs SET status = CASE WHEN status = ? THEN ? ELSE ? END, "
+        "error = CASE WHEN status = ? THEN ? ELSE error END, updated_at = ? "
+        "WHERE id = ? RETURNING status",
+        (CANCELLING, FAILED, QUEUED, CANCELLING, "Job was cancelled", _now(), job_id),
+    ).fetchone()
+    return row["status"] if row else None
+
+def _cancel_jobs(user_id: str, kind: str) -> Tuple[List[str], List[str]]:
+    conn = _conn()
+    placeholders = ",".join("?" for _ in ACTIVE_STATES)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        queued = [row["id"] for row in conn.execute(
+            "SELECT id FROM jobs WHERE user_id = ? AND kind = ? AND status = ?",
+            (user_id, kind, QUEUED),
+        ).fetchall()]
+        running = [row["id"] for row in conn.execute(
+            f"SELECT id FROM jobs WHERE user_id = ? AND kind = ? AND status IN ({placeholders})",
+            (user_id, kind, *ACTIVE_STATES),
+        ).fetchall()]
+        now = _now()
+        conn.executemany(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            [(FAILED, "Job was cancelled", now, job_id) for job_id in queued],
+        )
+        conn.executemany(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+            [(CANCELLING, now, job_id) for job_id in running],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return queued, running
+
+def _count_user_jobs(user_id: str, kind: str, status: str) -> int:
+    return _conn().execute(
+        "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND kind = ? AND status = ?",
+        (user_id, kind, status),
+    ).fetchone()[0]
+
+def _delete_user_jobs(user_id: str, keep: Optional[str] = None) -> int:
+    cursor = _conn().execute("DELETE FROM jobs WHERE user_id = ? AND id IS NOT ?", (user_id, keep))
+    return cursor.rowcount
+
+def _touch_job(job_id: str, worker_id: str) -> Optional[str]:
+    placeholders = ",".join("?" for _ in ACTIVE_STATES)
+    row = _conn().execute(
+        "UPDATE jobs SET updated_at = ? WHERE id = ? AND worker_id = ? "
+        f"AND status IN ({placeholders}) RETURNING status",
+        (_now(), job_id, worker_id, *ACTIVE_STATES),
+    ).fetchone()
+    return row["status"] if row else None
+
+def _requeue_stale_jobs(live_ids: List[str]) -> int:
+    """Put abandoned jobs back on the queue, failing those that ran out of attempts."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=JOB_LEASE_SECONDS)).isoformat()
+    placeholders = ",".join("?" for _ in ACTIVE_STATES)
+    live = ",".join("?" for _ in live_ids)
+    stale = f"status IN ({placeholders}) AND updated_at < ? AND id NOT IN ({live})"
+    conn = _conn()
+    now = _now()
+    # A cancelled job whose worker is gone is never run again
+    conn.execute(
+        f"UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE {stale} AND status = ?",
+        (FAILED, "Job was cancelled", now, *ACTIVE_STATES, cutoff, *live_ids, CANCELLING),
+    )
+    conn.execute(
+        f"UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE {stale} AND attempts >= ?",
+        (FAILED, "Job was abandoned too many times", now, *ACTIVE_STATES, cutoff, *live_ids,
+         JOB_MAX_ATTEMPTS),
+    )
+    cursor = conn.execute(
+        f"UPDATE jobs SET status = ?, worker_id = NULL, updated_at = ? WHERE {stale}",
+        (QUEUED, now, *ACTIVE_STATES, cutoff, *live_ids),
+    )
+    return cursor.rowcount
+
+def _find_unfinished_job(user_id: str, kind: str) -> Optional[Dict[str, Any]]:
+    placeholders = ",".join("?" for _ in TERMINAL_STATES)
+    row = _conn().execute(
+        f"SELECT * FROM jobs WHERE user_id = ? AND kind = ? AND status NOT IN ({placeholders}) "
+        "ORDER BY created_at DESC LIMIT 1",
+        (user_id, kind, *TERMINAL_STATES),
+    ).fetchone()
+    return _row_to_job(row)
+
+def _retry_job(job_id: str) -> bool:
+    cursor = _conn().execute(
+        "UPDATE jobs SET status = ?, error = NULL, attempts = 0, worker_id = NULL, updated_at = ? "
+        "WHERE id = ? AND status = ?",
+        (QUEUED, _now(), job_id, FAILED),
+    )
+    return cursor.rowcount == 1
+
+def _count_jobs(status: str) -> int:
+    return _conn().execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+def _count_unfinished_jobs() -> Dict[Tuple[str, str], int]:
+    placeholders = ",".join("?" for _ in TERMINAL_STATES)
+    rows = _conn().execute(
+        "SELECT kind, status, COUNT(*) AS count FROM jobs "
+        f"WHERE status NOT IN ({placeholders}) GROUP BY kind, status",
+        TERMINAL_STATES,
+    ).fetchall()
+    return {(row["kind"], row["status"]): row["count"] for row in rows}
+
+async def create_job(kind: str, user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Persist a new queued job and return it."""
+    return await db.run(_create_job, kind, user_id, payload)
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Return a job by id, or None if it does not exist."""
+    return await db.run(_get_job, job_id)
+
+async def claim_next_job(worker_id: str, kinds: List[str]) -> Optional[Dict[str, Any]]:
+    """Atomically take the oldest queued job of the given kinds."""
+    return await db.run(_claim_next_job, worker_id, kinds)
+
+async def claim_job(job_id: str, worker_id: str) -> Optional[Dict[str, Any]]:
+    """Take a specific queued job, or None if it is not queued (anymore)."""
+    return await db.run(_claim_job, job_id, worker_id)
+
+async def update_job(
+    job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None
+):
+    """
+    Move a job to a new state, optionally recording its result or error, and
+    notify subscribers. Raises JobCancelled instead of moving a cancelled job
+    (or one that no longer exists) to another working state.
+    """
+    if not await db.run(_update_job, job_id, status, result, error):
+        if status not in TERMINAL_STATES:
+            raise JobCancelled(f"Job {job_id} was cancelled")
+        return
+    job_events.publish(job_id, {"id": job_id, "status": status, "result": result, "error": error})
+
+async def release_job(job_id: str):
+    """Hand a job whose worker is shutting down back to the queue, or fail it if cancelled."""
+    status = await db.run(_release_job, job_id)
+    if status is not None:
+        error = "Job was cancelled" if status == FAILED else None
+        job_events.publish(job_id, {"id": job_id, "status": status, "result": None, "error": error})
+
+async def cancel_jobs(user_id: str, kind: str) -> int:
+    """
+    Cancel a user's unfinished jobs of one kind. Queued jobs fail at once;
+    running ones are marked CANCELLING until their worker stops them.
+    Returns how many are still running.
+    """
+    queued, running = await db.run(_cancel_jobs, user_id, kind)
+    for job_id in queued:
+        job_events.publish(
+            job_id, {"id": job_id, "status": FAILED, "result": None, "error": "Job was cancelled"}
+        )
+    for job_id in running:
+        job_events.publish(
+            job_id, {"id": job_id, "status": CANCELLING, "result": None, "error": None}
+        )
+    return len(running)
+
+async def count_user_jobs(user_id: str, kind: str, status: str) -> int:
+    return await db.run(_count_user_jobs, user_id, kind, status)
+
+async def delete_user_jobs(user_id: str, keep: Optional[str] = None) -> int:
+    """Delete every job row of a user, with its payload and result, except the job given as keep."""
+    return await db.run(_delete_user_jobs, user_id, keep)
+
+async def find_unfinished_job(user_id: str, kind: str) -> Optional[Dict[str, Any]]:
+    """Return the user's most recent job of this kind that is still queued or running."""
+    return await db.run(_find_unfinished_job, user_id, kind)
+
+async def retry_job(job_id: str) -> bool:
+    """Put a failed job back on the queue, keeping its last result. False if it had not failed."""
+    retried = await db.run(_retry_job, job_id)
+    if retried:
+        job_events.publish(job_id, {"id": job_id, "status": QUEUED, "result": None, "error": None})
+    return retried
+
+async def touch_job(job_id: str, worker_id: str) -> Optional[str]:
+    """
+    Renew the lease on a running job and return its status, or None once
+    this worker no longer holds it.
+    """
+    return await db.run(_touch_job, job_id, worker_id)
+
+async def requeue_stale_jobs(live_ids: Optional[List[str]] = None) -> int:
+    """Requeue jobs whose lease ran out, except the given ones known to still be running."""
+    return await db.run(_requeue_stale_jobs, list(live_ids or []))
+
+async def count_jobs(status: str) -> int:
+    return await db.run(_count_jobs, status)
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a job row for API responses."""
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+unfinished_jobs = metrics.Gauge(
+    "audiobrew_jobs_unfinished",
+    "Queued and running jobs in the shared job table, across all processes",
+    ("kind", "status"),
+)
+
+def _export_metrics():
+    counts = _count_unfinished_jobs()
+    # A stage that emptied out reads 0 rather than its last count
+    unfinished_jobs.zero()
+    for (kind, status), count in counts.items():
+        unfinished_jobs.set(count, kind=kind, status=status)
+
+metrics.on_scrape(_export_metrics)
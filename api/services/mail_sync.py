@@ -0,0 +1,374 @@
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from googleapiclient.errors import HttpError
+
+from . import db
+from .gmail_api import batch_get_messages, message_summary
+from .google_executor import run_google
+from .rate_limit import execute_google, gmail_quota
+
+# Upper bound on how many messages a full resync pulls into the local store
+GMAIL_SYNC_MAX_MESSAGES = int(os.getenv("GMAIL_SYNC_MAX_MESSAGES", "500"))
+# A full resync fetches the page being shown right away and the rest in the background,
+# this many messages per Gmail call
+GMAIL_SYNC_BACKFILL_PAGE = int(os.getenv("GMAIL_SYNC_BACKFILL_PAGE", "100"))
+# Messages Gmail failed to return are retried on later syncs, up to this many times in all
+GMAIL_SYNC_FETCH_ATTEMPTS = int(os.getenv("GMAIL_SYNC_FETCH_ATTEMPTS", "3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gmail_messages (
+    user_id        TEXT NOT NULL,
+    label_id       TEXT NOT NULL,
+    message_id     TEXT NOT NULL,
+    subject        TEXT NOT NULL,
+    sender         TEXT NOT NULL,
+    date           TEXT NOT NULL,
+    snippet        TEXT NOT NULL,
+    size_estimate  INTEGER NOT NULL DEFAULT 0,
+    internal_date  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, label_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS idx_gmail_messages_listing
+    ON gmail_messages (user_id, label_id, internal_date DESC);
+
+CREATE TABLE IF NOT EXISTS gmail_sync_state (
+    user_id     TEXT NOT NULL,
+    label_id    TEXT NOT NULL,
+    history_id  TEXT NOT NULL,
+    synced_at   TEXT NOT NULL,
+    PRIMARY KEY (user_id, label_id)
+);
+
+CREATE TABLE IF NOT EXISTS gmail_sync_backfill (
+    user_id     TEXT NOT NULL,
+    label_id    TEXT NOT NULL,
+    page_token  TEXT NOT NULL,
+    fetched     INTEGER NOT NULL,
+    PRIMARY KEY (user_id, label_id)
+);
+
+CREATE TABLE IF NOT EXISTS gmail_sync_failed (
+    user_id     TEXT NOT NULL,
+    label_id    TEXT NOT NULL,
+    message_id  TEXT NOT NULL,
+    attempts    INTEGER NOT NULL,
+    PRIMARY KEY (user_id, label_id, message_id)
+);
+"""
+
+# One sync at a time per (user, label); a second caller waits and then finds nothing new
+_sync_locks: Dict[Tuple[str, str], threading.Lock] = defaultdict(threading.Lock)
+_sync_locks_guard = threading.Lock()
+
+# Running background backfills, so a label is only backfilled once at a time
+_backfills: Dict[Tuple[str, str], asyncio.Task] = {}
+
+def _conn():
+    db.ensure_schema("gmail_messages", SCHEMA)
+    return db.connect()
+
+def _store_messages(user_id: str, label_id: str, messages: List[Dict[str, Any]]) -> int:
+    """Upsert fetched messages, remember the ones that could not be fetched and return how many."""
+    rows = []
+    failed = []
+    for message in messages:
+        if "error" in message:
+            print(f"Failed to fetch email {message['id']} during sync: {message['error']}")
+            failed.append(message["id"])
+            continue
+        # Left the label between listing and fetching
+        if label_id not in message.get("labelIds", [label_id]):
+            continue
+        summary = message_summary(message)
+        rows.append((
+            user_id, label_id, summary["id"], summary["subject"], summary["from"],
+            summary["date"], summary["snippet"], int(message.get("sizeEstimate", 0)),
+            int(message.get("internalDate", 0)),
+        ))
+    conn = _conn()
+    conn.executemany(
+        "INSERT OR REPLACE INTO gmail_messages (user_id, label_id, message_id, subject, sender, "
+        "date, snippet, size_estimate, internal_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.executemany(
+        "DELETE FROM gmail_sync_failed WHERE user_id = ? AND label_id = ? AND message_id = ?",
+        [(user_id, label_id, message["id"]) for message in messages if "error" not in message],
+    )
+    conn.executemany(
+        "INSERT INTO gmail_sync_failed (user_id, label_id, message_id, attempts) "
+        "VALUES (?, ?, ?, 1) ON CONFLICT (user_id, label_id, message_id) "
+        "DO UPDATE SET attempts = attempts + 1",
+        [(user_id, label_id, message_id) for message_id in failed],
+    )
+    cursor = conn.execute(
+        "DELETE FROM gmail_sync_failed WHERE user_id = ? AND label_id = ? AND attempts >= ?",
+        (user_id, label_id, GMAIL_SYNC_FETCH_ATTEMPTS),
+    )
+    if cursor.rowcount:
+        print(f"Gave up on {cursor.rowcount} emails in label {label_id} for user {user_id}")
+    return len(failed)
+
+def _failed_message_ids(user_id: str, label_id: str) -> List[str]:
+    rows = _conn().execute(
+        "SELECT message_id FROM gmail_sync_failed WHERE user_id = ? AND label_id = ?",
+        (user_id, label_id),
+    ).fetchall()
+    return [row["message_id"] for row in rows]
+
+def _set_backfill(user_id: str, label_id: str, page_token: Optional[str], fetched: int):
+    conn = _conn()
+    if page_token and fetched < GMAIL_SYNC_MAX_MESSAGES:
+        conn.execute(
+            "INSERT OR REPLACE INTO gmail_sync_backfill (user_id, label_id, page_token, fetched) "
+            "VALUES (?, ?, ?, ?)",
+            (user_id, label_id, page_token, fetched),
+        )
+    else:
+        conn.execute(
+            "DELETE FROM gmail_sync_backfill WHERE user_id = ? AND label_id = ?",
+            (user_id, label_id),
+        )
+
+def _get_backfill(user_id: str, label_id: str):
+    return _conn().execute(
+        "SELECT page_token, fetched FROM gmail_sync_backfill WHERE user_id = ? AND label_id = ?",
+        (user_id, label_id),
+    ).fetchone()
+
+def _set_history_id(user_id: str, label_id: str, history_id: str):
+    _conn().execute(
+        "INSERT OR REPLACE INTO gmail_sync_state (user_id, label_id, history_id, synced_at) "
+        "VALUES (?, ?, ?, ?)",
+        (user_id, label_id, str(history_id), datetime.now(timezone.utc).isoformat()),
+    )
+
+def _list_page(service, quota, label_id: str, page_size: int, page_token: Optional[str]):
+    response = execute_google(service.users().messages().list(
+        userId="me",
+        labelIds=[label_id],
+        maxResults=min(500, page_size),
+        pageToken=page_token,
+    ), quota, 5)
+    message_ids = [message["id"] for message in response.get("messages", [])]
+    return message_ids, response.get("nextPageToken")
+
+def _full_sync(service, user_id: str, label_id: str, page_size: int) -> Dict[str, int]:
+    # Take the history id before listing so changes made while listing are picked up next time
+    quota = gmail_quota(user_id)
+    history_id = execute_google(service.users().getProfile(userId="me"), quota, 1)["historyId"]
+
+    page_size = min(page_size, GMAIL_SYNC_MAX_MESSAGES)
+    message_ids, page_token = _list_page(service, quota, label_id, page_size, None)
+    messages = batch_get_messages(service, message_ids, quota=quota)
+    conn = _conn()
+    conn.execute("BEGIN")
+    try:
+        conn.execute(
+            "DELETE FROM gmail_messages WHERE user_id = ? AND label_id = ?", (user_id, label_id)
+        )
+        conn.execute(
+            "DELETE FROM gmail_sync_failed WHERE user_id = ? AND label_id = ?", (user_id, label_id)
+        )
+        failed = _store_messages(user_id, label_id, messages)
+        # Older pages are fetched by backfill_page; changes to them from here on come in as history
+        _set_backfill(user_id, label_id, page_token, len(message_ids))
+        _set_history_id(user_id, label_id, history_id)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return {"mode": "full", "added": len(message_ids) - failed, "removed": 0, "failed": failed}
+
+def _incremental_sync(
+    service, user_id: str, label_id: str, start_history_id: str
+) -> Dict[str, int]:
+    added: Set[str] = set()
+    removed: Set[str] = set()
+    history_id = start_history_id
+    page_token = None
+    quota = gmail_quota(user_id)
+
+    while True:
+        response = execute_google(service.users().history().list(
+            userId="me",
+            startHistoryId=start_history_id,
+            labelId=label_id,
+            historyTypes=["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
+            pageToken=page_token,
+        ), quota, 2)
+
+        # Replay the changes in order so the last one wins for each message
+        for record in response.get("history", []):
+            for change in record.get("messagesAdded", []):
+                if label_id in change["message"].get("labelIds", []):
+                    added.add(change["message"]["id"])
+                    removed.discard(change["message"]["id"])
+            for change in record.get("labelsAdded", []):
+                if label_id in change.get("labelIds", []):
+                    added.add(change["message"]["id"])
+                    removed.discard(change["message"]["id"])
+            for change in record.get("labelsRemoved", []):
+                if label_id in change.get("labelIds", []):
+                    removed.add(change["message"]["id"])
+                    added.discard(change["message"]["id"])
+            for change in record.get("messagesDeleted", []):
+                removed.add(change["message"]["id"])
+                added.discard(change["message"]["id"])
+
+        history_id = response.get("historyId", history_id)
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+    # Messages earlier syncs failed to fetch are tried again along with the new ones
+    retried = set(_failed_message_ids(user_id, label_id)) - added - removed
+    fetch = sorted(added | retried)
+    messages = batch_get_messages(service, fetch, quota=quota) if fetch else []
+    conn = _conn()
+    conn.execute("BEGIN")
+    try:
+        if removed:
+            conn.executemany(
+                "DELETE FROM gmail_messages WHERE user_id = ? AND label_id = ? AND message_id = ?",
+                [(user_id, label_id, message_id) for message_id in removed],
+            )
+            conn.executemany(
+                "DELETE FROM gmail_sync_failed "
+                "WHERE user_id = ? AND label_id = ? AND message_id = ?",
+                [(user_id, label_id, message_id) for message_id in removed],
+            )
+        failed = _store_messages(user_id, label_id, messages)
+        _set_history_id(user_id, label_id, history_id)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return {
+        "mode": "incremental",
+        "added": len(fetch) - failed,
+        "removed": len(removed),
+        "failed": failed,
+    }
+
+def _label_lock(user_id: str, label_id: str) -> threading.Lock:
+    with _sync_locks_guard:
+        return _sync_locks[(user_id, label_id)]
+
+def sync_label(service, user_id: str, label_id: str, page_size: int = 10) -> Dict[str, int]:
+    """
+    Bring the local copy of a label's message metadata up to date.
+
+    Uses users.history.list from the last stored historyId, so Gmail traffic
+    is proportional to new mail. Falls back to a full resync the first time
+    and whenever Gmail reports the stored historyId as expired (404); that
+    only fetches the newest page_size messages and leaves the rest to
+    backfill_page ("backfill" in the result is true while some are left).
+    Blocking: run it on the Google executor.
+    """
+    with _label_lock(user_id, label_id):
+        row = _conn().execute(
+            "SELECT history_id FROM gmail_sync_state WHERE user_id = ? AND label_id = ?",
+            (user_id, label_id),
+        ).fetchone()
+
+        result = None
+        if row is not None:
+            try:
+                result = _incremental_sync(service, user_id, label_id, row["history_id"])
+            except HttpError as error:
+                if error.resp is None or error.resp.status != 404:
+                    raise
+                print(
+                    f"History {row['history_id']} expired for user {user_id}, "
+                    "running a full resync"
+                )
+
+        if result is None:
+            result = _full_sync(service, user_id, label_id, page_size)
+        result["backfill"] = _get_backfill(user_id, label_id) is not None
+        return result
+
+def backfill_page(service, user_id: str, label_id: str) -> bool:
+    """
+    Fetch the next page of messages a full resync left out. Returns whether
+    more are left. Blocking: run it on the Google executor.
+    """
+    with _label_lock(user_id, label_id):
+        row = _get_backfill(user_id, label_id)
+        if row is None:
+            return False
+        quota = gmail_quota(user_id)
+        page_size = min(GMAIL_SYNC_BACKFILL_PAGE, GMAIL_SYNC_MAX_MESSAGES - row["fetched"])
+        message_ids, page_token = _list_page(service, quota, label_id, page_size, row["page_token"])
+        messages = batch_get_messages(service, message_ids, quota=quota)
+        conn = _conn()
+        conn.execute("BEGIN")
+        try:
+            # The label may have been forgotten, or resynced by another process, meanwhile
+            if _get_backfill(user_id, label_id) is None:
+                conn.execute("COMMIT")
+                return False
+            _store_messages(user_id, label_id, messages)
+            _set_backfill(user_id, label_id, page_token, row["fetched"] + len(message_ids))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return _get_backfill(user_id, label_id) is not None
+
+async def _backfill(service, user_id: str, label_id: str):
+    try:
+        while await run_google(backfill_page, service, user_id, label_id):
+            pass
+    except Exception as e:
+        print(f"Error backfilling label {label_id} for user {user_id}: {str(e)}")
+
+def start_backfill(service, user_id: str, label_id: str):
+    """
+    Backfill a label in the background, a page at a time. If the process
+    stops first, the next sync reports "backfill" again and it resumes.
+    """
+    key = (user_id, label_id)
+    if key in _backfills:
+        return
+    task = asyncio.create_task(_backfill(service, user_id, label_id))
+    _backfills[key] = task
+    task.add_done_callback(lambda _: _backfills.pop(key, None))
+
+def _list_messages(user_id: str, label_id: str, limit: int) -> List[Dict[str, Any]]:
+    rows = _conn().execute(
+        "SELECT message_id, subject, sender, date, snippet FROM gmail_messages "
+        "WHERE user_id = ? AND label_id = ? ORDER BY internal_date DESC LIMIT ?",
+        (user_id, label_id, limit),
+    ).fetchall()
+    return [
+        {
+            "id": row["message_id"],
+            "subject": row["subject"],
+            "from": row["sender"],
+            "date": row["date"],
+            "snippet": row["snippet"],
+        }
+        for row in rows
+    ]
+
+def _forget_user(user_id: str):
+    conn = _conn()
+    conn.execute("DELETE FROM gmail_messages WHERE user_id = ?", (user_id,))
+    conn.execute("DELETE FROM gmail_sync_state WHERE user_id = ?", (user_id,))
+    conn.execute("DELETE FROM gmail_sync_backfill WHERE user_id = ?", (user_id,))
+    conn.execute("DELETE FROM gmail_sync_failed WHERE user_id = ?", (user_id,))
+
+async def list_messages(user_id: str, label_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """Newest synced messages in a label, from the local store."""
+    return await db.run(_list_messages, user_id, label_id, limit)
+
+async def forget_user(user_id: str):
+    """Drop everything synced for a user (on disconnect or account deletion)."""
+    await db.run(_forget_user, user_id)
@@ -0,0 +1,232 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from . import profiles
+
+# Prometheus text exposition format, rendered here so the API needs no client library
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Seconds, from fast Supabase reads up to whole generation jobs
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry: List["Metric"] = []
+_collectors: List[Callable[[], None]] = []
+_registry_lock = threading.Lock()
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(float(value))
+    return str(int(value))
+
+class Metric:
+    """A named metric family with a fixed set of label names. Safe to update from any thread."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def set(self, value: float, **labels):
+        """Replace the value, e.g. with a count kept elsewhere and copied in at scrape time."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def zero(self):
+        """Set every series seen so far to 0, before copying in a fresh snapshot."""
+        with self._lock:
+            for key in self._values:
+                self._values[key] = 0
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+class Counter(Metric):
+    type = "counter"
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One count per bucket, then +Inf, then the sum
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> Iterator[str]:
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                labels = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {_format_value(cumulative)}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(values[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {_format_value(cumulative)}"
+
+def on_scrape(collector: Callable[[], None]):
+    """
+    Run collector before every scrape, to copy state kept elsewhere (cache
+    stats, limiter saturation, ...) into metrics. Collectors run on a worker
+    thread, so they may block briefly.
+    """
+    with _registry_lock:
+        _collectors.append(collector)
+
+def render() -> str:
+    """All metrics in the Prometheus text format. Blocking: run it off the event loop."""
+    with _registry_lock:
+        collectors = list(_collectors)
+        metrics = list(_registry)
+    for collector in collectors:
+        try:
+            collector()
+        except Exception as e:
+            name = getattr(collector, "__qualname__", collector)
+            print(f"Metrics collector {name} failed: {str(e)}")
+
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+span_seconds = Histogram(
+    "audiobrew_span_seconds", "Duration of instrumented pipeline stages", ("span", "outcome")
+)
+outbound_request_seconds = Histogram(
+    "audiobrew_outbound_request_seconds",
+    "Time until an outbound call to a provider returned a response or failed",
+    ("provider", "endpoint", "status"),
+)
+outbound_bytes = Counter(
+    "audiobrew_outbound_bytes_total",
+    "Bytes sent to and received from providers",
+    ("provider", "endpoint", "direction"),
+)
+llm_tokens = Counter(
+    "audiobrew_llm_tokens_total", "Tokens used by chat completions", ("model", "kind")
+)
+tts_characters = Counter(
+    "audiobrew_tts_characters_total", "Characters sent for speech synthesis", ("model",)
+)
+
+@contextmanager
+def span(name: str):
+    """
+    Time a block into audiobrew_span_seconds, labelled with whether it raised.
+    The time is also added to the current job's profile, under the last part of the name.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        span_seconds.observe(seconds, span=name, outcome=outcome)
+        profiles.count_in("stages", name.rpartition(".")[2], round(seconds, 3))
+
+def record_call(
+    provider: str, endpoint: str, status: object, seconds: float, sent: int = 0, received: int = 0
+):
+    """Record one outbound call: its latency by status and the bytes it moved."""
+    outbound_request_seconds.observe(seconds, provider=provider, endpoint=endpoint, status=status)
+    if sent:
+        outbound_bytes.inc(sent, provider=provider, endpoint=endpoint, direction="sent")
+    if received:
+        outbound_bytes.inc(received, provider=provider, endpoint=endpoint, direction="received")
+
+def error_status(error: BaseException) -> str:
+    """Status label for a failed call: the HTTP status when there was one, else the error type."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        resp = getattr(error, "resp", None)
+        status = getattr(resp, "status", None)
+    return str(status) if status is not None else error.__class__.__name__
+
+def record_usage(model: str, usage):
+    """Count the tokens reported in a chat completion's usage, if any."""
+    if usage is None:
+        return
+    llm_tokens.inc(usage.prompt_tokens or 0, model=model, kind="prompt")
+    llm_tokens.inc(usage.completion_tokens or 0, model=model, kind="completion")
+    profiles.add_tokens(model, usage.prompt_tokens or 0, usage.completion_tokens or 0)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{CONTENT_TYPE}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics on its own port from a daemon thread, for processes without the web app."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"Serving metrics on port {port}")
+    return server
@@ -0,0 +1,98 @@
+from typing import BinaryIO, Optional, Tuple
+
+# Enough of a file to find the first frames behind any ID3v2 header
+HEAD_BYTES = 16 * 1024
+
+# Layer III bitrates in kbps, indexed by the header's bitrate field
+_BITRATES_V1 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+_BITRATES_V2 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+
+# Sample rates indexed by the header's version field, then its sample-rate field
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG 1
+    2: [22050, 24000, 16000],  # MPEG 2
+    0: [11025, 12000, 8000],   # MPEG 2.5
+}
+
+def frame_length(data: bytes, offset: int) -> Optional[int]:
+    """Length of the MPEG audio Layer III frame at offset, or None without a valid header."""
+    if offset + 4 > len(data):
+        return None
+    b1, b2 = data[offset + 1], data[offset + 2]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    padding = (b2 >> 1) & 0x01
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    if version == 3:
+        return 144000 * _BITRATES_V1[bitrate_index] // sample_rate + padding
+    return 72000 * _BITRATES_V2[bitrate_index] // sample_rate + padding
+
+def _id3v2_size(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    # Synchsafe size: 7 bits per byte, excluding the 10-byte header and optional footer
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    has_footer = data[5] & 0x10
+    return 10 + size + (10 if has_footer else 0)
+
+def _first_frame(data: bytes, start: int) -> Optional[int]:
+    """Offset of the first frame header that is followed by another valid header."""
+    offset = data.find(b"\xff", start)
+    while offset != -1:
+        length = frame_length(data, offset)
+        if length and (offset + length == len(data) or frame_length(data, offset + length)):
+            return offset
+        offset = data.find(b"\xff", offset + 1)
+    return None
+
+def _is_info_frame(data: bytes, offset: int) -> bool:
+    """True for the Xing/Info/VBRI header frame encoders put before the audio."""
+    b1, b3 = data[offset + 1], data[offset + 3]
+    mpeg1 = ((b1 >> 3) & 0x03) == 3
+    mono = (b3 >> 6) == 3
+    if mpeg1:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    tag_offset = offset + 4 + side_info
+    xing = data[tag_offset:tag_offset + 4] in (b"Xing", b"Info")
+    return xing or data[offset + 36:offset + 40] == b"VBRI"
+
+def has_audio_frame(head: bytes) -> bool:
+    """True if the first bytes of a file look like MP3 audio."""
+    offset = _id3v2_size(head)
+    # The ID3 tag may be longer than what has been received so far
+    return offset >= len(head) or _first_frame(head, offset) is not None
+
+def audio_span(file: BinaryIO, size: int) -> Tuple[int, int]:
+    """
+    Byte range [start, end) of the audio frames in a seekable MP3 file.
+
+    Excludes the ID3v2 header, an ID3v1 trailer and the Xing/Info frame, whose
+    frame count would be wrong once several files are joined. Copying these
+    ranges back to back joins MP3 files without re-encoding.
+    """
+    file.seek(0)
+    start = _id3v2_size(file.read(10))
+    end = size
+    if size - start >= 128:
+        file.seek(size - 128)
+        if file.read(3) == b"TAG":
+            end -= 128
+
+    file.seek(start)
+    head = file.read(min(HEAD_BYTES, end - start))
+    offset = _first_frame(head, 0)
+    if offset is None:
+        raise ValueError("No MPEG audio frames found")
+    if _is_info_frame(head, offset):
+        offset += frame_length(head, offset)
+    return start + offset, end
@@ -0,0 +1,54 @@
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+# The profile being collected by the current job. Tasks started by the job
+# copy the context, so they add to the same profile; calls running on the
+# Google executor threads do not, and show up only in their stage's time.
+_current: ContextVar[Optional[Dict[str, Any]]] = ContextVar("generation_profile", default=None)
+
+def new_profile() -> Dict[str, Any]:
+    return {
+        "attempts": 0,
+        "wall_seconds": 0.0,
+        "stages": {},
+        "tokens": {},
+        "tts_characters": 0,
+        "uploaded_bytes": 0,
+        "retries": {},
+        "cache": {},
+    }
+
+def start(previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Collect into a profile, fresh or carried over from an earlier attempt, from here on."""
+    profile = previous or new_profile()
+    profile["attempts"] += 1
+    _current.set(profile)
+    return profile
+
+def current() -> Optional[Dict[str, Any]]:
+    return _current.get()
+
+def count(field: str, amount: float = 1):
+    """Add to a top-level number in the current profile, if there is one."""
+    profile = _current.get()
+    if profile is not None:
+        profile[field] = profile.get(field, 0) + amount
+
+def count_in(group: str, key: str, amount: float = 1):
+    """Add to a number inside one of the profile's groups (stages, retries, cache)."""
+    profile = _current.get()
+    if profile is not None:
+        values = profile.setdefault(group, {})
+        values[key] = values.get(key, 0) + amount
+
+def set_in(group: str, key: str, value: Any):
+    profile = _current.get()
+    if profile is not None:
+        profile.setdefault(group, {})[key] = value
+
+def add_tokens(model: str, prompt: int, completion: int):
+    profile = _current.get()
+    if profile is not None:
+        tokens = profile["tokens"].setdefault(model, {"prompt": 0, "completion": 0})
+        tokens["prompt"] += prompt
+        tokens["completion"] += completion
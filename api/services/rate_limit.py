@@ -0,0 +1,387 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+from googleapiclient.errors import HttpError
+
+from . import metrics, profiles
+
+# Retries for rate-limited or failed provider calls. The OpenAI client's own
+# retries are turned off so these are the only ones.
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+GMAIL_MAX_RETRIES = int(os.getenv("GMAIL_MAX_RETRIES", "3"))
+BACKOFF_BASE_SECONDS = float(os.getenv("BACKOFF_BASE_SECONDS", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("BACKOFF_MAX_SECONDS", "60"))
+# Gmail retries sleep on a Google executor thread, so keep them well inside GOOGLE_API_TIMEOUT
+GMAIL_BACKOFF_MAX_SECONDS = float(os.getenv("GMAIL_BACKOFF_MAX_SECONDS", "10"))
+
+# Gmail allows 250 quota units per user per second (messages.get costs 5)
+GMAIL_USER_UNITS_PER_SECOND = float(os.getenv("GMAIL_USER_UNITS_PER_SECOND", "250"))
+GMAIL_QUOTA_TRACKED_USERS = int(os.getenv("GMAIL_QUOTA_TRACKED_USERS", "10000"))
+
+# Requests and tokens per minute for each provider model; override with
+# e.g. RATE_LIMIT_OPENAI_GPT_4O_RPM / RATE_LIMIT_OPENAI_GPT_4O_TPM (0 = unlimited).
+# Limits apply per process: with several worker processes, divide them up.
+DEFAULT_LIMITS = {
+    ("openai", "gpt-4o"): (500, 30000),
+    ("openai", "gpt-4o-mini"): (500, 200000),
+    ("openai", "tts-1"): (500, 0),
+    ("openai", "tts-1-hd"): (500, 0),
+    # Gmail's project-wide quota: 1,200,000 units per minute shared by every user, on top of
+    # each user's own GMAIL_USER_UNITS_PER_SECOND; tokens are quota units
+    ("google", "gmail"): (0, 1200000),
+}
+
+T = TypeVar("T")
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a per-minute rate. Safe to share
+    between threads and event loops.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, amount: float) -> float:
+        """Take amount if available and return 0, otherwise return how long until it will be."""
+        # A request bigger than the bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def refund(self, amount: float):
+        """Return tokens taken for a request that did not go ahead."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def saturation(self) -> float:
+        """Share of the bucket currently used up, 0 (idle) to 1 (exhausted)."""
+        with self._lock:
+            self._refill()
+            return round(1 - self._tokens / self.capacity, 3)
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one provider model."""
+
+    def __init__(self, name: str, rpm: float, tpm: float = 0, token_burst: Optional[float] = None):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm, token_burst) if tpm else None
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.throttled = 0
+        self.waiting = 0
+        self.waited_seconds = 0.0
+
+    def _wait_time(self, tokens: float) -> float:
+        # Take from both buckets or from neither
+        wait = self.requests.try_take(1) if self.requests else 0.0
+        if wait:
+            return wait
+        if self.tokens and tokens:
+            wait = self.tokens.try_take(tokens)
+            if wait and self.requests:
+                self.requests.refund(1)
+        return wait
+
+    def _record(self, waited: float):
+        with self._lock:
+            self.acquired += 1
+            if waited > 0:
+                self.throttled += 1
+                self.waited_seconds += waited
+
+    async def acquire(self, tokens: float = 0):
+        """Wait until one request using this many tokens fits within the limits."""
+        wait = self._wait_time(tokens)
+        if not wait:
+            self._record(0)
+            return
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self._wait_time(tokens)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        self._record(time.monotonic() - started)
+
+    def acquire_blocking(self, tokens: float = 0):
+        """acquire() for code running on a worker thread."""
+        wait = self._wait_time(tokens)
+        if not wait:
+            self._record(0)
+            return
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            while wait:
+                time.sleep(wait)
+                wait = self._wait_time(tokens)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        self._record(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests_saturation": self.requests.saturation() if self.requests else None,
+                "tokens_saturation": self.tokens.saturation() if self.tokens else None,
+                "waiting": self.waiting,
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+_limiters: Dict[str, RateLimiter] = {}
+_gmail_users: "OrderedDict[str, RateLimiter]" = OrderedDict()
+_registry_lock = threading.Lock()
+
+def _limit_from_env(provider: str, model: str, kind: str, default: float) -> float:
+    name = re.sub(r"[^A-Z0-9]+", "_", f"RATE_LIMIT_{provider}_{model}_{kind}".upper())
+    return float(os.getenv(name, str(default)))
+
+def limiter(provider: str, model: str) -> RateLimiter:
+    """The process-wide limiter for a provider model."""
+    name = f"{provider}:{model}"
+    with _registry_lock:
+        if name not in _limiters:
+            rpm, tpm = DEFAULT_LIMITS.get((provider, model), (500, 0))
+            _limiters[name] = RateLimiter(
+                name,
+                _limit_from_env(provider, model, "rpm", rpm),
+                _limit_from_env(provider, model, "tpm", tpm),
+            )
+        return _limiters[name]
+
+def gmail_quota(user_id: str) -> Callable[[int], None]:
+    """
+    Charge function for Gmail quota units, taken from both the user's bucket and the
+    project-wide one. Blocks until the units are available, so call it from the Google
+    executor threads.
+    """
+    project_limiter = limiter("google", "gmail")
+    with _registry_lock:
+        user_limiter = _gmail_users.get(user_id)
+        if user_limiter is None:
+            # Quota units are the tokens; bursts are capped at one second's worth, like Gmail's
+            # own window
+            user_limiter = RateLimiter(
+                f"gmail:{user_id}", 0, GMAIL_USER_UNITS_PER_SECOND * 60, GMAIL_USER_UNITS_PER_SECOND
+            )
+            _gmail_users[user_id] = user_limiter
+            while len(_gmail_users) > GMAIL_QUOTA_TRACKED_USERS:
+                _gmail_users.popitem(last=False)
+        _gmail_users.move_to_end(user_id)
+
+    def charge(units: int):
+        user_limiter.acquire_blocking(units)
+        project_limiter.acquire_blocking(units)
+
+    return charge
+
+def _retry_after(headers) -> Optional[float]:
+    """Seconds to wait according to Retry-After (or OpenAI's retry-after-ms), if present."""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, timeouts and server errors are worth retrying; other errors are not."""
+    if isinstance(error, openai.RateLimitError):
+        # Out of credit is reported as a 429 too, but waiting won't fix it
+        return getattr(error, "code", None) != "insufficient_quota"
+    if isinstance(
+        error, (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+    ):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    if isinstance(error, HttpError) and error.resp is not None:
+        status = error.resp.status
+        if status == 403:
+            # Gmail reports per-user rate limits as 403 rateLimitExceeded / userRateLimitExceeded
+            return b"ratelimitexceeded" in (error.content or b"").lower()
+        return status == 429 or status >= 500
+    return False
+
+def retry_delay(
+    error: BaseException, attempt: int, max_delay: float = BACKOFF_MAX_SECONDS
+) -> float:
+    """Retry-After when the provider sent one, otherwise exponential backoff with full jitter."""
+    headers = None
+    if isinstance(error, openai.APIStatusError):
+        headers = error.response.headers
+    elif isinstance(error, HttpError):
+        headers = error.resp
+    delay = _retry_after(headers)
+    if delay is None:
+        delay = random.uniform(0, BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return min(delay, max_delay)
+
+async def with_backoff(
+    call: Callable[[], Awaitable[T]],
+    limiter: Optional[RateLimiter] = None,
+    tokens: float = 0,
+    retries: int = OPENAI_MAX_RETRIES,
+    endpoint: str = "",
+) -> T:
+    """
+    Run call, first waiting for the limiter, and retry retryable failures with backoff.
+    Every attempt is recorded in the outbound call metrics under the limiter's provider.
+    """
+    provider = limiter.name.split(":")[0] if limiter else "unknown"
+    endpoint = endpoint or (limiter.name.split(":", 1)[-1] if limiter else "")
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire(tokens)
+        started = time.perf_counter()
+        try:
+            result = await call()
+            metrics.record_call(provider, endpoint, 200, time.perf_counter() - started)
+            return result
+        except Exception as e:
+            metrics.record_call(
+                provider, endpoint, metrics.error_status(e), time.perf_counter() - started
+            )
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            name = limiter.name if limiter else "Call"
+            print(f"{name} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            profiles.count_in("retries", f"{provider}:{endpoint}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+def execute_google(
+    request,
+    quota: Optional[Callable[[int], None]] = None,
+    units: int = 1,
+    retries: int = GMAIL_MAX_RETRIES,
+):
+    """
+    Execute a Google API request, charging its quota units first (per user and project-wide
+    with gmail_quota) and retrying rate limits and server errors with backoff. Blocking: run
+    it on the Google executor.
+    """
+    endpoint = getattr(request, "methodId", "") or "unknown"
+    attempt = 0
+    while True:
+        if quota is not None:
+            quota(units)
+        started = time.perf_counter()
+        try:
+            result = request.execute()
+            metrics.record_call("google", endpoint, 200, time.perf_counter() - started)
+            return result
+        except Exception as e:
+            metrics.record_call(
+                "google", endpoint, metrics.error_status(e), time.perf_counter() - started
+            )
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt, GMAIL_BACKOFF_MAX_SECONDS)
+            print(f"Google API call failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+def stats() -> Dict[str, Any]:
+    """Live state of every limiter, for the health endpoint."""
+    with _registry_lock:
+        limiters = dict(_limiters)
+        gmail_users = list(_gmail_users.values())
+    gmail_stats = [user_limiter.stats() for user_limiter in gmail_users]
+    return {
+        **{name: rate_limiter.stats() for name, rate_limiter in limiters.items()},
+        "gmail_users": {
+            "tracked": len(gmail_stats),
+            "waiting": sum(s["waiting"] for s in gmail_stats),
+            "throttled": sum(s["throttled"] for s in gmail_stats),
+            "max_saturation": max((s["tokens_saturation"] for s in gmail_stats), default=0),
+        },
+    }
+
+limiter_saturation = metrics.Gauge(
+    "audiobrew_rate_limit_saturation",
+    "Share of a rate limit bucket in use (1 = exhausted)",
+    ("limiter", "bucket"),
+)
+limiter_waiting = metrics.Gauge(
+    "audiobrew_rate_limit_waiting", "Calls waiting for a rate limit", ("limiter",)
+)
+limiter_throttled = metrics.Counter(
+    "audiobrew_rate_limit_throttled_total", "Calls that had to wait for a rate limit", ("limiter",)
+)
+limiter_waited = metrics.Counter(
+    "audiobrew_rate_limit_waited_seconds_total",
+    "Time calls spent waiting for rate limits",
+    ("limiter",),
+)
+
+def _export_metrics():
+    with _registry_lock:
+        limiters = dict(_limiters)
+        gmail_users = list(_gmail_users.values())
+    for name, rate_limiter in limiters.items():
+        limiter_stats = rate_limiter.stats()
+        for bucket in ("requests", "tokens"):
+            if limiter_stats[f"{bucket}_saturation"] is not None:
+                limiter_saturation.set(
+                    limiter_stats[f"{bucket}_saturation"], limiter=name, bucket=bucket
+                )
+        limiter_waiting.set(limiter_stats["waiting"], limiter=name)
+        limiter_throttled.set(limiter_stats["throttled"], limiter=name)
+        limiter_waited.set(limiter_stats["waited_seconds"], limiter=name)
+    # Per-user Gmail buckets come and go, so only their current state is exported, summed up
+    gmail_stats = [user_limiter.stats() for user_limiter in gmail_users]
+    limiter_saturation.set(
+        max((s["tokens_saturation"] for s in gmail_stats), default=0),
+        limiter="gmail:users",
+        bucket="tokens",
+    )
+    limiter_waiting.set(sum(s["waiting"] for s in gmail_stats), limiter="gmail:users")
+
+metrics.on_scrape(_export_metrics)
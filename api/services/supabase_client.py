@@ -0,0 +1,209 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from . import metrics, profiles
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+# Connection pool and timeout settings for the shared Supabase client
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "15"))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+SUPABASE_UPLOAD_TIMEOUT = float(os.getenv("SUPABASE_UPLOAD_TIMEOUT", "60"))
+
+# httpx connections belong to the event loop that opened them, so there is one
+# client per loop: the web loop opens its client in the app lifespan and the
+# job worker loop gets its own on first use.
+_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+def service_headers(extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Headers authenticating a request with the service role key."""
+    headers = {
+        "apikey": SUPABASE_SERVICE_KEY,
+        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+    }
+    if extra:
+        headers.update(extra)
+    return headers
+
+def _endpoint(path: str) -> str:
+    """Metrics label for a Supabase path, without ids so the label set stays small."""
+    parts = path.strip("/").split("/")
+    if parts[:2] == ["rest", "v1"] and len(parts) > 2:
+        return f"rest/{parts[2]}"
+    if parts[:2] == ["storage", "v1"]:
+        return "storage/object"
+    if parts[:2] == ["auth", "v1"]:
+        return "auth/admin/users"
+    return parts[0] if parts else ""
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """Records the latency, status and size of every Supabase request."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        endpoint = _endpoint(request.url.path)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception as e:
+            metrics.record_call(
+                "supabase", endpoint, metrics.error_status(e), time.perf_counter() - started
+            )
+            raise
+        metrics.record_call(
+            "supabase",
+            endpoint,
+            response.status_code,
+            time.perf_counter() - started,
+            sent=int(request.headers.get("content-length") or 0),
+            received=int(response.headers.get("content-length") or 0),
+        )
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+def _create_client() -> httpx.AsyncClient:
+    transport = httpx.AsyncHTTPTransport(
+        http2=SUPABASE_HTTP2,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+            keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return httpx.AsyncClient(
+        base_url=SUPABASE_URL or "",
+        headers=service_headers(),
+        transport=MeteredTransport(transport),
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+    )
+
+def get_client() -> httpx.AsyncClient:
+    """Return the pooled client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _create_client()
+        _clients[loop] = client
+    return client
+
+async def open_client():
+    """Open the pooled client for the running loop (called from the app lifespan)."""
+    get_client()
+
+async def close_client():
+    """Close the pooled client for the running loop."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+async def select(table: str, params: Dict[str, Any]) -> httpx.Response:
+    """GET rows from a PostgREST table."""
+    return await get_client().get(f"/rest/v1/{table}", params=params)
+
+async def insert(table: str, json: Any, prefer: str = "return=minimal") -> httpx.Response:
+    """POST one or more rows into a table."""
+    return await get_client().post(
+        f"/rest/v1/{table}",
+        headers={"Content-Type": "application/json", "Prefer": prefer},
+        json=json,
+    )
+
+async def upsert(
+    table: str, json: Any, on_conflict: str, prefer: str = "return=minimal"
+) -> httpx.Response:
+    """Insert rows, merging into existing ones that clash on the on_conflict columns."""
+    return await get_client().post(
+        f"/rest/v1/{table}",
+        headers={
+            "Content-Type": "application/json",
+            "Prefer": f"resolution=merge-duplicates,{prefer}",
+        },
+        params={"on_conflict": on_conflict},
+        json=json,
+    )
+
+async def update(
+    table: str, params: Dict[str, Any], json: Any, prefer: str = "return=minimal"
+) -> httpx.Response:
+    """PATCH the rows matching params."""
+    return await get_client().patch(
+        f"/rest/v1/{table}",
+        headers={"Content-Type": "application/json", "Prefer": prefer},
+        params=params,
+        json=json,
+    )
+
+async def delete(table: str, params: Dict[str, Any]) -> httpx.Response:
+    """DELETE the rows matching params."""
+    return await get_client().delete(f"/rest/v1/{table}", params=params)
+
+async def storage_upload(
+    bucket: str, path: str, content: Any, content_type: str, upsert: bool = False
+) -> httpx.Response:
+    """
+    Upload an object to a storage bucket. content may be bytes or an async
+    iterator of bytes, which is sent with chunked transfer encoding.
+    With upsert, an existing object at path is overwritten.
+    """
+    headers = {"Content-Type": content_type}
+    if upsert:
+        headers["x-upsert"] = "true"
+    if not isinstance(content, (bytes, bytearray)):
+        content = _count_sent(content)
+    return await get_client().post(
+        f"/storage/v1/object/{bucket}/{path}",
+        headers=headers,
+        content=content,
+        timeout=SUPABASE_UPLOAD_TIMEOUT,
+    )
+
+async def _count_sent(content):
+    # Streamed bodies have no Content-Length, so count their bytes as they go out
+    async for data in content:
+        metrics.outbound_bytes.inc(
+            len(data), provider="supabase", endpoint="storage/object", direction="sent"
+        )
+        profiles.count("uploaded_bytes", len(data))
+        yield data
+
+async def storage_delete(bucket: str, path: str) -> httpx.Response:
+    """Delete a single object from a storage bucket."""
+    return await get_client().delete(f"/storage/v1/object/{bucket}/{path}")
+
+async def storage_delete_many(bucket: str, paths: List[str]) -> httpx.Response:
+    """Delete several objects from a storage bucket in one request."""
+    return await get_client().request(
+        "DELETE",
+        f"/storage/v1/object/{bucket}",
+        json={"prefixes": paths},
+    )
+
+def storage_public_url(bucket: str, path: str) -> str:
+    return f"{SUPABASE_URL}/storage/v1/object/public/{bucket}/{path}"
+
+def storage_path_from_public_url(bucket: str, url: str) -> Optional[str]:
+    """Extract the object path from a public storage URL, or None if it isn't one."""
+    marker = f"/storage/v1/object/public/{bucket}/"
+    if url and marker in url:
+        return url.split(marker)[1]
+    return None
+
+async def delete_auth_user(user_id: str) -> httpx.Response:
+    """Delete a user through the auth admin API."""
+    return await get_client().delete(f"/auth/v1/admin/users/{user_id}")
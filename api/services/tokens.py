@@ -0,0 +1,46 @@
+import threading
+from typing import Any, Dict, Optional
+
+# tiktoken gives exact counts; without it a characters-per-token estimate is used
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Average characters per token for English text with OpenAI's tokenizers
+CHARS_PER_TOKEN = 4
+
+_encodings: Dict[str, Optional[Any]] = {}
+_encodings_lock = threading.Lock()
+
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except Exception as e:
+                # Unknown model, or the encoding file could not be downloaded
+                print(f"No tiktoken encoding for {model}, estimating token counts: {str(e)}")
+                _encodings[model] = None
+        return _encodings[model]
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Number of tokens text takes up for model, counted locally."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """Cut text down to at most max_tokens tokens, at a word boundary where possible."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _encoding(model)
+    if encoding is None:
+        text = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        text = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    space = text.rfind(" ")
+    return text[:space] if space > len(text) // 2 else text
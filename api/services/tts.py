@@ -0,0 +1,289 @@
+import asyncio
+import os
+import re
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, BinaryIO, List, Optional, Tuple
+
+from . import metrics, mp3, profiles
+from .audio_cache import audio_cache, segment_key
+from .rate_limit import limiter, with_backoff
+
+TTS_MODEL = os.getenv("TTS_MODEL", "tts-1-hd")
+TTS_VOICE = os.getenv("TTS_VOICE", "nova")
+# OpenAI TTS accepts at most 4096 characters per request
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "4000"))
+# Chunks of one script synthesized at the same time
+TTS_MAX_PARALLEL = int(os.getenv("TTS_MAX_PARALLEL", "4"))
+# The first chunk of a script is cut shorter so synthesis starts sooner
+TTS_FIRST_CHUNK_CHARS = int(os.getenv("TTS_FIRST_CHUNK_CHARS", "1000"))
+# Synthesized audio is kept in memory up to this size per chunk, then spills to a temp file
+TTS_SPOOL_MAX_BYTES = int(os.getenv("TTS_SPOOL_MAX_BYTES", str(1024 * 1024)))
+# Size of the pieces audio is read and uploaded in
+TTS_STREAM_CHUNK_BYTES = 64 * 1024
+
+Segment = Tuple[BinaryIO, int, int]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])[\"')\]]*\s+")
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Split a paragraph that is too long on its own, preferring sentence boundaries."""
+    pieces = []
+    for sentence in _SENTENCE_END.split(text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        # A single run-on sentence: fall back to word boundaries, then a hard cut
+        current = ""
+        for word in sentence.split():
+            while len(word) > max_chars:
+                if current:
+                    pieces.append(current)
+                    current = ""
+                pieces.append(word[:max_chars])
+                word = word[max_chars:]
+            if current and len(current) + 1 + len(word) > max_chars:
+                pieces.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        if current:
+            pieces.append(current)
+    return pieces
+
+def _split_paragraphs(text: str, max_chars: int) -> List[str]:
+    """
+    Split text into chunks of at most max_chars, breaking between paragraphs
+    where possible and between sentences otherwise.
+    """
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append((paragraph, "\n\n"))
+        else:
+            pieces.extend((sentence, " ") for sentence in _split_long(paragraph, max_chars))
+
+    chunks = []
+    current = ""
+    for piece, separator in pieces:
+        if current and len(current) + len(separator) + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _cut_point(text: str, limit: int) -> int:
+    """Where to end a chunk taken from the front of text: a paragraph, sentence or word boundary."""
+    window = text[:limit]
+    # Boundaries near the front would send tiny requests (e.g. a one-word greeting paragraph)
+    min_chars = limit // 2
+    paragraph = window.rfind("\n\n")
+    if paragraph >= min_chars:
+        return paragraph
+    sentences = [
+        match.end() for match in _SENTENCE_END.finditer(window) if match.end() >= min_chars
+    ]
+    if sentences:
+        return sentences[-1]
+    space = window.rfind(" ")
+    return space if space > 0 else limit
+
+def _cut_chunks(buffer: str, limit: int, max_chars: int) -> Tuple[List[str], str, int]:
+    """
+    Cut every chunk that is complete off the front of buffer. Returns the
+    chunks, the rest of the buffer and the limit for the next chunk.
+    """
+    # Whitespace after a cut may arrive with a later delta; drop it the same way either way
+    buffer = buffer.lstrip()
+    chunks = []
+    # Only cut once more than a chunk is buffered, so each cut has room to find a boundary
+    while len(buffer) > limit:
+        cut = _cut_point(buffer, limit)
+        chunk = buffer[:cut].strip()
+        buffer = buffer[cut:].lstrip()
+        if chunk:
+            chunks.append(chunk)
+        limit = max_chars
+    return chunks, buffer, limit
+
+def split_text(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """
+    Split a finished script into chunks of at most max_chars. The chunks are
+    the same split_stream yields for the script, so both hit the same cached
+    segments.
+    """
+    chunks, rest, _ = _cut_chunks(text, min(TTS_FIRST_CHUNK_CHARS, max_chars), max_chars)
+    return chunks + _split_paragraphs(rest, max_chars)
+
+async def split_stream(
+    deltas: AsyncIterator[str], max_chars: int = TTS_CHUNK_CHARS
+) -> AsyncIterator[str]:
+    """
+    Cut text that arrives piece by piece (e.g. a chat completion stream) into
+    TTS-sized chunks, yielding each one as soon as it is complete.
+    """
+    buffer = ""
+    limit = min(TTS_FIRST_CHUNK_CHARS, max_chars)
+    async for delta in deltas:
+        chunks, buffer, limit = _cut_chunks(buffer + delta, limit, max_chars)
+        for chunk in chunks:
+            yield chunk
+    for chunk in _split_paragraphs(buffer, max_chars):
+        yield chunk
+
+async def synthesize_chunk(client, text: str, owner: Optional[str] = None) -> Segment:
+    """
+    Stream the speech for one chunk of at most TTS_CHUNK_CHARS characters into
+    a spooled temp file. Returns the file and the byte range of its audio frames.
+    Text synthesized before with the same model and voice is served from the
+    segment cache without calling the API; API calls wait for the TTS rate
+    limit and are retried with backoff. The segment is recorded as used by
+    owner (a user id), if given.
+    """
+    key = segment_key(text, TTS_MODEL, TTS_VOICE, "mp3")
+    cached = await asyncio.to_thread(audio_cache.open, key, owner)
+    profiles.count_in("cache", "tts_segment_hits" if cached is not None else "tts_segment_misses")
+    if cached is not None:
+        try:
+            size = os.fstat(cached.fileno()).st_size
+            start, end = await asyncio.to_thread(mp3.audio_span, cached, size)
+            return cached, start, end
+        except BaseException:
+            cached.close()
+            raise
+
+    async def stream() -> BinaryIO:
+        # A fresh spool per attempt, so a retry after a dropped stream starts clean
+        spool = SpooledTemporaryFile(max_size=TTS_SPOOL_MAX_BYTES)
+        try:
+            async with client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=TTS_VOICE,
+                input=text,
+                response_format="mp3",
+            ) as response:
+                head = b""
+                async for data in response.iter_bytes(TTS_STREAM_CHUNK_BYTES):
+                    if len(head) < mp3.HEAD_BYTES:
+                        head += data[:mp3.HEAD_BYTES - len(head)]
+                        # Fail fast when the response is not MP3 audio, e.g. an error page
+                        if len(head) >= mp3.HEAD_BYTES and not mp3.has_audio_frame(head):
+                            raise Exception("Received invalid audio data from TTS API")
+                    spool.write(data)
+            return spool
+        except BaseException:
+            spool.close()
+            raise
+
+    spool = await with_backoff(stream, limiter("openai", TTS_MODEL), endpoint="audio.speech")
+    try:
+        size = spool.tell()
+        metrics.tts_characters.inc(len(text), model=TTS_MODEL)
+        profiles.count("tts_characters", len(text))
+        metrics.outbound_bytes.inc(
+            size, provider="openai", endpoint="audio.speech", direction="received"
+        )
+        if not size:
+            raise Exception("Received empty audio data from TTS API")
+        try:
+            start, end = mp3.audio_span(spool, size)
+        except ValueError:
+            raise Exception("Received invalid audio data from TTS API")
+        try:
+            await asyncio.to_thread(audio_cache.store, key, spool, owner)
+        except OSError as e:
+            print(f"Failed to cache audio segment {key}: {str(e)}")
+        return spool, start, end
+    except BaseException:
+        spool.close()
+        raise
+
+async def synthesize_chunks(
+    client, chunks: AsyncIterator[str], owner: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """
+    Synthesize text chunks as they arrive and yield one MP3 byte stream.
+
+    Each chunk starts synthesizing as soon as it is received (at most
+    TTS_MAX_PARALLEL at once). Their audio frames are yielded in order as
+    soon as each chunk is ready, so an upload can start with the first chunk
+    and per-job memory stays bounded by the spool size.
+    """
+    semaphore = asyncio.Semaphore(TTS_MAX_PARALLEL)
+    pending: asyncio.Queue = asyncio.Queue()
+    tasks: List[asyncio.Task] = []
+
+    async def run(chunk: str) -> Segment:
+        async with semaphore:
+            return await synthesize_chunk(client, chunk, owner)
+
+    async def produce():
+        try:
+            async for chunk in chunks:
+                task = asyncio.create_task(run(chunk))
+                tasks.append(task)
+                pending.put_nowait(task)
+        finally:
+            pending.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        count = 0
+        while True:
+            task = await pending.get()
+            if task is None:
+                break
+            count += 1
+            audio_file, start, end = await task
+            try:
+                audio_file.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    data = audio_file.read(min(TTS_STREAM_CHUNK_BYTES, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+            finally:
+                audio_file.close()
+        # Surface errors from the text source
+        await producer
+        if not count:
+            raise ValueError("Nothing to synthesize")
+    finally:
+        # On failure or an abandoned upload, stop the remaining work and free the files
+        producer.cancel()
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        for task in [producer] + tasks:
+            try:
+                result = await task
+                if result is not None:
+                    result[0].close()
+            except BaseException:
+                pass
+
+async def synthesize_stream(
+    client, text: str, owner: Optional[str] = None, chunks: Optional[List[str]] = None
+) -> AsyncIterator[bytes]:
+    """
+    Synthesize a complete script of any length as one MP3 byte stream. Pass the chunks
+    split_stream cut the script into when it was streamed to synthesize exactly those.
+    """
+    chunks = chunks or split_text(text)
+    if not chunks:
+        raise ValueError("Nothing to synthesize")
+
+    async def iterate():
+        for chunk in chunks:
+            yield chunk
+
+    print(f"Synthesizing {len(text)} characters in {len(chunks)} chunks")
+    async for data in synthesize_chunks(client, iterate(), owner):
+        yield data
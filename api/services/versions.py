@@ -0,0 +1,53 @@
+import time
+
+from . import db
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resource_versions (
+    scope    TEXT NOT NULL,
+    key      TEXT NOT NULL,
+    version  INTEGER NOT NULL,
+    PRIMARY KEY (scope, key)
+);
+"""
+
+def _conn():
+    db.ensure_schema("resource_versions", SCHEMA)
+    return db.connect()
+
+def _current(scope: str, key: str) -> int:
+    conn = _conn()
+    row = conn.execute(
+        "SELECT version FROM resource_versions WHERE scope = ? AND key = ?", (scope, key)
+    ).fetchone()
+    if row is not None:
+        return row["version"]
+    # Start new counters from the clock, so versions handed out before the
+    # local database was reset are never reused for different data
+    conn.execute(
+        "INSERT OR IGNORE INTO resource_versions (scope, key, version) VALUES (?, ?, ?)",
+        (scope, key, int(time.time() * 1000)),
+    )
+    return conn.execute(
+        "SELECT version FROM resource_versions WHERE scope = ? AND key = ?", (scope, key)
+    ).fetchone()["version"]
+
+def _bump(scope: str, key: str) -> int:
+    conn = _conn()
+    conn.execute(
+        "INSERT INTO resource_versions (scope, key, version) VALUES (?, ?, ?) "
+        "ON CONFLICT (scope, key) DO UPDATE SET version = version + 1",
+        (scope, key, int(time.time() * 1000)),
+    )
+    return _current(scope, key)
+
+async def current(scope: str, key: str) -> int:
+    """Current version of a resource."""
+    return await db.run(_current, scope, key)
+
+async def bump(scope: str, key: str) -> int:
+    """
+    Record that a resource changed. Call it after the change is stored, so
+    anyone who sees the new version also sees the new data.
+    """
+    return await db.run(_bump, scope, key)
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from . import checkpoints, jobs, metrics, supabase_client
+
+# Number of async workers draining the job queue, and how many jobs each of
+# them may run at the same time. Set PODCAST_WORKERS=0 to run the web process
+# without workers (e.g. when `python -m api.worker` runs them separately).
+PODCAST_WORKERS = int(os.getenv("PODCAST_WORKERS", "2"))
+PODCAST_WORKER_CONCURRENCY = int(os.getenv("PODCAST_WORKER_CONCURRENCY", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2.0"))
+STALE_JOB_CHECK_INTERVAL = 60.0
+# How often a running job renews its lease, so long stages are not mistaken for abandoned
+# ones, and checks whether it was cancelled
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+jobs_in_flight = metrics.Gauge(
+    "audiobrew_jobs_in_flight", "Jobs currently running in this process", ("kind",)
+)
+job_seconds = metrics.Histogram(
+    "audiobrew_job_seconds", "Run time of jobs from claim to finish", ("kind", "outcome")
+)
+
+class WorkerPool:
+    """
+    Drains the job table with a fixed set of async workers.
+
+    The workers run on their own event loop in a dedicated thread, so long
+    generation jobs never compete with request handling on the web loop.
+    """
+
+    def __init__(self, handlers: Dict[str, JobHandler], workers: int, concurrency: int):
+        self.handlers = handlers
+        self.workers = workers
+        self.concurrency = concurrency
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._ready = threading.Event()
+        self.running = 0
+        # Ids of the jobs running on this pool's workers right now
+        self.live: Set[str] = set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="job-workers", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self, timeout: float = 30.0):
+        if self.loop and self._stopping:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def notify(self):
+        """Wake idle workers because a new job was queued."""
+        if self.loop and self._wake:
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    async def _main(self):
+        self._wake = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._ready.set()
+
+        requeued = await jobs.requeue_stale_jobs()
+        if requeued:
+            print(f"Requeued {requeued} abandoned jobs")
+
+        tasks = [
+            asyncio.create_task(self._worker(f"{uuid.uuid4().hex[:8]}-{i}"))
+            for i in range(self.workers)
+        ]
+        tasks.append(asyncio.create_task(self._reaper()))
+
+        await self._stopping.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await supabase_client.close_client()
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(STALE_JOB_CHECK_INTERVAL)
+            try:
+                requeued = await jobs.requeue_stale_jobs(list(self.live))
+                if requeued:
+                    print(f"Requeued {requeued} abandoned jobs")
+                    self._wake.set()
+            except Exception as e:
+                print(f"Error requeueing stale jobs: {str(e)}")
+            try:
+                await checkpoints.prune()
+            except Exception as e:
+                print(f"Error pruning job checkpoints: {str(e)}")
+
+    async def _worker(self, worker_id: str):
+        slots = asyncio.Semaphore(self.concurrency)
+        in_flight = set()
+        try:
+            while True:
+                await slots.acquire()
+                try:
+                    job = await jobs.claim_next_job(worker_id, list(self.handlers))
+                except Exception as e:
+                    print(f"Worker {worker_id} failed to claim a job: {str(e)}")
+                    job = None
+                if job is None:
+                    slots.release()
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), JOB_POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                task = asyncio.create_task(self._run_job(job, worker_id))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                task.add_done_callback(lambda _: slots.release())
+        except asyncio.CancelledError:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            raise
+
+    async def _run_job(self, job: Dict[str, Any], worker_id: str):
+        self.running += 1
+        self.live.add(job["id"])
+        try:
+            await run_job(self.handlers[job["kind"]], job, worker_id)
+        finally:
+            self.live.discard(job["id"])
+            self.running -= 1
+
+async def _heartbeat(job_id: str, worker_id: str, handler_task: asyncio.Task):
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            status = await jobs.touch_job(job_id, worker_id)
+        except Exception as e:
+            print(f"Error renewing the lease on job {job_id}: {str(e)}")
+            continue
+        if status == jobs.CANCELLING:
+            handler_task.cancel()
+        if status in (None, jobs.CANCELLING):
+            return
+
+async def run_job(handler: JobHandler, job: Dict[str, Any], worker_id: str):
+    """Run a claimed job to the end, recording its result or error on the job."""
+    job_id = job["id"]
+    print(f"Worker {worker_id} picked up {job['kind']} job {job_id}")
+    jobs_in_flight.inc(kind=job["kind"])
+    handler_task = asyncio.create_task(handler(job))
+    heartbeat = asyncio.create_task(_heartbeat(job_id, worker_id, handler_task))
+    started = time.perf_counter()
+    outcome = jobs.FAILED
+    try:
+        result = await handler_task
+        await jobs.update_job(job_id, jobs.DONE, result=result)
+        outcome = jobs.DONE
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            # Shutting down: hand the job back so the next worker picks it up.
+            outcome = jobs.QUEUED
+            await asyncio.shield(jobs.release_job(job_id))
+            raise
+        # The heartbeat stopped a job that was cancelled while it ran
+        print(f"Job {job_id} was cancelled")
+        await jobs.update_job(job_id, jobs.FAILED, error="Job was cancelled")
+    except Exception as e:
+        print(f"Job {job_id} failed: {str(e)}")
+        traceback.print_exc()
+        await jobs.update_job(job_id, jobs.FAILED, error=str(e))
+    finally:
+        heartbeat.cancel()
+        jobs_in_flight.dec(kind=job["kind"])
+        job_seconds.observe(time.perf_counter() - started, kind=job["kind"], outcome=outcome)
+
+pool: Optional[WorkerPool] = None
+inline_handlers: Optional[Dict[str, JobHandler]] = None
+
+def start_workers(
+    handlers: Dict[str, JobHandler],
+    workers: int = PODCAST_WORKERS,
+    concurrency: int = PODCAST_WORKER_CONCURRENCY,
+):
+    """Start the process-wide worker pool (no-op when configured with zero workers)."""
+    global pool
+    if workers <= 0 or pool is not None:
+        return
+    pool = WorkerPool(handlers, workers, concurrency)
+    pool.start()
+    print(f"Started {workers} job workers with concurrency {concurrency}")
+
+def stop_workers():
+    global pool
+    if pool is not None:
+        pool.stop()
+        pool = None
+
+def run_jobs_inline(handlers: Dict[str, JobHandler]):
+    """
+    Run jobs in the request that queues them when no worker pool is running,
+    for hosts that cannot keep a worker alive between requests (serverless).
+    """
+    global inline_handlers
+    inline_handlers = handlers
+
+async def dispatch(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Hand a newly queued job to the workers and return it. In inline mode
+    without a worker pool, the job is run here and returned finished.
+    """
+    if pool is not None:
+        pool.notify()
+        return job
+    if inline_handlers is None:
+        # Another process runs the workers (PODCAST_WORKERS=0 with python -m api.worker)
+        return job
+    claimed = await jobs.claim_job(job["id"], f"inline-{uuid.uuid4().hex[:8]}")
+    if claimed is None:
+        return job
+    await run_job(inline_handlers[claimed["kind"]], claimed, claimed["worker_id"])
+    return await jobs.get_job(job["id"])
@@ -0,0 +1,52 @@
+import io
+
+import pytest
+
+from api.services import mp3
+
+# MPEG 1 Layer III, 128 kbps, 44.1 kHz, stereo: 144000 * 128 // 44100 = 417 bytes
+HEADER = b"\xff\xfb\x90\x00"
+FRAME_LENGTH = 417
+
+def frame(header: bytes = HEADER, body: bytes = b"") -> bytes:
+    length = mp3.frame_length(header, 0)
+    return header + body + bytes(length - len(header) - len(body))
+
+def id3v2_tag(size: int) -> bytes:
+    synchsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x04\x00\x00" + synchsafe + bytes(size)
+
+def test_frame_length_of_synthetic_header():
+    assert mp3.frame_length(HEADER, 0) == FRAME_LENGTH
+    # Padding bit adds one byte
+    assert mp3.frame_length(b"\xff\xfb\x92\x00", 0) == FRAME_LENGTH + 1
+
+def test_frame_length_rejects_invalid_headers():
+    assert mp3.frame_length(b"\x00\xfb\x90\x00", 0) is None
+    # Free-format bitrate and reserved sample rate
+    assert mp3.frame_length(b"\xff\xfb\x00\x00", 0) is None
+    assert mp3.frame_length(b"\xff\xfb\x9c\x00", 0) is None
+    # Truncated header
+    assert mp3.frame_length(HEADER[:3], 0) is None
+
+def test_has_audio_frame():
+    assert mp3.has_audio_frame(frame() + frame())
+    assert mp3.has_audio_frame(id3v2_tag(20) + frame() + frame())
+    assert not mp3.has_audio_frame(b"<html><body>Rate limit exceeded</body></html>")
+
+def test_audio_span_skips_tags_and_info_frame():
+    # Stereo MPEG 1: the Info tag follows 4 header bytes and 32 bytes of side info
+    info = frame(body=bytes(32) + b"Info")
+    tag = id3v2_tag(20)
+    data = tag + info + frame() + frame() + b"TAG" + bytes(125)
+
+    start, end = mp3.audio_span(io.BytesIO(data), len(data))
+
+    assert start == len(tag) + FRAME_LENGTH
+    assert end == len(data) - 128
+    assert end - start == 2 * FRAME_LENGTH
+
+def test_audio_span_rejects_non_mp3_body():
+    data = b'{"error": {"message": "Invalid API key"}}' * 10
+    with pytest.raises(ValueError):
+        mp3.audio_span(io.BytesIO(data), len(data))
@@ -0,0 +1,62 @@
+import asyncio
+
+from api.services import tts
+
+
+def stream(text: str, max_chars: int, delta_size: int = 7):
+    async def deltas():
+        for i in range(0, len(text), delta_size):
+            yield text[i:i + delta_size]
+
+    async def collect():
+        return [chunk async for chunk in tts.split_stream(deltas(), max_chars)]
+
+    return asyncio.run(collect())
+
+def test_split_text_keeps_paragraphs_together():
+    text = "First paragraph.\n\nSecond paragraph.\n\nThird paragraph."
+    assert tts.split_text(text, 40) == ["First paragraph.\n\nSecond paragraph.", "Third paragraph."]
+
+def test_split_text_breaks_long_paragraphs_between_sentences():
+    text = "One two three. Four five six. Seven eight nine."
+    chunks = tts.split_text(text, 30)
+    assert chunks == ["One two three. Four five six.", "Seven eight nine."]
+
+def test_split_text_cuts_run_on_words():
+    chunks = tts.split_text("a" * 25, 10)
+    assert chunks == ["a" * 10, "a" * 10, "a" * 5]
+
+def test_split_text_respects_the_limit():
+    text = "\n\n".join(f"Paragraph {i} has a sentence. And then another one." for i in range(50))
+    chunks = tts.split_text(text, 120)
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    assert " ".join(" ".join(chunks).split()) == " ".join(text.split())
+
+def test_split_stream_respects_the_limit_and_keeps_all_text():
+    text = " ".join(f"Sentence number {i} is here." for i in range(100))
+    chunks = stream(text, 200)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert " ".join(chunks) == text
+
+def test_split_stream_skips_a_short_leading_paragraph():
+    text = "Hi.\n\n" + " ".join(f"Sentence number {i} is here." for i in range(20))
+    chunks = stream(text, 100)
+    assert len(chunks[0]) >= 50
+    assert all(len(chunk) <= 100 for chunk in chunks)
+
+def test_cut_point_prefers_a_late_paragraph_break():
+    text = "x" * 70 + "\n\n" + "y" * 70
+    assert tts._cut_point(text, 100) == 70
+
+def test_split_text_matches_split_stream_for_a_finished_script():
+    paragraphs = [
+        " ".join(f"Newsletter {p} makes point {i}, with a statistic of {i * 7}%." for i in range(n))
+        for p, n in enumerate([1, 12, 40, 3, 25, 60, 2, 30])
+    ]
+    script = "\n\n" + "\n\n".join(paragraphs) + " \n\n  " + "x" * 5000
+    for max_chars in (tts.TTS_CHUNK_CHARS, 700, 150):
+        expected = tts.split_text(script, max_chars)
+        assert len(expected) > 3
+        for delta_size in (1, 7, 64, 4096):
+            assert stream(script, max_chars, delta_size) == expected
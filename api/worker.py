@@ -0,0 +1,38 @@
+"""
+Run the job workers in a dedicated process:
+
+    PODCAST_WORKERS=0 uvicorn api.main:app      # web process, no workers
+    python -m api.worker                         # worker process
+
+Set WORKER_METRICS_PORT to serve the worker's /metrics on that port.
+"""
+import os
+import signal
+import sys
+import threading
+from pathlib import Path
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from api.lifespan import JOB_HANDLERS
+from api.services import metrics
+from api.services.email_content import shutdown_pool
+from api.services.worker import PODCAST_WORKER_CONCURRENCY, start_workers, stop_workers
+
+if __name__ == "__main__":
+    workers = int(os.getenv("WORKER_PROCESS_WORKERS", "4"))
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    # Stage and job metrics are recorded in this process, so it serves its own /metrics
+    metrics_port = int(os.getenv("WORKER_METRICS_PORT", "0"))
+    if metrics_port:
+        metrics.serve(metrics_port)
+
+    start_workers(JOB_HANDLERS, workers=workers, concurrency=PODCAST_WORKER_CONCURRENCY)
+    stop.wait()
+    print("Stopping job workers...")
+    stop_workers()
+    shutdown_pool()
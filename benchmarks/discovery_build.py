@@ -0,0 +1,59 @@
+"""
+Micro-benchmark: per-request cost of creating Gmail/OAuth2 API clients.
+
+Compares googleapiclient's build(), which reads and parses the bundled
+discovery document on every call, with the cached-document wrappers in
+api.services.gmail_api.
+
+    python benchmarks/discovery_build.py [--iterations 200]
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add the repository root to the Python path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from api.services.gmail_api import gmail_service, load_discovery_documents, oauth2_service
+
+
+def measure(label, fn, iterations):
+    fn()  # warm up
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_call_ms = elapsed / iterations * 1000
+    print(f"{label:<32} {per_call_ms:8.3f} ms/call   peak alloc {peak / 1024:8.1f} KiB")
+    return per_call_ms
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    credentials = Credentials(token="benchmark-token")
+    load_discovery_documents()
+
+    iterations = args.iterations
+    before_gmail = measure(
+        "build('gmail', 'v1')", lambda: build("gmail", "v1", credentials=credentials), iterations
+    )
+    after_gmail = measure("gmail_service()", lambda: gmail_service(credentials), iterations)
+    before_oauth = measure(
+        "build('oauth2', 'v2')", lambda: build("oauth2", "v2", credentials=credentials), iterations
+    )
+    after_oauth = measure("oauth2_service()", lambda: oauth2_service(credentials), iterations)
+
+    print(f"\ngmail speedup:  {before_gmail / after_gmail:6.1f}x")
+    print(f"oauth2 speedup: {before_oauth / after_oauth:6.1f}x")
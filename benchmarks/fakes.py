@@ -0,0 +1,794 @@
+"""
+Local stand-ins for the services the API talks to, for benchmarks and load tests.
+
+- FakeGmail: an in-process Gmail API transport serving generated mailboxes.
+  install_gmail_fake() puts it behind gmail_api.gmail_service, so every
+  Gmail call the app makes (including batch requests) is answered from memory.
+- create_fake_services_app(): one HTTP app answering the OpenAI chat and
+  speech endpoints and the Supabase REST, storage and auth admin endpoints,
+  with configurable latency and output sizes. Point OPENAI_BASE_URL at
+  {url}/v1 and SUPABASE_URL at {url}.
+
+Run the HTTP fakes on their own:
+
+    python benchmarks/fakes.py [--port 8765] [--openai-latency-ms 300] [--supabase-latency-ms 20]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from email.parser import BytesParser
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+import httpx
+
+AUDIOBREW_LABEL_ID = "Label_audiobrew"
+
+# Both fakes are configured from one dict; every value can be overridden per run
+DEFAULT_CONFIG = {
+    "seed": 1,
+    # Gmail
+    "gmail_latency_ms": 40,
+    "gmail_batch_latency_ms": 120,
+    "mailbox_messages": 200,
+    "message_body_chars": 6000,
+    # OpenAI chat: time to the first token, then time per generated token
+    "openai_latency_ms": 300,
+    "openai_token_ms": 1,
+    "completion_tokens": 3000,
+    "stream_chunk_tokens": 4,
+    # OpenAI speech: time to the first byte, bytes of MP3 per input character, download rate
+    "speech_latency_ms": 400,
+    "speech_bytes_per_char": 1000,
+    "speech_bytes_per_second": 4 * 1024 * 1024,
+    # Supabase REST, storage and auth
+    "supabase_latency_ms": 15,
+    # Latencies vary by up to this fraction either way
+    "jitter": 0.2,
+}
+
+WORDS = (
+    "the market model team product growth data users launch week research funding report "
+    "cloud chips energy policy design startup revenue ai open source agents pricing customers "
+    "security release benchmark latency memory inference training platform developers survey"
+).split()
+
+def _jittered(milliseconds: float, rng: random.Random, jitter: float) -> float:
+    return max(0.0, milliseconds / 1000 * (1 + jitter * rng.uniform(-1, 1)))
+
+def generate_text(rng: random.Random, words: int, paragraph_words: int = 60) -> str:
+    """Readable-ish filler text: sentences of 8-16 words in paragraphs."""
+    paragraphs, sentence, paragraph = [], [], []
+    for index in range(words):
+        sentence.append(rng.choice(WORDS))
+        if len(sentence) >= rng.randint(8, 16) or index == words - 1:
+            paragraph.append(" ".join(sentence).capitalize() + ".")
+            sentence = []
+            if sum(len(s.split()) for s in paragraph) >= paragraph_words:
+                paragraphs.append(" ".join(paragraph))
+                paragraph = []
+    if paragraph:
+        paragraphs.append(" ".join(paragraph))
+    return "\n\n".join(paragraphs)
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+class Mailbox:
+    """
+    A generated Gmail mailbox: an AudioBrew label holding newsletter messages.
+    The same seed always gives the same messages, so separate processes can
+    serve identical mailboxes.
+    """
+
+    def __init__(self, seed: str, messages: int, body_chars: int):
+        self.seed = seed
+        self.body_chars = body_chars
+        self.history_id = 1000
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.order: List[str] = []
+        self.history: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.labels = [
+            {"id": "INBOX", "name": "INBOX", "type": "system"},
+            {"id": "SENT", "name": "SENT", "type": "system"},
+            {"id": "Label_news", "name": "News", "type": "user"},
+            {"id": AUDIOBREW_LABEL_ID, "name": "AudioBrew", "type": "user"},
+        ]
+        self._add(messages, record_history=False)
+
+    def _make_message(self, index: int) -> Dict[str, Any]:
+        rng = random.Random(f"{self.seed}:{index}")
+        message_id = f"{rng.getrandbits(64):016x}"
+        subject = f"Newsletter #{index}: " + " ".join(rng.choice(WORDS) for _ in range(5))
+        body = generate_text(rng, max(1, self.body_chars // 6))[:self.body_chars]
+        paragraphs = "".join(f"<p>{p}</p>" for p in body.split("\n\n"))
+        html = f"<html><body>{paragraphs}</body></html>"
+        internal_date = 1_700_000_000_000 + index * 60_000
+        date = time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(internal_date / 1000))
+        sender = f"Newsletter {index % 17} <news{index % 17}@example.com>"
+        return {
+            "id": message_id,
+            "threadId": message_id,
+            "labelIds": ["INBOX", AUDIOBREW_LABEL_ID],
+            "snippet": body[:160],
+            "sizeEstimate": len(body) + len(html) + 500,
+            "internalDate": str(internal_date),
+            "historyId": str(self.history_id),
+            "payload": {
+                "mimeType": "multipart/alternative",
+                "headers": [
+                    {"name": "Subject", "value": subject},
+                    {"name": "From", "value": sender},
+                    {"name": "Date", "value": date},
+                    {"name": "Content-Type", "value": "multipart/alternative; boundary=b"},
+                ],
+                "parts": [
+                    {"mimeType": "text/plain",
+                     "headers": [{"name": "Content-Type", "value": "text/plain; charset=utf-8"}],
+                     "body": {"size": len(body), "data": _b64(body)}},
+                    {"mimeType": "text/html",
+                     "headers": [{"name": "Content-Type", "value": "text/html; charset=utf-8"}],
+                     "body": {"size": len(html), "data": _b64(html)}},
+                ],
+            },
+        }
+
+    def _add(self, count: int, record_history: bool = True):
+        with self._lock:
+            for _ in range(count):
+                message = self._make_message(len(self.order))
+                self.history_id += 1
+                message["historyId"] = str(self.history_id)
+                self.messages[message["id"]] = message
+                self.order.append(message["id"])
+                if record_history:
+                    self.history.append({
+                        "id": str(self.history_id),
+                        "messagesAdded": [
+                            {"message": {"id": message["id"], "labelIds": message["labelIds"]}}
+                        ],
+                    })
+
+    def deliver(self, count: int = 1):
+        """New mail arriving in the AudioBrew label, picked up by the next incremental sync."""
+        self._add(count)
+
+    def message_ids(self, limit: Optional[int] = None) -> List[str]:
+        """Ids of the newest messages first."""
+        ids = self.order[::-1]
+        return ids if limit is None else ids[:limit]
+
+class FakeGmail:
+    """
+    httplib2-compatible transport answering the Gmail API calls the app makes
+    from the user's mailbox. Mailboxes are found by the OAuth token the
+    credentials carry (see token_for) and created on first use.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.mailboxes: Dict[str, Mailbox] = {}
+        self.requests: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config["seed"])
+
+    @staticmethod
+    def token_for(user_id: str) -> str:
+        return f"fake-gmail-token-{user_id}"
+
+    def mailbox(self, token: str) -> Mailbox:
+        with self._lock:
+            mailbox = self.mailboxes.get(token)
+            if mailbox is None:
+                mailbox = Mailbox(
+                    token, self.config["mailbox_messages"], self.config["message_body_chars"]
+                )
+                self.mailboxes[token] = mailbox
+            return mailbox
+
+    def http(self, token: str) -> "FakeGmailHttp":
+        return FakeGmailHttp(self, self.mailbox(token))
+
+    def _sleep(self, key: str):
+        with self._lock:
+            delay = _jittered(self.config[key], self._rng, self.config["jitter"])
+        time.sleep(delay)
+
+    def _count(self, method: str):
+        with self._lock:
+            self.requests[method] += 1
+
+    def handle(self, mailbox: Mailbox, method: str, uri: str) -> tuple:
+        """Answer one API call with (status, body)."""
+        url = urlparse(uri)
+        query = {
+            key: values if len(values) > 1 else values[0]
+            for key, values in parse_qs(url.query).items()
+        }
+        parts = url.path.strip("/").split("/")
+        if parts[:4] != ["gmail", "v1", "users", "me"]:
+            return 404, {"error": {"code": 404, "message": f"Unknown path {url.path}"}}
+        resource = parts[4:]
+
+        if resource == ["profile"]:
+            self._count("gmail.users.getProfile")
+            return 200, {"emailAddress": "reader@example.com", "historyId": str(mailbox.history_id),
+                         "messagesTotal": len(mailbox.order)}
+
+        if resource == ["labels"]:
+            self._count("gmail.users.labels.list")
+            return 200, {"labels": mailbox.labels}
+
+        if len(resource) == 2 and resource[0] == "labels":
+            self._count("gmail.users.labels.get")
+            label = next((label for label in mailbox.labels if label["id"] == resource[1]), None)
+            if label is None:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            return 200, {**label, "messagesTotal": len(mailbox.order)}
+
+        if resource == ["messages"]:
+            self._count("gmail.users.messages.list")
+            label_ids = query.get("labelIds", [])
+            label_ids = [label_ids] if isinstance(label_ids, str) else label_ids
+            listed = not label_ids or AUDIOBREW_LABEL_ID in label_ids or "INBOX" in label_ids
+            ids = mailbox.message_ids() if listed else []
+            start = int(query.get("pageToken", 0))
+            size = int(query.get("maxResults", 100))
+            page = ids[start:start + size]
+            response = {
+                "messages": [{"id": i, "threadId": i} for i in page],
+                "resultSizeEstimate": len(ids),
+            }
+            if start + size < len(ids):
+                response["nextPageToken"] = str(start + size)
+            return 200, response
+
+        if len(resource) == 2 and resource[0] == "messages":
+            self._count("gmail.users.messages.get")
+            message = mailbox.messages.get(resource[1])
+            if message is None:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            if query.get("format") == "metadata":
+                wanted = query.get("metadataHeaders", [])
+                wanted = [wanted] if isinstance(wanted, str) else wanted
+                wanted = {name.lower() for name in wanted}
+                headers = [
+                    h for h in message["payload"]["headers"]
+                    if not wanted or h["name"].lower() in wanted
+                ]
+                payload = {"mimeType": message["payload"]["mimeType"], "headers": headers}
+                return 200, {**{k: v for k, v in message.items() if k != "payload"},
+                             "payload": payload}
+            return 200, message
+
+        if resource == ["history"]:
+            self._count("gmail.users.history.list")
+            start_history_id = int(query.get("startHistoryId", 0))
+            if start_history_id < 1000:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            records = [record for record in mailbox.history if int(record["id"]) > start_history_id]
+            return 200, {"history": records, "historyId": str(mailbox.history_id)}
+
+        return 404, {"error": {"code": 404, "message": f"Unknown path {url.path}"}}
+
+class FakeGmailHttp:
+    """The httplib2.Http interface googleapiclient sends requests through, bound to one mailbox."""
+
+    def __init__(self, gmail: FakeGmail, mailbox: Mailbox):
+        self.gmail = gmail
+        self.mailbox = mailbox
+
+    def request(
+        self, uri, method="GET", body=None, headers=None, redirections=None, connection_type=None
+    ):
+        if urlparse(uri).path.split("/")[1] == "batch":
+            return self._batch(body, headers or {})
+        self.gmail._sleep("gmail_latency_ms")
+        status, payload = self.gmail.handle(self.mailbox, method, uri)
+        content = json.dumps(payload).encode("utf-8")
+        return _response(status, "application/json; charset=UTF-8"), content
+
+    def _batch(self, body, headers: Dict[str, str]):
+        self.gmail._sleep("gmail_batch_latency_ms")
+        self.gmail._count("gmail.batch")
+        content_type = next(
+            value for key, value in headers.items() if key.lower() == "content-type"
+        )
+        raw = body.encode("utf-8") if isinstance(body, str) else body
+        message = BytesParser().parsebytes(
+            b"Content-Type: " + content_type.encode("ascii") + b"\r\n\r\n" + raw
+        )
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part in message.get_payload():
+            request_line = part.get_payload().lstrip().split("\n", 1)[0].strip()
+            method, path, _ = request_line.split(" ", 2)
+            status, payload = self.gmail.handle(
+                self.mailbox, method, f"https://gmail.googleapis.com{path}"
+            )
+            content_id = part["Content-ID"].strip()
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(payload)}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--\r\n"
+        return _response(200, f"multipart/mixed; boundary={boundary}"), content.encode("utf-8")
+
+def _response(status: int, content_type: str) -> httplib2.Response:
+    return httplib2.Response({"status": str(status), "content-type": content_type})
+
+def install_gmail_fake(gmail: FakeGmail) -> FakeGmail:
+    """
+    Serve every Gmail API client the app builds from gmail. Call after
+    importing the routers: they hold their own reference to gmail_service.
+    """
+    from googleapiclient.discovery import build_from_document
+
+    from api.routers import gmail as gmail_router
+    from api.routers import podcast as podcast_router
+    from api.services import gmail_api
+
+    def gmail_service(credentials):
+        return build_from_document(
+            gmail_api.discovery_document("gmail", "v1"), http=gmail.http(credentials.token)
+        )
+
+    for module in (gmail_api, gmail_router, podcast_router):
+        module.gmail_service = gmail_service
+    return gmail
+
+def mp3_audio(size: int) -> bytes:
+    """Silent MPEG-1 Layer III frames (128 kbps, 44.1 kHz) adding up to about size bytes."""
+    frame = b"\xff\xfb\x90\x64" + bytes(413)
+    return frame * max(2, size // len(frame))
+
+class FakeSupabase:
+    """
+    In-memory PostgREST tables, storage bucket and auth admin API. Supports
+    the eq/neq/lt/lte/gt/gte/is filters, or=(...)/and(...), order, limit and
+    select= column lists, which is everything the app sends.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.objects: Dict[str, int] = {}
+        self.deleted_users: List[str] = []
+
+    def select(self, table: str, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        rows = [row for row in self.tables[table] if matches(row, params)]
+        for column, descending in reversed(parse_order(params.get("order", ""))):
+            rows.sort(
+                key=lambda row: (row.get(column) is None, row.get(column) or ""),
+                reverse=descending,
+            )
+        if "limit" in params:
+            rows = rows[:int(params["limit"])]
+        columns = params.get("select", "*")
+        if columns != "*":
+            names = columns.split(",")
+            rows = [{name: row.get(name) for name in names} for row in rows]
+        return rows
+
+    def upsert(
+        self, table: str, rows: List[Dict[str, Any]], on_conflict: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        stored = []
+        for row in rows:
+            row = {"id": str(uuid.uuid4()), **row}
+            existing = None
+            if on_conflict:
+                keys = on_conflict.split(",")
+                existing = next(
+                    (r for r in self.tables[table] if all(r.get(k) == row.get(k) for k in keys)),
+                    None,
+                )
+            if existing is not None:
+                existing.update(row)
+                stored.append(existing)
+            else:
+                self.tables[table].append(row)
+                stored.append(row)
+        return stored
+
+    def update(
+        self, table: str, params: Dict[str, str], changes: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        rows = [row for row in self.tables[table] if matches(row, params)]
+        for row in rows:
+            row.update(changes)
+        return rows
+
+    def delete(self, table: str, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        kept, removed = [], []
+        for row in self.tables[table]:
+            (removed if matches(row, params) else kept).append(row)
+        self.tables[table] = kept
+        return removed
+
+def parse_order(order: str) -> List[tuple]:
+    columns = []
+    for term in filter(None, order.split(",")):
+        column, _, direction = term.partition(".")
+        columns.append((column, direction.startswith("desc")))
+    return columns
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+def _compare(value: Any, op: str, operand: str) -> bool:
+    if op == "is":
+        return {"null": value is None, "true": value is True, "false": value is False}[operand]
+    if value is None:
+        return False
+    value = str(value).lower() if isinstance(value, bool) else str(value)
+    return {
+        "eq": value == operand,
+        "neq": value != operand,
+        "lt": value < operand,
+        "lte": value <= operand,
+        "gt": value > operand,
+        "gte": value >= operand,
+    }[op]
+
+def condition(row: Dict[str, Any], column: str, expression: str) -> bool:
+    """Evaluate one PostgREST filter such as eq.x, not.is.null, lt."2024-01-01"."""
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, operand = expression.partition(".")
+    result = _compare(row.get(column), op, operand.strip('"'))
+    return result != negate
+
+def logical(row: Dict[str, Any], op: str, terms: str) -> bool:
+    """Evaluate the (...) list of an or=/and= filter."""
+    results = []
+    for term in _split_top_level(terms.strip()[1:-1]):
+        if term.startswith(("and(", "or(")):
+            name, _, rest = term.partition("(")
+            results.append(logical(row, name, "(" + rest))
+        else:
+            column, _, expression = term.partition(".")
+            results.append(condition(row, column, expression))
+    return any(results) if op == "or" else all(results)
+
+def matches(row: Dict[str, Any], params: Dict[str, str]) -> bool:
+    for key, value in params.items():
+        if key in ("select", "order", "limit", "offset", "on_conflict"):
+            continue
+        if key in ("or", "and"):
+            if not logical(row, key, value):
+                return False
+        elif not condition(row, key, value):
+            return False
+    return True
+
+def create_fake_services_app(config: Optional[Dict[str, Any]] = None):
+    """The OpenAI and Supabase fakes as one FastAPI app."""
+    from fastapi import FastAPI, Request, Response
+    from fastapi.responses import JSONResponse, StreamingResponse
+    from starlette.requests import ClientDisconnect
+
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    rng = random.Random(config["seed"])
+    supabase = FakeSupabase()
+    stats: Dict[str, Any] = defaultdict(int)
+    app = FastAPI(title="AudioBrew service fakes")
+    app.state.supabase = supabase
+
+    async def wait(key: str):
+        await asyncio.sleep(_jittered(config[key], rng, config["jitter"]))
+
+    def completion_text(max_tokens: int) -> str:
+        stats["chat_completions"] += 1
+        # Every response is different, so scripts and speech segments never hit the app's caches
+        # by accident
+        words = min(max_tokens or config["completion_tokens"], config["completion_tokens"])
+        intro = f"Welcome to AudioBrew, episode {stats['chat_completions']}.\n\n"
+        return intro + generate_text(rng, words)
+
+    def usage(messages: List[Dict[str, Any]], completion: str) -> Dict[str, int]:
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        completion_tokens = len(completion.split())
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    @app.get("/_fake/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/_fake/stats")
+    async def get_stats():
+        return {**stats, "rows": {table: len(rows) for table, rows in supabase.tables.items()},
+                "objects": len(supabase.objects), "object_bytes": sum(supabase.objects.values())}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-4o")
+        text = completion_text(body.get("max_tokens") or body.get("max_completion_tokens"))
+        created = int(time.time())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        await wait("openai_latency_ms")
+
+        if not body.get("stream"):
+            await asyncio.sleep(len(text.split()) * config["openai_token_ms"] / 1000)
+            message = {"role": "assistant", "content": text}
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": usage(body["messages"], text),
+            }
+
+        async def events():
+            base = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created,
+                "model": model,
+            }
+            words = text.split(" ")
+            step = config["stream_chunk_tokens"]
+            for start in range(0, len(words), step):
+                await asyncio.sleep(step * config["openai_token_ms"] / 1000)
+                delta = " ".join(words[start:start + step])
+                if start + step < len(words):
+                    delta += " "
+                chunk = {**base, "choices": [
+                    {"index": 0, "delta": {"content": delta}, "finish_reason": None}
+                ]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(final)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                tail = {**base, "choices": [], "usage": usage(body["messages"], text)}
+                yield f"data: {json.dumps(tail)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        body = await request.json()
+        stats["speech_requests"] += 1
+        stats["speech_characters"] += len(body.get("input", ""))
+        audio = mp3_audio(len(body.get("input", "")) * config["speech_bytes_per_char"])
+        await wait("speech_latency_ms")
+
+        async def stream():
+            chunk_size = 64 * 1024
+            for start in range(0, len(audio), chunk_size):
+                chunk = audio[start:start + chunk_size]
+                await asyncio.sleep(len(chunk) / config["speech_bytes_per_second"])
+                yield chunk
+
+        return StreamingResponse(stream(), media_type="audio/mpeg")
+
+    def representation(request: Request, rows: List[Dict[str, Any]], status: int) -> Response:
+        if "return=representation" in request.headers.get("prefer", ""):
+            return JSONResponse(rows, status_code=status)
+        return Response(status_code=status)
+
+    @app.get("/rest/v1/{table}")
+    async def rest_select(table: str, request: Request):
+        await wait("supabase_latency_ms")
+        stats[f"rest.select.{table}"] += 1
+        return supabase.select(table, dict(request.query_params))
+
+    @app.post("/rest/v1/{table}")
+    async def rest_insert(table: str, request: Request):
+        await wait("supabase_latency_ms")
+        stats[f"rest.insert.{table}"] += 1
+        body = await request.json()
+        rows = body if isinstance(body, list) else [body]
+        merge = "merge-duplicates" in request.headers.get("prefer", "")
+        on_conflict = request.query_params.get("on_conflict") if merge else None
+        return representation(request, supabase.upsert(table, rows, on_conflict), 201)
+
+    @app.patch("/rest/v1/{table}")
+    async def rest_update(table: str, request: Request):
+        await wait("supabase_latency_ms")
+        stats[f"rest.update.{table}"] += 1
+        rows = supabase.update(table, dict(request.query_params), await request.json())
+        prefer = request.headers.get("prefer", "")
+        return representation(request, rows, 200 if "return=representation" in prefer else 204)
+
+    @app.delete("/rest/v1/{table}")
+    async def rest_delete(table: str, request: Request):
+        await wait("supabase_latency_ms")
+        stats[f"rest.delete.{table}"] += 1
+        rows = supabase.delete(table, dict(request.query_params))
+        prefer = request.headers.get("prefer", "")
+        return representation(request, rows, 200 if "return=representation" in prefer else 204)
+
+    @app.post("/storage/v1/object/{bucket}/{path:path}")
+    async def storage_upload(bucket: str, path: str, request: Request):
+        await wait("supabase_latency_ms")
+        stats["storage.upload"] += 1
+        key = f"{bucket}/{path}"
+        if key in supabase.objects and request.headers.get("x-upsert") != "true":
+            return JSONResponse(
+                {"statusCode": "409", "error": "Duplicate",
+                 "message": "The resource already exists"},
+                status_code=400,
+            )
+        size = 0
+        try:
+            async for data in request.stream():
+                size += len(data)
+        except ClientDisconnect:
+            # The app gave up on the upload (or was stopped); nothing is stored
+            return Response(status_code=499)
+        supabase.objects[key] = size
+        return {"Key": key}
+
+    @app.delete("/storage/v1/object/{bucket}/{path:path}")
+    async def storage_delete(bucket: str, path: str):
+        await wait("supabase_latency_ms")
+        stats["storage.delete"] += 1
+        supabase.objects.pop(f"{bucket}/{path}", None)
+        return {"message": "Successfully deleted"}
+
+    @app.delete("/storage/v1/object/{bucket}")
+    async def storage_delete_many(bucket: str, request: Request):
+        await wait("supabase_latency_ms")
+        stats["storage.delete_many"] += 1
+        prefixes = (await request.json()).get("prefixes", [])
+        return [
+            {"name": prefix} for prefix in prefixes
+            if supabase.objects.pop(f"{bucket}/{prefix}", None) is not None
+        ]
+
+    @app.delete("/auth/v1/admin/users/{user_id}")
+    async def delete_auth_user(user_id: str):
+        await wait("supabase_latency_ms")
+        stats["auth.delete_user"] += 1
+        supabase.deleted_users.append(user_id)
+        return {}
+
+    return app
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class FakeServicesProcess:
+    """
+    The HTTP fakes running in a child process, so they do not share the GIL with the code
+    being measured.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, port: Optional[int] = None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__),
+             "--port", str(self.port), "--config", json.dumps(config or {})],
+            stdout=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{self.url}/_fake/health", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError("Fake services did not start")
+                time.sleep(0.1)
+
+    def env(self) -> Dict[str, str]:
+        """Environment pointing the API at these fakes."""
+        return {
+            "SUPABASE_URL": self.url,
+            "SUPABASE_SERVICE_KEY": "fake-service-key",
+            "OPENAI_API_KEY": "fake-openai-key",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+        }
+
+    def seed(self, table: str, rows: List[Dict[str, Any]], batch_size: int = 1000):
+        """Insert rows through the fake's REST endpoint, the same way the app writes them."""
+        with httpx.Client(base_url=self.url, timeout=60) as client:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                client.post(f"/rest/v1/{table}", json=batch).raise_for_status()
+
+    def stats(self) -> Dict[str, Any]:
+        return httpx.get(f"{self.url}/_fake/stats", timeout=10).json()
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+def app_env(workdir: str, keep_rate_limits: bool = False) -> Dict[str, str]:
+    """
+    Environment for an app run against the fakes: fresh local state under
+    workdir, so caches and sync state from earlier runs do not skew the
+    numbers, and no client-side rate limits unless asked (the fakes have none).
+    """
+    env = {
+        "LOCAL_DB_PATH": os.path.join(workdir, "audiobrew.db"),
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts-cache"),
+        "SUPABASE_HTTP2": "false",
+    }
+    if not keep_rate_limits:
+        for model in ("GPT_4O", "GPT_4O_MINI", "TTS_1", "TTS_1_HD"):
+            env[f"RATE_LIMIT_OPENAI_{model}_RPM"] = "0"
+            env[f"RATE_LIMIT_OPENAI_{model}_TPM"] = "0"
+        env["GMAIL_USER_UNITS_PER_SECOND"] = "1000000"
+        env["RATE_LIMIT_GOOGLE_GMAIL_TPM"] = "0"
+    return env
+
+def gmail_connection(user_id: str) -> Dict[str, Any]:
+    """A gmail_connections row whose token selects the user's fake mailbox."""
+    return {
+        "user_id": user_id,
+        "email": f"{user_id[:8]}@example.com",
+        "credentials": {
+            "token": FakeGmail.token_for(user_id),
+            "refresh_token": "fake-refresh-token",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "scopes": [],
+        },
+    }
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """One --option per DEFAULT_CONFIG entry, e.g. --openai-latency-ms."""
+    for key, default in DEFAULT_CONFIG.items():
+        parser.add_argument(
+            f"--{key.replace('_', '-')}", dest=key, type=type(default), default=default
+        )
+
+def config_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    return {key: getattr(args, key) for key in DEFAULT_CONFIG}
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--config", help="JSON object overriding the options below")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    if args.config:
+        config.update(json.loads(args.config))
+    uvicorn.run(
+        create_fake_services_app(config), host="127.0.0.1", port=args.port, log_level="warning"
+    )
@@ -0,0 +1,57 @@
+"""
+api.main:app wired to the local service fakes, for benchmarks/load_test.py.
+
+Gmail is served by the in-process fake (configured from LOAD_TEST_FAKES_CONFIG);
+OpenAI and Supabase are reached through OPENAI_BASE_URL and SUPABASE_URL.
+Each process also measures how late its event loop wakes up and writes the
+samples to LOAD_TEST_STATS_DIR/loop-lag-<pid>.json once a second.
+
+    PYTHONPATH=.:benchmarks uvicorn load_app:app --workers 2
+"""
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fakes import FakeGmail, install_gmail_fake
+
+from api.main import app
+
+LOOP_LAG_INTERVAL = 0.05
+STATS_DIR = os.getenv("LOAD_TEST_STATS_DIR")
+
+install_gmail_fake(FakeGmail(json.loads(os.getenv("LOAD_TEST_FAKES_CONFIG", "{}"))))
+
+async def monitor_loop_lag():
+    """
+    Sleep for a fixed interval over and over, recording how much later than asked each
+    wake-up comes.
+    """
+    loop = asyncio.get_running_loop()
+    samples = []
+    path = os.path.join(STATS_DIR, f"loop-lag-{os.getpid()}.json") if STATS_DIR else None
+    last_write = time.monotonic()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = loop.time() - started - LOOP_LAG_INTERVAL
+        samples.append((round(time.time(), 3), round(lag * 1000, 2)))
+        if path and time.monotonic() - last_write >= 1:
+            last_write = time.monotonic()
+            with open(path + ".tmp", "w") as f:
+                json.dump(samples, f)
+            os.replace(path + ".tmp", path)
+
+_lifespan = app.router.lifespan_context
+
+@asynccontextmanager
+async def lifespan(app):
+    async with _lifespan(app) as state:
+        monitor = asyncio.create_task(monitor_loop_lag())
+        try:
+            yield state
+        finally:
+            monitor.cancel()
+
+app.router.lifespan_context = lifespan
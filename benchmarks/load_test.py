@@ -0,0 +1,521 @@
+"""
+Load test: concurrent dashboard sessions against api.main:app under uvicorn.
+
+Each session is one user going through the dashboard with think times in
+between: Gmail status, labels and emails, the podcast list, generating a
+podcast and polling its job until it is done, the list again, and deleting
+the new podcast. Gmail, OpenAI and Supabase are the local fakes from
+benchmarks/fakes.py. The report has per-endpoint latency percentiles and
+error rates, the server's event-loop lag, and, with a step profile, one
+row per concurrency level to show where a worker saturates.
+
+    python benchmarks/load_test.py [--sessions 20] [--duration 120]
+    python benchmarks/load_test.py --profile ramp --sessions 50 --ramp-seconds 60 --duration 180
+    python benchmarks/load_test.py --profile steps --steps 5:60,10:60,20:60,40:60 --workers 1,2,4
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+# Add the repository root to the Python path (this script's directory, with fakes.py, already is)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from fakes import (
+    FakeServicesProcess,
+    add_config_arguments,
+    app_env,
+    config_from_args,
+    free_port,
+    gmail_connection,
+)
+from pipeline import git_commit, percentile, seed_podcasts
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The end-to-end time of a generation, from queueing it to seeing the job done, reported next to
+# the endpoints
+GENERATION = "generation (queued to done)"
+
+Stage = Tuple[str, float, float]  # label, start second, end second
+
+def build_profile(args: argparse.Namespace) -> Tuple[List[Stage], Callable[[float], int]]:
+    """Stages of the run and the number of sessions wanted at each second."""
+    if args.profile == "steps":
+        levels = [
+            (int(users), float(seconds))
+            for users, seconds in (step.split(":") for step in args.steps.split(","))
+        ]
+        stages, start = [], 0.0
+        for users, seconds in levels:
+            stages.append((f"sessions={users}", start, start + seconds))
+            start += seconds
+
+        def target(t: float) -> int:
+            for (_, begin, end), (users, _) in zip(stages, levels):
+                if begin <= t < end:
+                    return users
+            return 0
+
+        return stages, target
+
+    if args.profile == "ramp":
+        ramp = min(args.ramp_seconds, args.duration)
+        stages = [("ramp", 0.0, ramp), (f"sessions={args.sessions}", ramp, args.duration)]
+        return stages, lambda t: (
+            max(1, math.ceil(args.sessions * min(1.0, t / ramp))) if ramp else args.sessions
+        )
+
+    return [(f"sessions={args.sessions}", 0.0, args.duration)], lambda t: args.sessions
+
+class Recorder:
+    """Every request's endpoint, stage, latency and outcome."""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        self.started = time.monotonic()
+        self.started_wall = time.time()
+        self.samples: List[Tuple[str, str, float, str]] = []
+        self.active = 0
+
+    def stage(self, elapsed: Optional[float] = None) -> str:
+        elapsed = time.monotonic() - self.started if elapsed is None else elapsed
+        return next(
+            (label for label, begin, end in self.stages if begin <= elapsed < end),
+            self.stages[-1][0],
+        )
+
+    def record(self, endpoint: str, stage: str, seconds: float, outcome: str):
+        self.samples.append((endpoint, stage, seconds, outcome))
+
+class Session:
+    """One simulated dashboard user."""
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        recorder: Recorder,
+        user_id: str,
+        rng: random.Random,
+        args: argparse.Namespace,
+    ):
+        self.client = client
+        self.recorder = recorder
+        self.user_id = user_id
+        self.rng = rng
+        self.args = args
+        self.list_etag: Optional[str] = None
+
+    async def think(self):
+        if self.args.think_seconds > 0:
+            pause = self.rng.expovariate(1 / self.args.think_seconds)
+            await asyncio.sleep(min(pause, 4 * self.args.think_seconds))
+
+    async def call(
+        self, endpoint: str, method: str, url: str, **kwargs
+    ) -> Optional[httpx.Response]:
+        stage = self.recorder.stage()
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            seconds = time.perf_counter() - started
+            self.recorder.record(endpoint, stage, seconds, e.__class__.__name__)
+            return None
+        seconds = time.perf_counter() - started
+        self.recorder.record(endpoint, stage, seconds, str(response.status_code))
+        return response if response.status_code < 400 else None
+
+    async def list_podcasts(self):
+        # Like the browser, revalidate the last listing with its ETag
+        headers = {"If-None-Match": self.list_etag} if self.list_etag else {}
+        response = await self.call(
+            "GET /api/podcast/list", "GET", "/api/podcast/list",
+            params={"user_id": self.user_id}, headers=headers,
+        )
+        if response is not None and response.headers.get("etag"):
+            self.list_etag = response.headers["etag"]
+
+    async def generate(self, email_ids: List[str]) -> Optional[str]:
+        """Queue a podcast and poll its job; returns the podcast id once it is done."""
+        stage = self.recorder.stage()
+        started = time.perf_counter()
+        response = await self.call(
+            "POST /api/podcast/generate", "POST", "/api/podcast/generate",
+            json={"user_id": self.user_id, "email_ids": email_ids, "title": "Load test episode"},
+        )
+        if response is None:
+            return None
+        job_id = response.json()["id"]
+
+        deadline = time.monotonic() + self.args.generation_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.args.poll_seconds)
+            response = await self.call(
+                "GET /api/podcast/jobs/{id}", "GET", f"/api/podcast/jobs/{job_id}",
+                params={"user_id": self.user_id},
+            )
+            if response is None:
+                continue
+            job = response.json()
+            if job["status"] in ("done", "failed"):
+                outcome = "ok" if job["status"] == "done" else "failed"
+                self.recorder.record(GENERATION, stage, time.perf_counter() - started, outcome)
+                return (job.get("result") or {}).get("podcast_id") if outcome == "ok" else None
+        self.recorder.record(GENERATION, stage, time.perf_counter() - started, "timeout")
+        return None
+
+    async def visit(self):
+        params = {"user_id": self.user_id}
+        await self.call("GET /api/gmail/status", "GET", "/api/gmail/status", params=params)
+        await self.think()
+        labels = await self.call("GET /api/gmail/labels", "GET", "/api/gmail/labels", params=params)
+        label = None
+        if labels is not None:
+            label = (labels.json().get("audiobrew_label") or {}).get("id")
+        emails = await self.call(
+            "GET /api/gmail/emails", "GET", "/api/gmail/emails",
+            params={**params, **({"label_id": label} if label else {})},
+        )
+        await self.list_podcasts()
+        await self.think()
+
+        email_ids = []
+        if emails is not None:
+            email_ids = [email["id"] for email in emails.json().get("emails", [])]
+        if not email_ids:
+            return
+        wanted = self.rng.randint(self.args.min_emails, self.args.max_emails)
+        chosen = self.rng.sample(email_ids, min(len(email_ids), wanted))
+        podcast_id = await self.generate(chosen)
+        await self.list_podcasts()
+        await self.think()
+        if podcast_id:
+            await self.call(
+                "DELETE /api/podcast/{id}", "DELETE", f"/api/podcast/{podcast_id}", params=params
+            )
+        await self.think()
+
+    async def run(self):
+        while True:
+            await self.visit()
+
+async def monitor_loop_lag(samples: List[float], interval: float = 0.05):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - started - interval) * 1000)
+
+async def drive(
+    base_url: str,
+    user_ids: List[str],
+    stages: List[Stage],
+    target: Callable[[float], int],
+    args,
+) -> Tuple[Recorder, List[float]]:
+    """Keep the number of running sessions at the profile's target until the last stage ends."""
+    recorder = Recorder(stages)
+    driver_lag: List[float] = []
+    lag_monitor = asyncio.create_task(monitor_loop_lag(driver_lag))
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=len(user_ids))
+    sessions: List[asyncio.Task] = []
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=args.request_timeout, limits=limits
+    ) as client:
+        try:
+            end = stages[-1][2]
+            while (elapsed := time.monotonic() - recorder.started) < end:
+                wanted = target(elapsed)
+                while len(sessions) < wanted:
+                    index = len(sessions)
+                    rng = random.Random(f"{args.seed}:{index}")
+                    session = Session(client, recorder, user_ids[index], rng, args)
+                    sessions.append(asyncio.create_task(session.run()))
+                while len(sessions) > wanted:
+                    sessions.pop().cancel()
+                recorder.active = len(sessions)
+                await asyncio.sleep(0.1)
+        finally:
+            for task in sessions:
+                task.cancel()
+            await asyncio.gather(*sessions, return_exceptions=True)
+            lag_monitor.cancel()
+    return recorder, driver_lag
+
+def is_error(outcome: str) -> bool:
+    """Whether a recorded outcome (a status code, "ok", or an error or failure name) failed."""
+    return not (outcome == "ok" or outcome.isdigit() and int(outcome) < 400)
+
+def latency_summary(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {
+        "p50": round(percentile(ordered, 0.50), 2),
+        "p95": round(percentile(ordered, 0.95), 2),
+        "p99": round(percentile(ordered, 0.99), 2),
+        "max": round(ordered[-1], 2),
+    }
+
+def summarize(samples: List[Tuple[str, str, float, str]], seconds: float) -> Dict[str, Any]:
+    """Per-endpoint request counts, error rates and latency percentiles."""
+    by_endpoint: Dict[str, List[Tuple[float, str]]] = defaultdict(list)
+    for endpoint, _, latency, outcome in samples:
+        by_endpoint[endpoint].append((latency, outcome))
+
+    summary = {}
+    for endpoint, results in sorted(by_endpoint.items()):
+        outcomes: Dict[str, int] = defaultdict(int)
+        for _, outcome in results:
+            outcomes[outcome] += 1
+        errors = sum(count for outcome, count in outcomes.items() if is_error(outcome))
+        summary[endpoint] = {
+            "requests": len(results),
+            "errors": errors,
+            "error_rate": round(errors / len(results), 4),
+            "per_second": round(len(results) / seconds, 3) if seconds else None,
+            "latency_ms": latency_summary([latency * 1000 for latency, _ in results]),
+            "outcomes": dict(outcomes),
+        }
+    return summary
+
+def read_server_loop_lag(
+    stats_dir: str, stages: List[Stage], started_wall: float
+) -> Dict[str, Any]:
+    """Event-loop lag of every server process, overall and per stage."""
+    processes = {}
+    by_stage: Dict[str, List[float]] = defaultdict(list)
+    every: List[float] = []
+    for path in sorted(Path(stats_dir).glob("loop-lag-*.json")):
+        samples = json.loads(path.read_text())
+        lags = [lag for _, lag in samples]
+        processes[path.stem.rsplit("-", 1)[1]] = latency_summary(lags)
+        every.extend(lags)
+        for at, lag in samples:
+            elapsed = at - started_wall
+            label = next((label for label, begin, end in stages if begin <= elapsed < end), None)
+            if label:
+                by_stage[label].append(lag)
+    return {
+        "all": latency_summary(every),
+        "processes": processes,
+        "stages": {label: latency_summary(lags) for label, lags in by_stage.items()},
+    }
+
+def start_server(port: int, workers: int, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "load_app:app",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+        env=env, stdout=log, stderr=subprocess.STDOUT, cwd=ROOT,
+    )
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            output = Path(log_path).read_text()[-2000:]
+            raise RuntimeError(f"The app did not start; see {log_path}:\n" + output)
+        time.sleep(0.2)
+
+def stop_server(server: subprocess.Popen):
+    # SIGTERM lets uvicorn run the app's shutdown, which stops the job workers
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+def run(workers: int, args: argparse.Namespace, config: Dict[str, Any]) -> Dict[str, Any]:
+    stages, target = build_profile(args)
+    max_sessions = max(target(begin) for _, begin, _ in stages)
+    max_sessions = max(max_sessions, max(target(end - 0.001) for _, _, end in stages))
+    user_ids = [str(uuid.UUID(int=index + 1)) for index in range(max_sessions)]
+
+    fakes = FakeServicesProcess(config)
+    workdir = tempfile.TemporaryDirectory(prefix="audiobrew-load-")
+    stats_dir = os.path.join(workdir.name, "stats")
+    os.makedirs(stats_dir)
+    try:
+        fakes.seed("gmail_connections", [gmail_connection(user_id) for user_id in user_ids])
+        seed_podcasts(fakes, user_ids, args.podcasts_per_user)
+        env = {
+            **os.environ,
+            **fakes.env(),
+            **app_env(workdir.name, args.keep_rate_limits),
+            "LOAD_TEST_FAKES_CONFIG": json.dumps(config),
+            "LOAD_TEST_STATS_DIR": stats_dir,
+            "PYTHONPATH": os.pathsep.join([str(ROOT), str(ROOT / "benchmarks")]),
+        }
+        port = free_port()
+        log_path = os.path.join(workdir.name, "server.log")
+        server = start_server(port, workers, env, log_path)
+        try:
+            print(
+                f"workers={workers}: {len(stages)} stage(s), up to {max_sessions} sessions, "
+                f"{stages[-1][2]:.0f}s"
+            )
+            recorder, driver_lag = asyncio.run(
+                drive(f"http://127.0.0.1:{port}", user_ids, stages, target, args)
+            )
+        finally:
+            stop_server(server)
+            if args.keep_logs:
+                kept = ROOT / "benchmarks" / "results" / f"load-server-w{workers}.log"
+                kept.parent.mkdir(parents=True, exist_ok=True)
+                kept.write_text(Path(log_path).read_text())
+        server_lag = read_server_loop_lag(stats_dir, stages, recorder.started_wall)
+        fake_stats = fakes.stats()
+    finally:
+        fakes.stop()
+        workdir.cleanup()
+
+    duration = stages[-1][2]
+    stage_results = {}
+    for label, begin, end in stages:
+        samples = [sample for sample in recorder.samples if sample[1] == label]
+        requests = [sample for sample in samples if sample[0] != GENERATION]
+        stage_results[label] = {
+            "seconds": end - begin,
+            "requests_per_second": round(len(requests) / (end - begin), 3) if end > begin else None,
+            "error_rate": round(
+                sum(1 for *_, outcome in requests if is_error(outcome)) / len(requests), 4
+            ) if requests else None,
+            "latency_ms": latency_summary([latency * 1000 for _, _, latency, _ in requests]),
+            "server_loop_lag_ms": server_lag["stages"].get(label),
+            "endpoints": summarize(samples, end - begin),
+        }
+
+    return {
+        "benchmark": "load_test",
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "workers": workers,
+        "profile": args.profile,
+        "stages": [{"label": label, "start": begin, "end": end} for label, begin, end in stages],
+        "options": {
+            key: value for key, value in vars(args).items()
+            if key not in config and key not in ("workers", "output")
+        },
+        "fakes": config,
+        "endpoints": summarize(recorder.samples, duration),
+        "by_stage": stage_results,
+        "server_loop_lag_ms": server_lag,
+        "driver_loop_lag_ms": latency_summary(driver_lag),
+        "services": fake_stats,
+    }
+
+def print_report(report: Dict[str, Any]):
+    print(
+        f"\nworkers={report['workers']}  {'endpoint':<32} {'requests':>8} {'errors':>7} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for endpoint, result in report["endpoints"].items():
+        latency = result["latency_ms"] or {}
+        print(
+            f"{'':<10} {endpoint:<32} {result['requests']:>8} {result['error_rate'] * 100:>6.1f}% "
+            f"{latency.get('p50', 0):>9.1f} {latency.get('p95', 0):>9.1f} "
+            f"{latency.get('p99', 0):>9.1f}"
+        )
+    print(
+        f"\n{'':<10} {'stage':<20} {'req/s':>8} {'errors':>7} {'p95 ms':>9} "
+        f"{'loop lag p99 ms':>16}"
+    )
+    for label, stage in report["by_stage"].items():
+        latency = stage["latency_ms"] or {}
+        lag = stage["server_loop_lag_ms"] or {}
+        print(
+            f"{'':<10} {label:<20} {stage['requests_per_second'] or 0:>8.2f} "
+            f"{(stage['error_rate'] or 0) * 100:>6.1f}% "
+            f"{latency.get('p95', 0):>9.1f} {lag.get('p99', 0):>16.1f}"
+        )
+    driver = report["driver_loop_lag_ms"] or {}
+    if driver.get("p99", 0) > 50:
+        print(
+            f"\nWarning: the driver's own event loop lagged (p99 {driver['p99']:.0f} ms); "
+            "latencies include that delay"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--workers", default="1",
+                        help="uvicorn worker counts to test one after another, e.g. 1,2,4")
+    parser.add_argument("--profile", choices=["constant", "ramp", "steps"], default="constant")
+    parser.add_argument("--sessions", type=int, default=20,
+                        help="Concurrent sessions (constant and ramp profiles)")
+    parser.add_argument("--duration", type=float, default=120,
+                        help="Seconds (constant and ramp profiles)")
+    parser.add_argument("--ramp-seconds", type=float, default=60)
+    parser.add_argument("--steps", default="5:60,10:60,20:60,40:60",
+                        help="sessions:seconds,... (steps profile)")
+    parser.add_argument("--think-seconds", type=float, default=2,
+                        help="Mean pause between a session's actions; 0 for none")
+    parser.add_argument("--poll-seconds", type=float, default=2,
+                        help="How often a session polls its generation job")
+    parser.add_argument("--min-emails", type=int, default=2)
+    parser.add_argument("--max-emails", type=int, default=5)
+    parser.add_argument("--podcasts-per-user", type=int, default=20)
+    parser.add_argument("--generation-timeout", type=float, default=300)
+    parser.add_argument("--request-timeout", type=float, default=60)
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Keep the app's OpenAI and Gmail rate limits (the fakes have none)")
+    parser.add_argument("--keep-logs", action="store_true",
+                        help="Copy the server output to benchmarks/results/")
+    parser.add_argument(
+        "--output", help="Result file (default benchmarks/results/load-<commit>-w<workers>.json)"
+    )
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    worker_counts = [int(count) for count in args.workers.split(",")]
+    reports = []
+    for workers in worker_counts:
+        report = run(workers, args, config)
+        print_report(report)
+        output_path = Path(args.output) if args.output and len(worker_counts) == 1 else (
+            ROOT / "benchmarks" / "results"
+            / f"load-{report['commit'] or 'unknown'}-w{workers}.json"
+        )
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Wrote {output_path}")
+        reports.append(report)
+
+    if len(reports) > 1:
+        print(
+            f"\n{'workers':>7} {'stage':<20} {'req/s':>8} {'errors':>7} {'p95 ms':>9} "
+            f"{'loop lag p99 ms':>16}"
+        )
+        for report in reports:
+            for label, stage in report["by_stage"].items():
+                latency = stage["latency_ms"] or {}
+                lag = stage["server_loop_lag_ms"] or {}
+                print(
+                    f"{report['workers']:>7} {label:<20} {stage['requests_per_second'] or 0:>8.2f} "
+                    f"{(stage['error_rate'] or 0) * 100:>6.1f}% {latency.get('p95', 0):>9.1f} "
+                    f"{lag.get('p99', 0):>16.1f}"
+                )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Benchmark: the podcast pipeline and account endpoints against local fakes.
+
+Runs get_emails, process_podcast_generation, list_podcasts and
+delete_user_account at a configurable scale, with Gmail, OpenAI and
+Supabase replaced by the deterministic stand-ins in benchmarks/fakes.py,
+and writes throughput, p50/p95/p99 latency and peak memory per scenario
+to a JSON file. No accounts or network access are needed.
+
+    python benchmarks/pipeline.py [--users 10] [--generations 20] [--concurrency 4]
+    python benchmarks/pipeline.py --compare benchmarks/results/old.json benchmarks/results/new.json
+
+Latencies and output sizes of the fakes are options too (see --help), e.g.
+--openai-latency-ms 0 --speech-bytes-per-char 100 to focus on local overhead.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Add the repository root to the Python path (this script's directory, with fakes.py, already is)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from fakes import (
+    FakeGmail,
+    FakeServicesProcess,
+    add_config_arguments,
+    app_env,
+    config_from_args,
+    gmail_connection,
+    install_gmail_fake,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ["get_emails", "process_podcast_generation", "list_podcasts", "delete_user_account"]
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Linear-interpolated percentile of an already sorted list."""
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+class RssSampler:
+    """Highest resident set size seen while running, sampled from /proc (else ru_maxrss)."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            # ru_maxrss is KiB on Linux and bytes on macOS
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if sys.platform == "darwin" else rss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+async def run_scenario(
+    name: str,
+    operations: List[Callable[[], Awaitable[Any]]],
+    concurrency: int,
+    trace_memory: bool,
+) -> Dict[str, Any]:
+    """Run operations with at most concurrency in flight and summarize their latencies."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def timed(operation):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await operation()
+            except Exception as e:
+                errors.append(f"{e.__class__.__name__}: {str(e)[:200]}")
+                return
+            latencies.append(time.perf_counter() - started)
+
+    if trace_memory:
+        tracemalloc.start()
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(timed(operation) for operation in operations))
+        elapsed = time.perf_counter() - started
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    ordered = sorted(latencies)
+    result = {
+        "operations": len(operations),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "seconds": round(elapsed, 3),
+        "throughput_per_sec": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "latency_ms": {
+            "mean": round(statistics.fmean(ordered) * 1000, 2),
+            "p50": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2),
+        } if ordered else None,
+        "peak_rss_mb": round(rss.peak / 1024 / 1024, 1),
+    }
+    if traced_peak is not None:
+        result["peak_traced_mb"] = round(traced_peak / 1024 / 1024, 1)
+    print(format_result(name, result), file=sys.__stdout__)
+    return result
+
+def format_result(name: str, result: Dict[str, Any]) -> str:
+    latency = result["latency_ms"] or {}
+    return (
+        f"{name:<30} {result['operations'] - result['errors']:>5}/{result['operations']:<5} ok "
+        f"{result['throughput_per_sec'] or 0:8.2f}/s  "
+        f"p50 {latency.get('p50', 0):9.1f} ms  p95 {latency.get('p95', 0):9.1f} ms  "
+        f"p99 {latency.get('p99', 0):9.1f} ms  "
+        f"rss {result['peak_rss_mb']:7.1f} MB"
+    )
+
+def seed_podcasts(fakes: FakeServicesProcess, user_ids: List[str], per_user: int):
+    """Podcast rows with audio objects in storage, as generated episodes would leave them."""
+    now = datetime.now(timezone.utc)
+    rows = []
+    for user_id in user_ids:
+        for index in range(per_user):
+            podcast_id = str(uuid.uuid4())
+            storage_path = f"podcasts/{user_id}/{podcast_id}.mp3"
+            rows.append({
+                "id": podcast_id,
+                "user_id": user_id,
+                "title": f"AudioBrew Podcast #{index}",
+                "audio_url": f"{fakes.url}/storage/v1/object/public/podcasts/{storage_path}",
+                "script_markdown": "Welcome to AudioBrew. " * 400,
+                "duration": 600,
+                "source_emails": 5,
+                "created_at": (now - timedelta(hours=index)).isoformat(),
+            })
+    fakes.seed("podcasts", rows)
+
+async def run_benchmarks(
+    args: argparse.Namespace, fakes: FakeServicesProcess, config: Dict[str, Any]
+) -> Dict[str, Any]:
+    # Imported only now: the app reads its configuration from the environment at import time
+    from fastapi import Request
+
+    from api.routers import gmail, podcast, user
+    from api.services import jobs, supabase_client
+    from api.services.email_content import shutdown_pool
+
+    gmail_fake = install_gmail_fake(FakeGmail(config))
+    user_ids = [str(uuid.UUID(int=index + 1)) for index in range(args.users)]
+    fakes.seed("gmail_connections", [gmail_connection(user_id) for user_id in user_ids])
+    seed_podcasts(fakes, user_ids, args.podcasts_per_user)
+
+    def get_request() -> Request:
+        return Request(
+            {"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""}
+        )
+
+    await supabase_client.open_client()
+    results: Dict[str, Any] = {}
+    try:
+        if "get_emails" in args.scenarios:
+            # The first call per user scans the labels and runs a full sync; later ones sync
+            # incrementally
+            results["get_emails_full_sync"] = await run_scenario(
+                "get_emails (full sync)",
+                [lambda user_id=user_id: gmail.get_emails(user_id) for user_id in user_ids],
+                args.concurrency, args.trace_memory,
+            )
+
+            async def incremental(user_id: str):
+                gmail_fake.mailbox(FakeGmail.token_for(user_id)).deliver(args.new_mail_per_call)
+                await gmail.get_emails(user_id)
+
+            results["get_emails"] = await run_scenario(
+                "get_emails (incremental)",
+                [
+                    lambda user_id=user_id: incremental(user_id)
+                    for user_id in user_ids
+                    for _ in range(args.iterations)
+                ],
+                args.concurrency, args.trace_memory,
+            )
+
+        if "process_podcast_generation" in args.scenarios:
+            def generate(index: int):
+                user_id = user_ids[index % len(user_ids)]
+                mailbox = gmail_fake.mailbox(FakeGmail.token_for(user_id))
+                return podcast.process_podcast_generation(
+                    user_id,
+                    mailbox.message_ids(args.emails_per_podcast),
+                    title=f"Benchmark #{index}",
+                    force_regenerate=not args.cached_scripts,
+                )
+
+            results["process_podcast_generation"] = await run_scenario(
+                "process_podcast_generation",
+                [lambda index=index: generate(index) for index in range(args.generations)],
+                args.concurrency, args.trace_memory,
+            )
+
+        if "list_podcasts" in args.scenarios:
+            async def list_all(user_id: str):
+                # Walk every page, the way the dashboard scrolls through a long history
+                before = None
+                while True:
+                    response = await podcast.list_podcasts(
+                        get_request(), user_id, limit=args.page_size, before=before
+                    )
+                    before = json.loads(response.body)["next_before"]
+                    if not before:
+                        break
+
+            results["list_podcasts"] = await run_scenario(
+                "list_podcasts (all pages)",
+                [
+                    lambda user_id=user_id: list_all(user_id)
+                    for user_id in user_ids
+                    for _ in range(args.iterations)
+                ],
+                args.concurrency, args.trace_memory,
+            )
+
+        if "delete_user_account" in args.scenarios:
+            async def delete_account(user_id: str):
+                # Queue the deletion, then run the job the way a worker would
+                queued = await user.delete_user_account(user_id)
+                job = await jobs.get_job(queued["id"])
+                result = await user.run_account_deletion_job(job)
+                await jobs.update_job(job["id"], jobs.DONE, result=result)
+
+            results["delete_user_account"] = await run_scenario(
+                "delete_user_account",
+                [lambda user_id=user_id: delete_account(user_id) for user_id in user_ids],
+                args.concurrency, args.trace_memory,
+            )
+    finally:
+        await supabase_client.close_client()
+        shutdown_pool()
+
+    results["_gmail_requests"] = dict(gmail_fake.requests)
+    return results
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_path: str, new_path: str):
+    """Print how each scenario's throughput and latency changed between two result files."""
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+
+    def change(before, after) -> str:
+        if not before or after is None:
+            return "      n/a"
+        return f"{(after - before) / before * 100:+8.1f}%"
+
+    for name, result in new["scenarios"].items():
+        previous = old["scenarios"].get(name)
+        if not previous or not result.get("latency_ms") or not previous.get("latency_ms"):
+            continue
+        throughput = change(previous["throughput_per_sec"], result["throughput_per_sec"])
+        print(
+            f"{name:<28} throughput {throughput}  "
+            + "  ".join(
+                f"{key} {change(previous['latency_ms'][key], result['latency_ms'][key])}"
+                for key in ("p50", "p95", "p99")
+            )
+            + f"  rss {change(previous['peak_rss_mb'], result['peak_rss_mb'])}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="Compare two result files and exit")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="Comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=5,
+                        help="get_emails and list_podcasts calls per user")
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--emails-per-podcast", type=int, default=5)
+    parser.add_argument("--podcasts-per-user", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--new-mail-per-call", type=int, default=2)
+    parser.add_argument("--cached-scripts", action="store_true",
+                        help="Let generations reuse cached scripts")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Keep the app's OpenAI and Gmail rate limits (the fakes have none)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also report the peak of Python allocations (slows everything down)")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own output")
+    parser.add_argument("--output",
+                        help="Result file (default benchmarks/results/pipeline-<commit>.json)")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    config = config_from_args(args)
+    fakes = FakeServicesProcess(config)
+    workdir = tempfile.TemporaryDirectory(prefix="audiobrew-bench-")
+    try:
+        os.environ.update(fakes.env())
+        os.environ.update(app_env(workdir.name, args.keep_rate_limits))
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+            started = time.perf_counter()
+            scenarios = asyncio.run(run_benchmarks(args, fakes, config))
+            elapsed = time.perf_counter() - started
+        gmail_requests = scenarios.pop("_gmail_requests")
+        fake_stats = fakes.stats()
+    finally:
+        fakes.stop()
+        workdir.cleanup()
+
+    commit = git_commit()
+    report = {
+        "benchmark": "pipeline",
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seconds": round(elapsed, 3),
+        "options": {
+            key: value for key, value in vars(args).items()
+            if key not in ("compare", "output", "verbose") and key not in config
+        },
+        "fakes": config,
+        "scenarios": scenarios,
+        "requests": {"gmail": gmail_requests, "services": fake_stats},
+    }
+
+    output_path = Path(args.output) if args.output else (
+        ROOT / "benchmarks" / "results" / f"pipeline-{commit or 'unknown'}.json"
+    )
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"\nWrote {output_path}")
+
+if __name__ == "__main__":
+    main()
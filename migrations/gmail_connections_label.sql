@@ -0,0 +1,7 @@
+-- ────────────────────────────────────────────────────────────
+-- Remember the id of each user's "AudioBrew" Gmail label so the
+-- API can skip scanning all labels on every request.
+-- NULL until the label has been found once.
+-- ────────────────────────────────────────────────────────────
+ALTER TABLE public.gmail_connections
+    ADD COLUMN IF NOT EXISTS audiobrew_label_id TEXT;
@@ -0,0 +1,8 @@
+-- ────────────────────────────────────────────────────────────
+-- Performance profile of each generated podcast: wall time per
+-- stage, tokens, TTS characters, uploaded bytes, retries and
+-- cache hits. Written by the generation job; NULL for podcasts
+-- generated before it was recorded.
+-- ────────────────────────────────────────────────────────────
+ALTER TABLE public.podcasts
+    ADD COLUMN IF NOT EXISTS profile JSONB;
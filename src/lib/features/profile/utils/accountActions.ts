@@ -4,12 +4,38 @@
 
 import { API_CONFIG } from '$lib/config';
 
+export interface AccountDeletionProgress {
+	step: string;
+	files_total: number;
+	files_deleted: number;
+	files_failed: number;
+}
+
+interface DeletionJob {
+	id: string;
+	status: string;
+	result: AccountDeletionProgress | null;
+	error: string | null;
+}
+
+const DELETION_POLL_INTERVAL_MS = 1500;
+
+async function readError(response: Response): Promise<string> {
+	const errorData = await response.json().catch(() => ({ detail: 'Unknown error' }));
+	return errorData.detail;
+}
+
 /**
  * Delete user account and all associated data
+ * Deletion runs as a background job; this waits for it to finish.
  * @param userId - The user's ID  
+ * @param onProgress - Called with the job's progress while it runs
  * @returns Promise<boolean> - True if deletion was successful
  */
-export async function deleteAccount(userId: string): Promise<boolean> {
+export async function deleteAccount(
+	userId: string,
+	onProgress?: (progress: AccountDeletionProgress) => void
+): Promise<boolean> {
 	try {
 		const response = await fetch(API_CONFIG.url(`api/user/${userId}`), {
 			method: 'DELETE',
@@ -19,13 +45,34 @@ export async function deleteAccount(userId: string): Promise<boolean> {
 		});
 
 		if (!response.ok) {
-			const errorData = await response.json().catch(() => ({ detail: 'Unknown error' }));
-			throw new Error(`Failed to delete account: ${errorData.detail}`);
+			throw new Error(`Failed to delete account: ${await readError(response)}`);
 		}
 
-		return true;
+		const { id: jobId } = await response.json();
+
+		// Follow the deletion job until it finishes
+		while (true) {
+			await new Promise((resolve) => setTimeout(resolve, DELETION_POLL_INTERVAL_MS));
+
+			const jobResponse = await fetch(API_CONFIG.url(`api/user/${userId}/deletion/${jobId}`));
+			if (!jobResponse.ok) {
+				throw new Error(`Failed to check account deletion: ${await readError(jobResponse)}`);
+			}
+
+			const job: DeletionJob = await jobResponse.json();
+			if (job.result && onProgress) {
+				onProgress(job.result);
+			}
+			if (job.status === 'done') {
+				return true;
+			}
+			if (job.status === 'failed') {
+				// Deleting again picks up whatever is left
+				throw new Error(`Failed to delete account: ${job.error || 'Unknown error'}. Please try again.`);
+			}
+		}
 	} catch (error) {
 		console.error('Error deleting account:', error);
 		throw error;
 	}
-} 
\ No newline at end of file
+}
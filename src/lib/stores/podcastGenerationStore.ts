@@ -10,12 +10,14 @@ interface PodcastGenerationState {
   isGenerating: boolean;
   startTime: number | null;
   initialPodcastCount: number;
+  jobId: string | null;
 }
 
 const defaultState: PodcastGenerationState = {
   isGenerating: false,
   startTime: null,
-  initialPodcastCount: 0
+  initialPodcastCount: 0,
+  jobId: null
 };
 
 // Create the store
@@ -27,10 +29,15 @@ export const podcastGeneration = {
     podcastGenerationStore.set({
       isGenerating: true,
       startTime: Date.now(),
-      initialPodcastCount: initialCount
+      initialPodcastCount: initialCount,
+      jobId: null
     });
   },
   
+  setJob: (jobId: string) => {
+    podcastGenerationStore.update(state => ({ ...state, jobId }));
+  },
+  
   stop: () => {
     podcastGenerationStore.set(defaultState);
   },